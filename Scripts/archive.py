@@ -0,0 +1,469 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import stat
+import time
+import queue
+import hashlib
+import zlib
+import struct
+import zipfile
+import contextlib
+import collections
+import concurrent.futures
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+### - CONSTANTS
+
+CHUNK_SIZE = 1024 * 1024
+QUEUE_SIZE = 16
+# Same level as `zip`, fixed so that archives are byte for byte stable.
+COMPRESS_LEVEL = 6
+# 1980-01-01 00:00:00 UTC, the earliest timestamp a zip entry can hold.
+ZIP_EPOCH = 315532800
+# Uncompressed size of the blocks that are deflated in parallel.
+BLOCK_SIZE = 1024 * 1024
+DICTIONARY_SIZE = 32 * 1024
+ZIP64_LIMIT = 0xffffffff
+DEFAULT_VERSION = 20
+ZIP64_VERSION = 45
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+CENTRAL_HEADER_SIGNATURE = 0x02014b50
+ZIP64_END_SIGNATURE = 0x06064b50
+ZIP64_LOCATOR_SIGNATURE = 0x07064b50
+END_SIGNATURE = 0x06054b50
+
+### - CLASSES
+
+class _QueueWriter:
+    """File object that hands written data over to the consuming thread."""
+
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event):
+        self.chunks = chunks
+        self.cancelled = cancelled
+
+    def write(self, data) -> int:
+        if not self.put(bytes(data)):
+            raise InterruptedError('The archive stream was closed.')
+        return len(data)
+
+    def put(self, item) -> bool:
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def flush(self):
+        pass
+
+class _HashingWriter:
+    """File object that counts and hashes the archive, optionally saving it."""
+
+    def __init__(self, spill=None):
+        self.spill = spill
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        if self.spill is not None:
+            self.spill.write(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+class ZipStream:
+    """Zip archive of `paths` under `root`, uploaded as a stream of chunks.
+
+    Uploads need their Content-Length up front, so `prepare` writes the
+    archive once to count and hash it, to `spill_path` when given and
+    otherwise to nowhere. Iterating the stream then yields the archive,
+    read back from `spill_path` or written again on a background thread.
+    Without `spill_path` every iteration (e.g. an upload retry) compresses
+    the whole tree again, which only pays off when disk space is short.
+    Archives are reproducible (sorted entries, fixed timestamps and
+    normalized permissions), so the second pass produces the same bytes,
+    which is verified against the checksum of the first one.
+    """
+
+    def __init__(
+        self, 
+        root: str, 
+        paths: List[str], 
+        spill_path: Optional[str] = None,
+        reproducible: bool = True,
+        compress_level: int = COMPRESS_LEVEL,
+        threads: Optional[int] = None
+    ):
+        self.root = root
+        self.paths = paths
+        self.spill_path = spill_path
+        self.reproducible = reproducible
+        self.compress_level = compress_level
+        self.threads = threads
+        self.size = 0
+        self._checksum = None
+
+    @property
+    def complete(self) -> bool:
+        return self._checksum is not None
+
+    @property
+    def checksum(self) -> str:
+        if self._checksum is None:
+            raise RuntimeError('The archive has not been prepared yet.')
+        return self._checksum
+
+    def prepare(self) -> 'ZipStream':
+        with contextlib.ExitStack() as stack:
+            spill = None
+            if self.spill_path is not None:
+                spill = stack.enter_context(open(self.spill_path, 'wb'))
+            writer = _HashingWriter(spill)
+            self._write(writer)
+        (self.size, self._checksum) = (writer.size, writer.sha256.hexdigest())
+        return self
+
+    def __len__(self) -> int:
+        if not self.complete:
+            raise RuntimeError('The archive has not been prepared yet.')
+        return self.size
+
+    def __iter__(self) -> Iterator[bytes]:
+        # Every iteration yields the whole archive, e.g. on retries.
+        checksum = self.checksum
+        if self.spill_path is not None:
+            with open(self.spill_path, 'rb') as f:
+                yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+            return
+
+        chunks = queue.Queue(QUEUE_SIZE)
+        cancelled = threading.Event()
+        errors = []
+        writer = _QueueWriter(chunks, cancelled)
+
+        def produce():
+            try:
+                self._write(writer)
+            except BaseException as error:
+                errors.append(error)
+            finally:
+                writer.put(None)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        verifier = _HashingWriter()
+        try:
+            buffer = bytearray()
+            while True:
+                data = chunks.get()
+                if data is None:
+                    break
+                buffer += data
+                if len(buffer) >= CHUNK_SIZE:
+                    verifier.write(buffer)
+                    yield bytes(buffer)
+                    buffer.clear()
+            thread.join()
+            if errors:
+                raise errors[0]
+            verifier.write(buffer)
+            if verifier.size != self.size or verifier.sha256.hexdigest() != checksum:
+                raise RuntimeError(
+                    f"The archive of {', '.join(self.paths)} changed since it was prepared."
+                )
+            if buffer:
+                yield bytes(buffer)
+        finally:
+            # Unblocks the writer when the consumer stops early.
+            cancelled.set()
+
+    def _write(self, fileobj):
+        write_zip(
+            self.root,
+            self.paths,
+            fileobj,
+            self.reproducible,
+            self.compress_level,
+            self.threads
+        )
+
+class _ZipWriter:
+    """Minimal streaming zip (and zip64) writer using data descriptors."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.offset = 0
+        self.entries = []
+
+    def write_stored(self, info: zipfile.ZipInfo, data: bytes):
+        info.compress_type = zipfile.ZIP_STORED
+        info.CRC = zlib.crc32(data)
+        info.file_size = info.compress_size = len(data)
+        info.header_offset = self.offset
+        self._write(self._local_header(info, zip64=False, descriptor=False))
+        self._write(data)
+        self.entries.append((info, False, False))
+
+    def write_deflated(
+        self, 
+        info: zipfile.ZipInfo, 
+        size: int, 
+        blocks: Iterator[Tuple[bytes, bytes]]
+    ):
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.header_offset = self.offset
+        # Decided before the sizes are known and used by both headers and
+        # the data descriptor. Leaves headroom for incompressible data
+        # growing during deflate.
+        zip64 = size + size // 100 + BLOCK_SIZE >= ZIP64_LIMIT
+        self._write(self._local_header(info, zip64, descriptor=True))
+        (crc, file_size, compress_size) = (0, 0, 0)
+        for (raw, compressed) in blocks:
+            crc = zlib.crc32(raw, crc)
+            file_size += len(raw)
+            compress_size += len(compressed)
+            self._write(compressed)
+        (info.CRC, info.file_size, info.compress_size) = (crc, file_size, compress_size)
+        if not zip64 and max(file_size, compress_size) >= ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(f"{info.filename} grew past the zip64 limit while archiving.")
+        size_format = 'Q' if zip64 else 'I'
+        self._write(struct.pack(
+            f"<II{size_format}{size_format}", 
+            DATA_DESCRIPTOR_SIGNATURE, crc, compress_size, file_size
+        ))
+        self.entries.append((info, True, zip64))
+
+    def close(self):
+        central_directory_offset = self.offset
+        for (info, descriptor, zip64) in self.entries:
+            self._write(self._central_header(info, descriptor, zip64))
+        central_directory_size = self.offset - central_directory_offset
+        count = len(self.entries)
+
+        if (count >= 0xffff 
+            or central_directory_offset >= ZIP64_LIMIT 
+            or central_directory_size >= ZIP64_LIMIT):
+            zip64_end_offset = self.offset
+            self._write(struct.pack(
+                '<IQHHIIQQQQ',
+                ZIP64_END_SIGNATURE, 44, ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+                count, count, central_directory_size, central_directory_offset
+            ))
+            self._write(struct.pack(
+                '<IIQI', ZIP64_LOCATOR_SIGNATURE, 0, zip64_end_offset, 1
+            ))
+            count = min(count, 0xffff)
+            central_directory_size = min(central_directory_size, 0xffffffff)
+            central_directory_offset = min(central_directory_offset, 0xffffffff)
+
+        self._write(struct.pack(
+            '<IHHHHIIH',
+            END_SIGNATURE, 0, 0, count, count,
+            central_directory_size, central_directory_offset, 0
+        ))
+
+    def _local_header(self, info: zipfile.ZipInfo, zip64: bool, descriptor: bool) -> bytes:
+        name = info.filename.encode('utf-8')
+        extra = b''
+        (crc, compress_size, file_size) = (0, 0, 0)
+        if not descriptor:
+            (crc, compress_size, file_size) = (info.CRC, info.compress_size, info.file_size)
+        if zip64:
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            (compress_size, file_size) = (0xffffffff, 0xffffffff)
+        return struct.pack(
+            '<IHHHHHIIIHH',
+            LOCAL_HEADER_SIGNATURE,
+            ZIP64_VERSION if zip64 else DEFAULT_VERSION,
+            self._flags(info, descriptor),
+            info.compress_type,
+            *_dos_date_time(info.date_time),
+            crc, compress_size, file_size,
+            len(name), len(extra)
+        ) + name + extra
+
+    def _central_header(self, info: zipfile.ZipInfo, descriptor: bool, zip64: bool) -> bytes:
+        name = info.filename.encode('utf-8')
+        zip64_fields = []
+        (compress_size, file_size, offset) = (
+            info.compress_size, info.file_size, info.header_offset
+        )
+        # Same choice as the local header, even if the sizes turned out smaller.
+        if zip64:
+            zip64_fields += [file_size, compress_size]
+            (compress_size, file_size) = (0xffffffff, 0xffffffff)
+        if offset >= ZIP64_LIMIT:
+            zip64_fields.append(offset)
+            offset = 0xffffffff
+        extra = b''
+        if zip64_fields:
+            extra = struct.pack(
+                f"<HH{len(zip64_fields)}Q", 1, 8 * len(zip64_fields), *zip64_fields
+            )
+        version = ZIP64_VERSION if zip64_fields else DEFAULT_VERSION
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII',
+            CENTRAL_HEADER_SIGNATURE,
+            (info.create_system << 8) | version,
+            version,
+            self._flags(info, descriptor),
+            info.compress_type,
+            *_dos_date_time(info.date_time),
+            info.CRC, compress_size, file_size,
+            len(name), len(extra), 0, 0, 0,
+            info.external_attr, offset
+        ) + name + extra
+
+    def _flags(self, info: zipfile.ZipInfo, descriptor: bool) -> int:
+        flags = 0x08 if descriptor else 0
+        if not info.filename.isascii():
+            flags |= 0x800
+        return flags
+
+    def _write(self, data: bytes):
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+### - FUNCTIONS
+
+def archive_members(root: str, paths: List[str]) -> List[str]:
+    # Same members as `zip -r`: directories, files and (not followed) symlinks,
+    # sorted so that the archive does not depend on the file system order.
+    members = []
+    for path in paths:
+        path = path.rstrip('/')
+        members.append(path)
+        full_path = os.path.join(root, path)
+        if os.path.islink(full_path) or not os.path.isdir(full_path):
+            continue
+        for (dir_path, dir_names, file_names) in os.walk(full_path):
+            relative_dir = os.path.relpath(dir_path, root)
+            for name in dir_names + file_names:
+                members.append(os.path.join(relative_dir, name))
+    return sorted(members)
+
+def zip_info(root: str, member: str, reproducible: bool = True) -> zipfile.ZipInfo:
+    full_path = os.path.join(root, member)
+    st = os.lstat(full_path)
+    is_dir = stat.S_ISDIR(st.st_mode)
+    if reproducible:
+        date_time = _source_date_time()
+        if stat.S_ISLNK(st.st_mode):
+            mode = stat.S_IFLNK | 0o777
+        elif is_dir:
+            mode = stat.S_IFDIR | 0o755
+        elif st.st_mode & 0o111:
+            mode = stat.S_IFREG | 0o755
+        else:
+            mode = stat.S_IFREG | 0o644
+    else:
+        date_time = time.localtime(st.st_mtime)[:6]
+        mode = st.st_mode
+
+    info = zipfile.ZipInfo(member + ('/' if is_dir else ''), date_time)
+    info.create_system = 3
+    info.external_attr = (mode & 0xffff) << 16
+    if is_dir:
+        info.external_attr |= 0x10
+    return info
+
+def write_zip(
+    root: str, 
+    paths: List[str], 
+    fileobj, 
+    reproducible: bool = True,
+    compress_level: int = COMPRESS_LEVEL,
+    threads: Optional[int] = None
+):
+    """Writes a zip archive of `paths` to the (unseekable) `fileobj`.
+
+    File contents are split into blocks that are deflated concurrently,
+    each block primed with the last 32 KB of the previous one (like pigz),
+    and concatenated into a single deflate stream per entry. The output
+    only depends on the inputs and `compress_level`, not on `threads`.
+    """
+    threads = threads or os.cpu_count() or 1
+    writer = _ZipWriter(fileobj)
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        for member in archive_members(root, paths):
+            full_path = os.path.join(root, member)
+            info = zip_info(root, member, reproducible)
+            if os.path.islink(full_path):
+                # Stored like `zip --symlinks`: the link target as content.
+                writer.write_stored(info, os.fsencode(os.readlink(full_path)))
+            elif info.is_dir():
+                writer.write_stored(info, b'')
+            else:
+                blocks = _compress_blocks(executor, full_path, compress_level, threads * 4)
+                writer.write_deflated(info, os.path.getsize(full_path), blocks)
+    writer.close()
+
+def _compress_blocks(
+    executor: concurrent.futures.Executor, 
+    path: str, 
+    compress_level: int, 
+    max_pending: int
+) -> Iterator[Tuple[bytes, bytes]]:
+    # Yields (raw, compressed) blocks in order, keeping at most
+    # `max_pending` blocks in flight.
+    pending = collections.deque()
+    with open(path, 'rb') as f:
+        previous = b''
+        data = f.read(BLOCK_SIZE)
+        while True:
+            following = f.read(BLOCK_SIZE) if data else b''
+            is_last = not following
+            pending.append((data, executor.submit(
+                _deflate_block, data, previous[-DICTIONARY_SIZE:], compress_level, is_last
+            )))
+            if len(pending) >= max_pending:
+                (raw, future) = pending.popleft()
+                yield (raw, future.result())
+            if is_last:
+                break
+            (previous, data) = (data, following)
+    while pending:
+        (raw, future) = pending.popleft()
+        yield (raw, future.result())
+
+def _deflate_block(data: bytes, dictionary: bytes, compress_level: int, is_last: bool) -> bytes:
+    if dictionary:
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+    # Sync flushes end a block on a byte boundary without marking it final,
+    # so the blocks can be concatenated.
+    flush_mode = zlib.Z_FINISH if is_last else zlib.Z_SYNC_FLUSH
+    return compressor.compress(data) + compressor.flush(flush_mode)
+
+def _dos_date_time(date_time: tuple) -> Tuple[int, int]:
+    (year, month, day, hour, minute, second) = date_time
+    return (
+        (hour << 11) | (minute << 5) | (second // 2),
+        ((year - 1980) << 9) | (month << 5) | day
+    )
+
+def _source_date_time() -> tuple:
+    # Honours SOURCE_DATE_EPOCH, zip timestamps can not predate 1980.
+    epoch = int(os.environ.get('SOURCE_DATE_EPOCH', ZIP_EPOCH))
+    return time.gmtime(max(epoch, ZIP_EPOCH))[:6]
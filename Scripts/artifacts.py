@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import plistlib
+import threading
+import contextlib
+from typing import Dict, List, Optional
+import macho
+import plist_editor
+from plist_editor import INFO_PLIST_NAME
+from xcframework import DSYMS_DIR_NAME
+
+### - CONSTANTS
+
+CWD_PATH = os.path.dirname(os.path.realpath(__file__))
+SIZE_HISTORY_PATH = os.path.join(CWD_PATH, '.cache', 'size_history.jsonl')
+VERSION_KEYS = ['CFBundleVersion', 'CFBundleShortVersionString']
+COMMIT_KEY = 'WebRTCCommit'
+# Growth of a binary slice compared to the previous release that is reported as a warning.
+SIZE_REGRESSION_THRESHOLD = 0.02
+MEGABYTE = 1024 ** 2
+
+### - CLASSES
+
+class ValidationError(Exception):
+    pass
+
+### - FUNCTIONS
+
+# Sizes are recorded from the package stage of the release pipeline.
+_history_lock = threading.Lock()
+
+def validate_xcframework(
+    xcframework_path: str,
+    expected: Dict[str, List[str]],
+    version_number: str,
+    dsyms: bool
+):
+    """Checks an assembled xcframework before it is archived and uploaded.
+
+    `expected` maps every library identifier (e.g. `ios-arm64_x86_64-simulator`)
+    to its Mach-O architectures. Checks that every library has exactly
+    these slices, that its Info.plist is stamped with `version_number`
+    and, with `dsyms`, that every slice has a dSYM with the same LC_UUID.
+    Raises a ValidationError listing all problems.
+    """
+    info = _load_plist(os.path.join(xcframework_path, INFO_PLIST_NAME))
+    if info is None:
+        raise ValidationError(f"{xcframework_path}: missing or unreadable {INFO_PLIST_NAME}")
+    libraries = {
+        library['LibraryIdentifier']: library
+        for library in info.get('AvailableLibraries', [])
+    }
+
+    problems = []
+    for identifier in sorted(set(expected) - set(libraries)):
+        problems.append(f"{identifier}: missing library")
+    for identifier in sorted(set(libraries) - set(expected)):
+        problems.append(f"{identifier}: unexpected library")
+    for identifier in sorted(set(expected) & set(libraries)):
+        library = libraries[identifier]
+        library_path = os.path.join(xcframework_path, identifier)
+        architectures = sorted(expected[identifier])
+        if sorted(library.get('SupportedArchitectures', [])) != architectures:
+            problems.append(
+                f"{identifier}: Info.plist lists {library.get('SupportedArchitectures')}"
+            )
+
+        binary_path = os.path.join(library_path, library['BinaryPath'])
+        uuids = _check_binary(
+            binary_path, macho.MH_DYLIB, architectures, identifier, problems
+        )
+
+        framework_path = os.path.join(library_path, library['LibraryPath'])
+        framework_info = _load_plist(plist_editor.framework_info_plist_path(framework_path))
+        if framework_info is None:
+            problems.append(f"{identifier}: missing framework {INFO_PLIST_NAME}")
+        else:
+            for key in VERSION_KEYS:
+                if framework_info.get(key) != version_number:
+                    problems.append(
+                        f"{identifier}: {key} is {framework_info.get(key)!r}, expected {version_number!r}"
+                    )
+            if not framework_info.get(COMMIT_KEY):
+                problems.append(f"{identifier}: {COMMIT_KEY} is not set")
+
+        dsym_binaries = _dsym_binaries(library_path)
+        if not dsyms:
+            if 'DebugSymbolsPath' in library or dsym_binaries:
+                problems.append(f"{identifier}: unexpected dSYM")
+            continue
+        if 'DebugSymbolsPath' not in library or len(dsym_binaries) != 1:
+            problems.append(f"{identifier}: expected one dSYM, found {len(dsym_binaries)}")
+            continue
+        dsym_uuids = _check_binary(
+            dsym_binaries[0], macho.MH_DSYM, architectures, identifier, problems
+        )
+        _compare_uuids(identifier, uuids, dsym_uuids, problems)
+
+    _raise_problems(xcframework_path, problems)
+    logging.info(f"Validated {xcframework_path} ({', '.join(sorted(expected))}).")
+
+def validate_dsyms(
+    dsyms_path: str,
+    binaries: Dict[str, str],
+    expected: Dict[str, List[str]]
+):
+    """Checks a standalone dSYMs bundle against the binaries it belongs to.
+
+    The bundle has a `<identifier>/<name>.dSYM` dir per xcframework library,
+    `binaries` maps the identifiers to the shipped framework binaries.
+    """
+    problems = []
+    found = set(os.listdir(dsyms_path)) if os.path.isdir(dsyms_path) else set()
+    for identifier in sorted(found - set(expected)):
+        problems.append(f"{identifier}: unexpected dSYM")
+    for (identifier, binary_path) in sorted(binaries.items()):
+        architectures = sorted(expected[identifier])
+        dsym_binaries = _dwarf_binaries(os.path.join(dsyms_path, identifier))
+        if len(dsym_binaries) != 1:
+            problems.append(f"{identifier}: expected one dSYM, found {len(dsym_binaries)}")
+            continue
+        uuids = _check_binary(binary_path, macho.MH_DYLIB, architectures, identifier, problems)
+        dsym_uuids = _check_binary(
+            dsym_binaries[0], macho.MH_DSYM, architectures, identifier, problems
+        )
+        _compare_uuids(identifier, uuids, dsym_uuids, problems)
+
+    _raise_problems(dsyms_path, problems)
+    logging.info(f"Validated {dsyms_path} ({', '.join(sorted(expected))}).")
+
+def size_report(xcframework_path: str) -> Dict[str, dict]:
+    """Returns slice and segment sizes (bytes) of every library of an xcframework.
+
+    `{identifier: {architecture: {'size', 'segments': {name: size}, 'dsym'}}}`
+    """
+    info = _load_plist(os.path.join(xcframework_path, INFO_PLIST_NAME)) or {}
+    report = {}
+    for library in info.get('AvailableLibraries', []):
+        library_path = os.path.join(xcframework_path, library['LibraryIdentifier'])
+        binary_path = os.path.join(library_path, library['BinaryPath'])
+        slices = {}
+        with macho.map_file(binary_path) as buffer:
+            for thin in macho.read_slices(buffer, binary_path):
+                slices[thin.architecture] = {
+                    'size': thin.size,
+                    'segments': macho.read_segments(buffer, thin, binary_path)
+                }
+        for dsym_path in _dsym_binaries(library_path):
+            with macho.map_file(dsym_path) as buffer:
+                for thin in macho.read_slices(buffer, dsym_path):
+                    if thin.architecture in slices:
+                        slices[thin.architecture]['dsym'] = thin.size
+        report[library['LibraryIdentifier']] = slices
+    return report
+
+def record_sizes(
+    bundle_name: str,
+    version_number: str,
+    report: Dict[str, dict],
+    history_path: Optional[str] = None
+):
+    """Appends `report` to the size history and logs the changes since the previous release."""
+    history_path = history_path or SIZE_HISTORY_PATH
+    with _history_lock:
+        previous = next(
+            (
+                entry for entry in reversed(read_size_history(history_path))
+                if entry['bundle'] == bundle_name and entry['version'] != version_number
+            ),
+            None
+        )
+        _append_history(history_path, {
+            'bundle': bundle_name,
+            'version': version_number,
+            'recorded': time.time(),
+            'sizes': report
+        })
+    for (identifier, slices) in sorted(report.items()):
+        for (architecture, sizes) in sorted(slices.items()):
+            name = f"{bundle_name} {identifier} {architecture}"
+            old = None
+            if previous is not None:
+                old = previous['sizes'].get(identifier, {}).get(architecture, {}).get('size')
+            if not old:
+                logging.info(f"{name}: {sizes['size'] / MEGABYTE:.1f} MB")
+                continue
+            change = (sizes['size'] - old) / old
+            message = (
+                f"{name}: {sizes['size'] / MEGABYTE:.1f} MB ({change:+.1%} since {previous['version']})"
+            )
+            if change > SIZE_REGRESSION_THRESHOLD:
+                logging.warning(message)
+            else:
+                logging.info(message)
+
+def read_size_history(history_path: str = SIZE_HISTORY_PATH) -> List[dict]:
+    entries = []
+    try:
+        with open(history_path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logging.warning(f"Ignoring malformed line in {history_path}")
+    except FileNotFoundError:
+        pass
+    return entries
+
+def _append_history(history_path: str, entry: dict):
+    os.makedirs(os.path.dirname(history_path), exist_ok=True)
+    with open(history_path, 'a') as f:
+        f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+def _check_binary(
+    path: str,
+    filetype: int,
+    architectures: List[str],
+    identifier: str,
+    problems: List[str]
+) -> Dict[str, str]:
+    # Returns the LC_UUID of every slice by architecture.
+    uuids = {}
+    name = os.path.basename(path)
+    try:
+        with macho.map_file(path) as buffer:
+            slices = macho.read_slices(buffer, path)
+            for thin in slices:
+                if thin.filetype != filetype:
+                    problems.append(
+                        f"{identifier}: {name} ({thin.architecture}) has file type {thin.filetype}"
+                    )
+                uuid = macho.read_uuid(buffer, thin, path)
+                if uuid is None:
+                    problems.append(f"{identifier}: {name} ({thin.architecture}) has no LC_UUID")
+                else:
+                    uuids[thin.architecture] = uuid
+    except (OSError, ValueError, macho.MachOError) as error:
+        problems.append(f"{identifier}: {error}")
+        return uuids
+    found = sorted(thin.architecture for thin in slices)
+    if found != architectures:
+        problems.append(f"{identifier}: {name} has {found}, expected {architectures}")
+    return uuids
+
+def _compare_uuids(
+    identifier: str,
+    uuids: Dict[str, str],
+    dsym_uuids: Dict[str, str],
+    problems: List[str]
+):
+    for (architecture, uuid) in sorted(uuids.items()):
+        if architecture in dsym_uuids and dsym_uuids[architecture] != uuid:
+            problems.append(
+                f"{identifier}: {architecture} dSYM UUID {dsym_uuids[architecture]} "
+                f"does not match binary UUID {uuid}"
+            )
+
+def _raise_problems(path: str, problems: List[str]):
+    if problems:
+        raise ValidationError(
+            f"{path} is invalid:\n" + '\n'.join(f"  {p}" for p in problems)
+        )
+
+def _dsym_binaries(library_path: str) -> List[str]:
+    return _dwarf_binaries(os.path.join(library_path, DSYMS_DIR_NAME))
+
+def _dwarf_binaries(dsyms_path: str) -> List[str]:
+    # The DWARF binaries of all "*.dSYM" bundles in `dsyms_path`.
+    if not os.path.isdir(dsyms_path):
+        return []
+    binaries = []
+    for dsym_name in sorted(os.listdir(dsyms_path)):
+        dwarf_path = os.path.join(dsyms_path, dsym_name, 'Contents', 'Resources', 'DWARF')
+        if os.path.isdir(dwarf_path):
+            binaries += [os.path.join(dwarf_path, name) for name in sorted(os.listdir(dwarf_path))]
+    return binaries
+
+def _load_plist(path: str) -> Optional[dict]:
+    with contextlib.suppress(OSError, plistlib.InvalidFileException):
+        with open(path, 'rb') as f:
+            return plistlib.load(f)
+    return None
+
+### - SCRIPT ARGUMENTS
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Compare binary sizes of released xcframeworks'
+    )
+    parser.add_argument(
+        'xcframework',
+        type=str,
+        nargs='?',
+        default=None,
+        help='Print the size report of this xcframework instead of the history.'
+    )
+    parser.add_argument(
+        '--bundle',
+        type=str,
+        default='universal',
+        help=(
+            'Bundle to compare: ios, universal, or ios-device, ios-simulator and macos '
+            'of releases with --platform-bundles. Defaults to %(default)s.'
+        )
+    )
+    parser.add_argument(
+        '--last',
+        type=int,
+        default=10,
+        help='Number of releases to show. Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--history',
+        type=str,
+        default=SIZE_HISTORY_PATH,
+        help='Size history file. Defaults to %(default)s.'
+    )
+    return parser.parse_args()
+
+### - MAIN
+
+def main():
+    args = parse_args()
+    if args.xcframework is not None:
+        print(json.dumps(size_report(args.xcframework), indent=2, sort_keys=True))
+        return 0
+
+    # The last report of every version, e.g. of a resumed release.
+    entries = {}
+    for entry in read_size_history(args.history):
+        if entry['bundle'] == args.bundle:
+            entries.pop(entry['version'], None)
+            entries[entry['version']] = entry
+    entries = list(entries.values())[-args.last:]
+    if not entries:
+        print(f"No {args.bundle} sizes recorded in {args.history}")
+        return 0
+
+    rows = sorted({
+        (identifier, architecture, segment)
+        for entry in entries
+        for (identifier, slices) in entry['sizes'].items()
+        for (architecture, sizes) in slices.items()
+        for segment in [''] + sorted(sizes['segments'])
+    })
+    names = [
+        f"{identifier} {architecture}" if not segment else f"  {segment}"
+        for (identifier, architecture, segment) in rows
+    ]
+    width = max(len(name) for name in names)
+    print(' ' * width + ''.join(f"{entry['version']:>16}" for entry in entries))
+    for (name, (identifier, architecture, segment)) in zip(names, rows):
+        cells = ''
+        for entry in entries:
+            sizes = entry['sizes'].get(identifier, {}).get(architecture)
+            size = None
+            if sizes is not None:
+                size = sizes['segments'].get(segment) if segment else sizes['size']
+            cells += f"{'-':>16}" if size is None else f"{size / MEGABYTE:>13.1f} MB"
+        print(f"{name:<{width}}{cells}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks the build orchestration with a stubbed toolchain.
+
+gn, ninja, generate_licenses.py, git remotes and the GitHub API are
+replaced with local stubs. The stub ninja writes synthetic frameworks and
+dSYMs of a configurable size, so every stage after compilation (merging,
+xcframework assembly, archiving, hashing and uploading) does real work.
+Runs on any platform with Python 3 and git.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import random
+import hashlib
+import logging
+import argparse
+import plistlib
+import tempfile
+import threading
+import subprocess
+import http.server
+from types import SimpleNamespace
+from typing import Dict, List
+import macho
+from tests.fixtures import thin_macho
+
+### - CONSTANTS
+
+CWD_PATH = os.path.dirname(os.path.realpath(__file__))
+MEGABYTE = 1024 ** 2
+STUB_EDGES = 200
+MATRIX = {
+    'ios': ['ios'],
+    'ios-simulator': ['ios', 'simulator'],
+    'universal': ['ios', 'simulator', 'mac'],
+}
+
+### - STUBS
+
+def stub_gn(argv: List[str]):
+    # gn.py gen <dir> --args=<args>
+    output_dir = argv[1]
+    args = next(arg for arg in argv if arg.startswith('--args='))[len('--args='):]
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'args.gn'), 'w') as f:
+        f.write(args.replace(' ', '\n') + '\n')
+
+def stub_ninja(argv: List[str]):
+    # ninja [-j N] [-l N] -C <dir> <target>
+    output_dir = argv[argv.index('-C') + 1]
+    with open(os.path.join(output_dir, 'args.gn')) as f:
+        gn_args = dict(re.findall(r'(\w+)=("[^"]*"|\S+)', f.read()))
+    target_cpu = gn_args['target_cpu'].strip('"')
+    is_mac = gn_args['target_os'].strip('"') == 'mac'
+    size = int(os.environ.get('BENCHMARK_BINARY_SIZE', 8 * MEGABYTE))
+
+    # ninja status lines let the scheduler detect the serial tail.
+    status = os.environ.get('NINJA_STATUS', '[%f/%t] ')
+    log_lines = []
+    for edge in range(1, STUB_EDGES + 1):
+        if edge % 50 == 0 or STUB_EDGES - edge < 8:
+            line = status.replace('%f', str(edge)).replace('%t', str(STUB_EDGES))
+            print(f"{line}CXX obj/stub_{edge}.o")
+        log_lines.append(f"{edge}\t{edge + 1}\t0\tobj/stub_{edge}.o\t{edge:x}\n")
+    log_lines.append(f"{STUB_EDGES}\t{STUB_EDGES + 50}\t0\tWebRTC.framework/WebRTC\tffff\n")
+    with open(os.path.join(output_dir, '.ninja_log'), 'w') as f:
+        f.write('# ninja log v5\n')
+        f.writelines(log_lines)
+
+    seed = f"{target_cpu}-{gn_args.get('target_environment', 'mac')}"
+    # Object files, pruned after the slice is built unless incremental.
+    object_size = size // STUB_EDGES
+    generator = random.Random(seed)
+    os.makedirs(os.path.join(output_dir, 'obj'), exist_ok=True)
+    for edge in range(1, STUB_EDGES + 1):
+        with open(os.path.join(output_dir, 'obj', f"stub_{edge}.o"), 'wb') as f:
+            f.write(generator.randbytes(object_size))
+    write_framework(os.path.join(output_dir, 'WebRTC.framework'), target_cpu, size, seed, is_mac)
+    if gn_args.get('enable_dsyms') == 'true':
+        write_dsym(os.path.join(output_dir, 'WebRTC.dSYM'), target_cpu, size * 2, seed)
+
+def stub_generate_licenses(argv: List[str]):
+    # generate_licenses.py --target <target> <output_dir> <lib dirs...>
+    output_dir = argv[2]
+    with open(os.path.join(output_dir, 'LICENSE.md'), 'a') as f:
+        f.write(f"# {argv[1]}\n\nStub license of {len(argv) - 3} build dirs.\n")
+
+def write_macho(path: str, target_cpu: str, filetype: int, size: int, seed: str):
+    """Writes a thin Mach-O (see tests.fixtures.thin_macho) with `size` bytes of payload.
+
+    The payload is split into a __TEXT and a __LINKEDIT segment. Half of
+    it is random and half repeats, which compresses roughly like a real
+    binary.
+    """
+    from webrtc_builder import MACHO_ARCHITECTURES
+    generator = random.Random(seed + str(filetype))
+    block = generator.randbytes(64 * 1024)
+
+    def payload(name: str, segment_size: int) -> bytes:
+        data = bytearray()
+        while len(data) < segment_size:
+            data += generator.randbytes(32 * 1024) + block[:32 * 1024]
+        return bytes(data[:segment_size])
+
+    contents = thin_macho(
+        MACHO_ARCHITECTURES[target_cpu],
+        filetype,
+        hashlib.md5(seed.encode()).hexdigest(),
+        {'__TEXT': size // 2, '__LINKEDIT': size - size // 2},
+        payload
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(contents)
+
+def write_framework(path: str, target_cpu: str, size: int, seed: str, versioned: bool):
+    shutil.rmtree(path, ignore_errors=True)
+    info = {
+        'CFBundleExecutable': 'WebRTC',
+        'CFBundleIdentifier': 'org.webrtc.WebRTC',
+        'CFBundlePackageType': 'FMWK',
+        'CFBundleShortVersionString': '1.0',
+        'CFBundleVersion': '1.0',
+    }
+    if versioned:
+        contents = os.path.join(path, 'Versions', 'A')
+        write_macho(os.path.join(contents, 'WebRTC'), target_cpu, macho.MH_DYLIB, size, seed)
+        _write_bundle_files(contents, os.path.join(contents, 'Resources'), info)
+        os.symlink('A', os.path.join(path, 'Versions', 'Current'))
+        for name in ['WebRTC', 'Headers', 'Modules', 'Resources']:
+            os.symlink(os.path.join('Versions', 'Current', name), os.path.join(path, name))
+    else:
+        write_macho(os.path.join(path, 'WebRTC'), target_cpu, macho.MH_DYLIB, size, seed)
+        _write_bundle_files(path, path, info)
+
+def write_dsym(path: str, target_cpu: str, size: int, seed: str):
+    shutil.rmtree(path, ignore_errors=True)
+    contents = os.path.join(path, 'Contents')
+    dwarf = os.path.join(contents, 'Resources', 'DWARF', 'WebRTC')
+    write_macho(dwarf, target_cpu, macho.MH_DSYM, size, seed)
+    with open(os.path.join(contents, 'Info.plist'), 'wb') as f:
+        plistlib.dump({'CFBundleIdentifier': 'com.apple.xcode.dsym.org.webrtc.WebRTC'}, f)
+
+def _write_bundle_files(contents_path: str, resources_path: str, info: dict):
+    headers_path = os.path.join(contents_path, 'Headers')
+    os.makedirs(headers_path, exist_ok=True)
+    for index in range(100):
+        with open(os.path.join(headers_path, f"RTCStub{index}.h"), 'w') as f:
+            f.write(f"@interface RTCStub{index} : NSObject\n@end\n" * 20)
+    modules_path = os.path.join(contents_path, 'Modules')
+    os.makedirs(modules_path, exist_ok=True)
+    with open(os.path.join(modules_path, 'module.modulemap'), 'w') as f:
+        f.write('framework module WebRTC {\n  umbrella header "WebRTC.h"\n  export *\n}\n')
+    os.makedirs(resources_path, exist_ok=True)
+    with open(os.path.join(resources_path, 'Info.plist'), 'wb') as f:
+        plistlib.dump(info, f, fmt=plistlib.FMT_BINARY)
+
+class StubGitHub(http.server.ThreadingHTTPServer):
+    """Minimal GitHub release API: uploads are read, hashed and discarded.
+
+    Like GitHub, uploads without a Content-Length (e.g. chunked) are
+    rejected with 411.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _StubGitHubHandler)
+        self.assets = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def release(self, id: int = 1) -> dict:
+        return {
+            'id': id,
+            'url': f"{self.url}/releases/{id}",
+            'upload_url': f"{self.url}/uploads/releases/{id}/assets{{?name,label}}",
+            'assets': [],
+        }
+
+class _StubGitHubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if 'Content-Length' not in self.headers:
+            self.close_connection = True
+            self._reply(411, {'message': 'Length Required'})
+            return
+        sha256 = hashlib.sha256()
+        size = 0
+        for chunk in self._body():
+            sha256.update(chunk)
+            size += len(chunk)
+        name = re.search(r'name=([^&]+)', self.path)
+        with self.server.lock:
+            asset = {
+                'id': len(self.server.assets) + 1,
+                'name': name.group(1) if name else '',
+                'size': size,
+                'state': 'uploaded',
+                'digest': f"sha256:{sha256.hexdigest()}",
+            }
+            asset['url'] = f"{self.server.url}/assets/{asset['id']}"
+            self.server.assets.append(asset)
+        self._reply(201, asset)
+
+    def do_GET(self):
+        self._reply(200, self.server.assets if '/assets' in self.path else {})
+
+    def do_PATCH(self):
+        list(self._body())
+        self._reply(200, {})
+
+    def do_DELETE(self):
+        self._reply(204, None)
+
+    def _body(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, MEGABYTE))
+            remaining -= len(chunk)
+            yield chunk
+
+    def _reply(self, status: int, body):
+        data = b'' if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+### - FUNCTIONS
+
+def create_toolchain(root: str) -> SimpleNamespace:
+    """Creates a stub depot_tools and WebRTC checkout below `root`."""
+    depot_tools_path = os.path.join(root, 'depot_tools')
+    webrtc_path = os.path.join(root, 'src')
+    os.makedirs(depot_tools_path)
+    stub = f"import sys\nsys.path.insert(0, {CWD_PATH!r})\nimport benchmark\n"
+    with open(os.path.join(depot_tools_path, 'gn.py'), 'w') as f:
+        f.write(stub + "benchmark.stub_gn(sys.argv[1:])\n")
+    ninja_path = os.path.join(depot_tools_path, 'ninja')
+    with open(ninja_path, 'w') as f:
+        f.write(f"#!{sys.executable}\n" + stub + "benchmark.stub_ninja(sys.argv[1:])\n")
+    os.chmod(ninja_path, 0o755)
+
+    licenses_path = os.path.join(webrtc_path, 'tools_webrtc', 'libs')
+    os.makedirs(licenses_path)
+    with open(os.path.join(licenses_path, 'generate_licenses.py'), 'w') as f:
+        f.write(stub + "benchmark.stub_generate_licenses(sys.argv[1:])\n")
+    _git(['init', '--quiet'], webrtc_path)
+    _git(['add', '.'], webrtc_path)
+    _git(['commit', '--quiet', '-m', 'Stub WebRTC'], webrtc_path)
+    return SimpleNamespace(
+        depot_tools_path=depot_tools_path,
+        webrtc_path=webrtc_path,
+        license_cache_path=os.path.join(root, 'licenses')
+    )
+
+def benchmark_builder(
+    root: str,
+    toolchain: SimpleNamespace,
+    server: StubGitHub,
+    platforms: List[str],
+    dsyms: bool,
+    options: argparse.Namespace
+) -> Dict[str, float]:
+    from webrtc_builder import WebRTCBuilder, XCFRAMEWORK_NAME
+    from build_scheduler import BuildScheduler
+    from github_client import GitHubClient
+    import archive
+    import release
+
+    output_path = os.path.join(root, 'out')
+    shutil.rmtree(output_path, ignore_errors=True)
+    scheduler = None
+    if options.parallel_builds > 1:
+        scheduler = BuildScheduler(os.cpu_count() or 1, options.parallel_builds)
+    builder = WebRTCBuilder(
+        toolchain.webrtc_path,
+        toolchain.depot_tools_path,
+        output_path,
+        dsyms,
+        platforms,
+        '1.0.0',
+        None,
+        False,
+        scheduler,
+        license_cache_path=toolchain.license_cache_path
+    )
+    timings = {}
+    with _timer(timings, 'build'):
+        builder.build_platforms(platforms)
+    with _timer(timings, 'bundle'):
+        builder.create_bundle(output_path, platforms, dsyms)
+
+    stream = archive.ZipStream(
+        output_path,
+        [XCFRAMEWORK_NAME],
+        compress_level=options.compress_level,
+        threads=options.compress_threads
+    )
+    with _timer(timings, 'archive'):
+        stream.prepare()
+    timings['archive MB'] = stream.size / MEGABYTE
+
+    client = GitHubClient(server.url, None)
+    with _timer(timings, 'upload'):
+        release.upload_asset(client, server.release(), 'WebRTC.zip', stream)
+    return timings
+
+def benchmark_release(
+    root: str,
+    toolchain: SimpleNamespace,
+    server: StubGitHub,
+    options: argparse.Namespace
+) -> Dict[str, float]:
+    from github_client import GitHubClient
+    import release
+
+    workspace = SimpleNamespace(
+        webrtc_path=toolchain.webrtc_path,
+        depot_tools_path=toolchain.depot_tools_path,
+        output_path=os.path.join(root, 'out'),
+        version_number='1.0.0'
+    )
+    shutil.rmtree(workspace.output_path, ignore_errors=True)
+    asset_options = release.AssetOptions(
+        compress_level=options.compress_level,
+        compress_threads=options.compress_threads,
+        upload_workers=options.github_workers,
+        license_cache_path=toolchain.license_cache_path,
+        size_history_path=os.path.join(root, 'size_history.jsonl')
+    )
+    client = GitHubClient(server.url, None, options.github_workers)
+    timings = {}
+    with _timer(timings, 'create_assets'):
+        assets = release.create_assets(workspace, client, server.release(), asset_options)
+    timings['asset count'] = len(assets)
+    return timings
+
+def benchmark_workspace(root: str) -> Dict[str, float]:
+    """Times clean() and the fast path of prepare() on a warm local workspace."""
+    from webrtc_workspace import WebRTCWorkspace
+    from milestones import MilestoneResolver
+
+    origin_path = os.path.join(root, 'origin.git')
+    seed_path = os.path.join(root, 'seed')
+    os.makedirs(root)
+    _git(['init', '--quiet', '--bare', origin_path], root)
+    _git(['symbolic-ref', 'HEAD', 'refs/heads/main'], origin_path)
+    _git(['init', '--quiet', seed_path], root)
+    with open(os.path.join(seed_path, 'DEPS'), 'w') as f:
+        f.write('deps = {}\n')
+    _git(['add', '.'], seed_path)
+    _git(['commit', '--quiet', '-m', 'DEPS'], seed_path)
+    _git(['push', '--quiet', origin_path, 'HEAD:refs/branch-heads/1000', 'HEAD:refs/heads/main'], seed_path)
+
+    pins_path = os.path.join(root, 'milestones.json')
+    with open(pins_path, 'w') as f:
+        json.dump({'stable': '100', 'branches': {'100': '1000'}}, f)
+    workspace = WebRTCWorkspace(
+        'stable',
+        MilestoneResolver(os.path.join(root, 'milestones_cache.json'), pins_path),
+        minimal_sync=True,
+        depot_tools_path=os.path.join(root, 'depot_tools_repo'),
+        webrtc_url=origin_path
+    )
+    workspace.root_path = os.path.join(root, 'workspace')
+    os.makedirs(workspace.root_path)
+    for path in [workspace.depot_tools_path, workspace.webrtc_path]:
+        _git(['clone', '--quiet', origin_path, path], root)
+    for path in [workspace._webrtc_build_path, workspace._third_party_path]:
+        _git(['clone', '--quiet', origin_path, path], root)
+    _git(['fetch', '--quiet', 'origin'], workspace.depot_tools_path)
+    _git(['fetch', '--quiet', 'origin', '+refs/branch-heads/1000:refs/remotes/branch-heads/1000'],
+         workspace.webrtc_path)
+    workspace._write_gclient_config()
+    workspace._write_sync_stamp()
+
+    timings = {}
+    with _timer(timings, 'clean'):
+        workspace.clean()
+    with _timer(timings, 'prepare (warm)'):
+        workspace.prepare()
+    return timings
+
+def _git(args: List[str], cwd: str):
+    subprocess.check_call(
+        ['git', '-c', 'user.name=benchmark', '-c', 'user.email=benchmark@localhost'] + args,
+        cwd=cwd
+    )
+
+class _timer:
+    def __init__(self, timings: Dict[str, float], name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_):
+        self.timings[self.name] = time.perf_counter() - self.start
+
+def _print_results(results: List[dict]):
+    for result in results:
+        timings = ', '.join(
+            f"{name} {value:.0f}" if name.endswith(('MB', 'count')) else f"{name} {value:.2f}s"
+            for (name, value) in result['timings'].items()
+        )
+        print(f"{result['scenario']:<40} {timings}")
+
+### - SCRIPT ARGUMENTS
+
+def parse_args() -> argparse.Namespace:
+    import archive
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--scenarios',
+        nargs='+',
+        default=['builder', 'release', 'workspace'],
+        choices=['builder', 'release', 'workspace'],
+        help='Scenarios to run. Defaults to all.'
+    )
+    parser.add_argument(
+        '--matrix',
+        nargs='+',
+        default=list(MATRIX.keys()),
+        choices=list(MATRIX.keys()),
+        help='Platform sets of the builder scenario. Defaults to all.'
+    )
+    parser.add_argument(
+        '--sizes',
+        nargs='+',
+        type=float,
+        default=[8, 32],
+        help='Size of every synthetic arch slice in MB (dSYMs are twice as large). Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='Repetitions of every scenario. Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--parallel-builds',
+        type=int,
+        default=1,
+        help='Slices built at once by the builder scenario. Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--compress-level',
+        type=int,
+        default=archive.COMPRESS_LEVEL,
+        help='Deflate level of the archives. Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--compress-threads',
+        type=int,
+        default=None,
+        help='Threads compressing the archives. Defaults to the number of CPUs.'
+    )
+    parser.add_argument(
+        '--github-workers',
+        type=int,
+        default=2,
+        help='Concurrent uploads of the release scenario. Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=None,
+        help='Write the results as JSON to this file.'
+    )
+    parser.add_argument(
+        '--keep',
+        action='store_true',
+        default=False,
+        help='Keep the temporary directory for inspection.'
+    )
+    return parser.parse_args()
+
+### - MAIN
+
+def main():
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.WARNING)
+    args = parse_args()
+    root = tempfile.mkdtemp(prefix='webrtc-benchmark-')
+    server = StubGitHub()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = []
+    try:
+        toolchain = create_toolchain(root)
+        for size in args.sizes:
+            os.environ['BENCHMARK_BINARY_SIZE'] = str(int(size * MEGABYTE))
+            for _ in range(args.repeat):
+                if 'builder' in args.scenarios:
+                    for matrix in args.matrix:
+                        for dsyms in [False, True]:
+                            timings = benchmark_builder(
+                                root, toolchain, server, MATRIX[matrix], dsyms, args
+                            )
+                            scenario = f"builder {matrix}{' dsyms' if dsyms else ''} {size:g}MB"
+                            results.append({'scenario': scenario, 'timings': timings})
+                            _print_results(results[-1:])
+                if 'release' in args.scenarios:
+                    timings = benchmark_release(root, toolchain, server, args)
+                    results.append({'scenario': f"release {size:g}MB", 'timings': timings})
+                    _print_results(results[-1:])
+        if 'workspace' in args.scenarios:
+            for index in range(args.repeat):
+                timings = benchmark_workspace(os.path.join(root, f"workspace-{index}"))
+                results.append({'scenario': 'workspace', 'timings': timings})
+                _print_results(results[-1:])
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+        else:
+            print(f"Kept {root}")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'arguments': vars(args), 'results': results}, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,10 +14,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import sys
 import logging
 import argparse
+import concurrent.futures
+import telemetry
 from typing import List
+from build_scheduler import add_scheduler_arguments, scheduler_from_args
+from build_cache import add_cache_arguments, cache_from_args
+from git_cache import add_git_cache_arguments, git_cache_from_args
+from compiler_cache import add_compiler_cache_arguments, compiler_cache_from_args
 
 ### - SCRIPT ARGUMENTS
 
@@ -27,9 +34,21 @@ def parse_args() -> List:
     parser = argparse.ArgumentParser(description='Create WebRTC xcframework')
     parser.add_argument(
         '--milestone',
+        nargs='+',
+        default=['stable'],
+        help='WebRTC milestones, built concurrently in isolated workspaces. Defaults to latest stable milestone.'
+    )
+    parser.add_argument(
+        '--isolated-workspace',
+        action='store_true',
+        default=False,
+        help='Check out the milestone in Scripts/workspaces/m<milestone> instead of Scripts/.'
+    )
+    parser.add_argument(
+        '--milestones-file',
         type=str,
-        default='stable',
-        help='WebRTC milestone. Defaults to latest stable milestone.'
+        default=None,
+        help='JSON file pinning the stable milestone and milestone branches.'
     )
     parser.add_argument(
         '--platforms',                
@@ -44,19 +63,46 @@ def parse_args() -> List:
         default=False,
         help='Include dSYMs.'
     )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        default=False,
+        help='Keep ninja build dirs and only rebuild what changed.'
+    )
+    parser.add_argument(
+        '--minimal-sync',
+        action='store_true',
+        default=False,
+        help='Fetch only the milestone branch head and skip dependencies unused on Apple platforms.'
+    )
+    parser.add_argument(
+        '--clone',
+        type=str,
+        default='full',
+        choices=['full', 'shallow', 'blobless'],
+        help='History fetched by --minimal-sync. Defaults to %(default)s.'
+    )
+    add_cache_arguments(parser)
+    add_compiler_cache_arguments(parser)
+    add_git_cache_arguments(parser)
+    add_scheduler_arguments(parser)
+    telemetry.add_telemetry_arguments(parser)
     return parser.parse_args()
 
-### - MAIN
+### - FUNCTIONS
 
-def main():
-    logging.basicConfig()
-    logging.getLogger().setLevel(logging.INFO)
-    args = parse_args()
-    milestone = f"{args.milestone}"
-    
+def build_milestone(milestone: str, args: argparse.Namespace, isolated: bool, shared: dict):
     # 1. Prepare workspace
     from webrtc_workspace import WebRTCWorkspace
-    workspace = WebRTCWorkspace(milestone)
+    workspace = WebRTCWorkspace(
+        milestone,
+        shared['resolver'],
+        git_cache_from_args(args),
+        args.minimal_sync,
+        args.clone,
+        isolated
+    )
+    shared['workspaces'].append(workspace)
     workspace.prepare()
     
     # 2. Create xcframework
@@ -68,14 +114,67 @@ def main():
         workspace.output_path,
         args.dsyms,
         args.platforms,
-        milestone
+        milestone,
+        shared['cache'],
+        args.incremental,
+        shared['scheduler'],
+        shared['compiler_cache']
     )
     builder.clean()
     builder.build()
     
     # 3. Clean workspace
     workspace.clean()
-    
+
+def finish_telemetry(args: argparse.Namespace, workspaces: List, succeeded: bool):
+    from webrtc_workspace import DEPOT_TOOLS_PATH
+    telemetry.finish(
+        [workspace.output_path for workspace in workspaces],
+        args.telemetry_dir,
+        {
+            'command': 'build',
+            'milestone': ' '.join(workspace.milestone for workspace in workspaces),
+            'platforms': args.platforms,
+            'dsyms': args.dsyms,
+            'succeeded': succeeded
+        },
+        os.path.join(DEPOT_TOOLS_PATH, 'ninja') if args.ninja_graph else None
+    )
+
+### - MAIN
+
+def main():
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    args = parse_args()
+    milestones = [f"{milestone}" for milestone in args.milestone]
+
+    from milestones import MilestoneResolver
+    # Concurrent milestones share the resolver, the artifact and compiler
+    # caches and the ninja job budget, but every milestone has its own workspace.
+    shared = {
+        'resolver': MilestoneResolver(pin_path=args.milestones_file),
+        'cache': cache_from_args(args),
+        'scheduler': scheduler_from_args(args, len(milestones) > 1),
+        'compiler_cache': compiler_cache_from_args(args),
+        'workspaces': []
+    }
+    isolated = args.isolated_workspace or len(milestones) > 1
+    succeeded = False
+    try:
+        if len(milestones) == 1:
+            build_milestone(milestones[0], args, isolated, shared)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(len(milestones)) as executor:
+                futures = [
+                    executor.submit(build_milestone, milestone, args, isolated, shared)
+                    for milestone in milestones
+                ]
+                for future in futures:
+                    future.result()
+        succeeded = True
+    finally:
+        finish_telemetry(args, shared['workspaces'], succeeded)
     return 0
 
 if __name__ == '__main__':
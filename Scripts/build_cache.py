@@ -0,0 +1,325 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import logging
+import shutil
+import hashlib
+import tarfile
+import argparse
+import tempfile
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+### - CONSTANTS
+
+GIGABYTE = 1024 ** 3
+DEFAULT_CACHE_SIZE = 50 * GIGABYTE
+ENTRY_INFO_NAME = 'entry.json'
+HTTP_TIMEOUT = 60
+
+### - CLASSES
+
+class LocalRemote:
+    """Remote cache backend stored as archives in a (shared) directory."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def fetch(self, key: str, archive_path: str) -> bool:
+        path = os.path.join(self.path, key + '.tar.gz')
+        if not os.path.isfile(path):
+            return False
+        shutil.copyfile(path, archive_path)
+        return True
+
+    def push(self, key: str, archive_path: str):
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, key + '.tar.gz')
+        tmp_path = path + f".{os.getpid()}.tmp"
+        shutil.copyfile(archive_path, tmp_path)
+        os.replace(tmp_path, path)
+
+class HTTPRemote:
+    """Remote cache backend that GETs and PUTs archives under a base URL."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+
+    def fetch(self, key: str, archive_path: str) -> bool:
+        import requests
+        response = requests.get(
+            f"{self.url}/{key}.tar.gz",
+            stream=True,
+            timeout=HTTP_TIMEOUT
+        )
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        with open(archive_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+        return True
+
+    def push(self, key: str, archive_path: str):
+        import requests
+        with open(archive_path, 'rb') as f:
+            requests.put(
+                f"{self.url}/{key}.tar.gz",
+                data=f,
+                timeout=HTTP_TIMEOUT
+            ).raise_for_status()
+
+class BuildCache:
+    """Content-addressed cache of built WebRTC slices.
+
+    Entries live in `<path>/<key[:2]>/<key>` and hold the products of a
+    single gn/ninja build. The modification time of an entry is bumped on
+    every hit and entries are evicted least recently used first once the
+    cache grows beyond `max_size` bytes. The cache is only walked on the
+    first store and on eviction, in between the size of every new entry
+    is added to the last known total.
+    """
+
+    def __init__(self, path: str, max_size: int = DEFAULT_CACHE_SIZE, remote=None):
+        self.path = path
+        self.max_size = max_size
+        self.remote = remote
+        self._lock = threading.Lock()
+        self._size = None
+
+    @staticmethod
+    def key(
+        commit: str,
+        gn_args: List[str],
+        gn_target_name: str,
+        architecture: str
+    ) -> str:
+        sha256_hash = hashlib.sha256()
+        for part in [commit.strip(), gn_target_name, architecture] + sorted(gn_args):
+            sha256_hash.update(part.encode('utf-8'))
+            sha256_hash.update(b'\0')
+        return sha256_hash.hexdigest()
+
+    def restore(self, key: str, output_dir: str, products: List[str]) -> bool:
+        entry_path = self._entry_path(key)
+        if not os.path.isdir(entry_path) and not self._fetch_remote(key):
+            return False
+
+        os.makedirs(output_dir, exist_ok=True)
+        for product in products:
+            source = os.path.join(entry_path, product)
+            destination = os.path.join(output_dir, product)
+            shutil.rmtree(destination, ignore_errors=True)
+            if os.path.exists(source):
+                shutil.copytree(source, destination, symlinks=True)
+        os.utime(entry_path)
+        return True
+
+    def store(
+        self,
+        key: str,
+        output_dir: str,
+        products: List[str],
+        info: Optional[dict] = None
+    ):
+        entry_path = self._entry_path(key)
+        if os.path.isdir(entry_path):
+            return
+
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(entry_path))
+        try:
+            for product in products:
+                source = os.path.join(output_dir, product)
+                if os.path.exists(source):
+                    shutil.copytree(
+                        source,
+                        os.path.join(tmp_path, product),
+                        symlinks=True
+                    )
+            with open(os.path.join(tmp_path, ENTRY_INFO_NAME), 'w') as f:
+                json.dump(dict(info or {}, created=int(time.time())), f, indent=2)
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(entry_path):
+                raise
+            # Stored by another thread in the meantime.
+            return
+
+        self._push_remote(key)
+        self._added(entry_path)
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+
+    def _added(self, entry_path: str):
+        size = _tree_size(entry_path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for (_, size, _) in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        entries = self._entries()
+        total_size = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            logging.info(f"Evicting build cache entry {os.path.basename(path)}")
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+        self._size = total_size
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for prefix in _listdir(self.path):
+            if len(prefix) != 2:
+                continue
+            for name in _listdir(os.path.join(self.path, prefix)):
+                path = os.path.join(self.path, prefix, name)
+                if not name.startswith(prefix) or not os.path.isdir(path):
+                    continue
+                entries.append((os.stat(path).st_mtime, _tree_size(path), path))
+        return entries
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def _fetch_remote(self, key: str) -> bool:
+        if self.remote is None:
+            return False
+        with tempfile.TemporaryDirectory(dir=_makedirs(self.path)) as tmp_dir:
+            archive_path = os.path.join(tmp_dir, key + '.tar.gz')
+            try:
+                if not self.remote.fetch(key, archive_path):
+                    return False
+            except Exception as error:
+                logging.warning(f"Remote build cache fetch failed: {error}")
+                return False
+            extract_path = os.path.join(tmp_dir, key)
+            try:
+                _extract(archive_path, extract_path)
+            except tarfile.TarError as error:
+                logging.warning(f"Rejected remote build cache entry {key}: {error}")
+                return False
+            entry_path = self._entry_path(key)
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            try:
+                os.rename(extract_path, entry_path)
+            except OSError:
+                if not os.path.isdir(entry_path):
+                    raise
+                return True
+        self._added(entry_path)
+        return True
+
+    def _push_remote(self, key: str):
+        if self.remote is None:
+            return
+        with tempfile.TemporaryDirectory(dir=self.path) as tmp_dir:
+            archive_path = os.path.join(tmp_dir, key + '.tar.gz')
+            with tarfile.open(archive_path, 'w:gz') as tar:
+                tar.add(self._entry_path(key), arcname='.')
+            try:
+                self.remote.push(key, archive_path)
+            except Exception as error:
+                logging.warning(f"Remote build cache push failed: {error}")
+
+### - FUNCTIONS
+
+def add_cache_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=None,
+        help='Directory of the local build artifact cache. Disabled by default.'
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=float,
+        default=DEFAULT_CACHE_SIZE / GIGABYTE,
+        help='Maximum size of the local build cache in GB. Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--remote-cache',
+        type=str,
+        default=None,
+        help='Directory or http(s) URL of a shared remote build cache.'
+    )
+
+def cache_from_args(args: argparse.Namespace) -> Optional[BuildCache]:
+    if args.cache_dir is None:
+        return None
+    remote = None
+    if args.remote_cache is not None:
+        if args.remote_cache.startswith(('http://', 'https://')):
+            remote = HTTPRemote(args.remote_cache)
+        else:
+            remote = LocalRemote(args.remote_cache)
+    return BuildCache(
+        os.path.abspath(args.cache_dir),
+        int(args.cache_size * GIGABYTE),
+        remote
+    )
+
+def _extract(archive_path: str, extract_path: str):
+    # Archives of a remote cache are not trusted, members must not end up
+    # outside of `extract_path`, neither directly nor through links.
+    with tarfile.open(archive_path, 'r:gz') as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(extract_path, filter='data')
+        else:
+            tar.extractall(extract_path, members=_checked_members(tar, extract_path))
+
+def _checked_members(tar: tarfile.TarFile, extract_path: str) -> Iterator[tarfile.TarInfo]:
+    root = os.path.realpath(extract_path)
+    for member in tar.getmembers():
+        path = os.path.realpath(os.path.join(root, member.name))
+        if member.issym():
+            target = os.path.join(os.path.dirname(path), member.linkname)
+        elif member.islnk():
+            target = os.path.join(root, member.linkname)
+        elif member.isfile() or member.isdir():
+            target = path
+        else:
+            raise tarfile.TarError(f"{member.name}: unsupported member type")
+        for checked_path in [path, os.path.realpath(target)]:
+            if checked_path != root and not checked_path.startswith(root + os.sep):
+                raise tarfile.TarError(f"{member.name}: points outside of the archive")
+        yield member
+
+def _listdir(path: str) -> List[str]:
+    try:
+        return os.listdir(path)
+    except FileNotFoundError:
+        return []
+
+def _makedirs(path: str) -> str:
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _tree_size(path: str) -> int:
+    size = 0
+    for (root, _, files) in os.walk(path):
+        for name in files:
+            size += os.lstat(os.path.join(root, name)).st_size
+    return size
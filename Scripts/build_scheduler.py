@@ -0,0 +1,222 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import sys
+import logging
+import argparse
+import threading
+import subprocess
+from typing import Callable, List, Optional, Tuple
+
+### - CONSTANTS
+
+GIGABYTE = 1024 ** 3
+# Rough peak memory of a single clang/lld job building WebRTC.
+MEMORY_PER_JOB = 2 * GIGABYTE
+NINJA_STATUS_PATTERN = re.compile(r'^\[(\d+)/(\d+)\]')
+
+### - CLASSES
+
+class JobSlot:
+    """Share of the scheduler's job budget held by one running build."""
+
+    def __init__(self, scheduler: 'BuildScheduler', name: str, jobs: int):
+        self.scheduler = scheduler
+        self.name = name
+        self.jobs = jobs
+        self.in_tail = False
+
+    def ninja_args(self) -> List[str]:
+        args = ['-j', str(self.jobs)]
+        if self.scheduler.load_average is not None:
+            args += ['-l', str(self.scheduler.load_average)]
+        return args
+
+    def drain(self, remaining: int):
+        # ninja never runs more jobs than it has edges left, so everything
+        # above that is handed back to the scheduler. The -j of the running
+        # ninja stays as is, this only releases jobs it can no longer use.
+        jobs = max(1, min(self.jobs, remaining))
+        if jobs == self.jobs:
+            return
+        if not self.in_tail:
+            self.in_tail = True
+            logging.info(f"Build {self.name} entered its serial tail.")
+        self.scheduler._release(self, self.jobs - jobs)
+
+    def run_ninja(self, cmd: List[str], cwd: str, env: Optional[dict] = None):
+        # Options go before the targets, BSD getopt stops at the first operand.
+        cmd = cmd[:1] + self.ninja_args() + cmd[1:]
+        logging.debug(f"Running: {' '.join(cmd)}")
+        env = dict(env or os.environ, NINJA_STATUS='[%f/%t] ')
+        process = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors='replace'
+        )
+        for line in process.stdout:
+            sys.stdout.write(f"[{self.name}] {line}")
+            match = NINJA_STATUS_PATTERN.match(line)
+            if match is None:
+                continue
+            (finished, total) = (int(match.group(1)), int(match.group(2)))
+            self.drain(total - finished)
+        returncode = process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
+
+class BuildScheduler:
+    """Runs builds concurrently within a global ninja job budget.
+
+    Every build gets an equal share of the budget (`-j`). Once a build's
+    remaining ninja edges fit into its share it is considered to be in its
+    serial tail and returns the jobs ninja can no longer use as the edges
+    drain, which lets the next pending build start while the previous one
+    is linking. `run` may be called from several threads (e.g. one per
+    milestone) sharing the budget.
+    """
+
+    def __init__(
+        self,
+        jobs: int,
+        max_parallel: int = 1,
+        load_average: Optional[float] = None,
+        memory_limit: Optional[int] = None
+    ):
+        if memory_limit is not None:
+            jobs = min(jobs, max(1, memory_limit // MEMORY_PER_JOB))
+        self.jobs = max(1, jobs)
+        self.max_parallel = max(1, max_parallel)
+        self.load_average = load_average
+        self._free = self.jobs
+        self._running = []
+        self._condition = threading.Condition()
+
+    @property
+    def share(self) -> int:
+        return max(1, self.jobs // self.max_parallel)
+
+    def run(self, tasks: List[Tuple[str, Callable[[JobSlot], None]]]):
+        pending = list(tasks)
+        running = []
+        errors = []
+
+        def worker(slot: JobSlot, task: Callable[[JobSlot], None]):
+            try:
+                task(slot)
+            except BaseException as error:
+                errors.append(error)
+            finally:
+                with self._condition:
+                    running.remove(slot)
+                    self._running.remove(slot)
+                    self._free += slot.jobs
+                    self._condition.notify_all()
+
+        with self._condition:
+            while pending or running:
+                busy = len([slot for slot in self._running if not slot.in_tail])
+                # A build in its tail keeps at least one job until ninja
+                # exits, so a full share may never be free while only tails
+                # are running. The next build then starts with what is free.
+                can_start = (
+                    pending and not errors
+                    and busy < self.max_parallel
+                    and (
+                        self._free >= self.share or not self._running
+                        or (busy == 0 and self._free > 0)
+                    )
+                )
+                if not can_start:
+                    if not running and (errors or not pending):
+                        break
+                    self._condition.wait()
+                    continue
+
+                (name, task) = pending.pop(0)
+                # The last build takes every free job, unless builds of
+                # another `run` still need their share.
+                alone = all(slot in running for slot in self._running)
+                jobs = self._free if not pending and alone else min(self._free, self.share)
+                jobs = max(1, jobs)
+                self._free -= jobs
+                slot = JobSlot(self, name, jobs)
+                running.append(slot)
+                self._running.append(slot)
+                logging.info(f"Starting build {name} with {jobs} jobs.")
+                threading.Thread(target=worker, args=(slot, task), daemon=True).start()
+
+        if errors:
+            raise errors[0]
+
+    def _release(self, slot: JobSlot, jobs: int):
+        with self._condition:
+            slot.jobs -= jobs
+            self._free += jobs
+            self._condition.notify_all()
+
+### - FUNCTIONS
+
+def add_scheduler_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='Global ninja job budget shared by all builds. Defaults to the number of CPUs.'
+    )
+    parser.add_argument(
+        '--parallel-builds',
+        type=int,
+        default=1,
+        help='Number of architecture builds to run at once. Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--load-average',
+        type=float,
+        default=None,
+        help='Do not start new ninja jobs while the load average is above this value.'
+    )
+    parser.add_argument(
+        '--memory-limit',
+        type=float,
+        default=None,
+        help=f"Memory ceiling in GB, allowing {MEMORY_PER_JOB // GIGABYTE} GB per job."
+    )
+
+def scheduler_from_args(
+    args: argparse.Namespace,
+    shared: bool = False
+) -> Optional[BuildScheduler]:
+    # Without any of the options, and unless several runs (e.g. milestones)
+    # share the budget, builds run one after another with plain ninja output.
+    if (
+        not shared and args.jobs is None and args.parallel_builds <= 1
+        and args.load_average is None and args.memory_limit is None
+    ):
+        return None
+    memory_limit = None
+    if args.memory_limit is not None:
+        memory_limit = int(args.memory_limit * GIGABYTE)
+    return BuildScheduler(
+        args.jobs or os.cpu_count() or 1,
+        args.parallel_builds,
+        args.load_average,
+        memory_limit
+    )
@@ -0,0 +1,151 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import logging
+import argparse
+import subprocess
+from typing import Dict, List, Optional
+
+### - CONSTANTS
+
+GIGABYTE = 1024 ** 3
+DEFAULT_CACHE_SIZE = 20 * GIGABYTE
+TOOLS = ['ccache', 'sccache']
+# `ccache --print-stats` counters, see "Cache statistics" in the ccache manual.
+CCACHE_HITS = ['direct_cache_hit', 'preprocessed_cache_hit']
+CCACHE_MISSES = ['cache_miss']
+
+### - CLASSES
+
+class CompilerCacheError(Exception):
+    pass
+
+class CompilerCache:
+    """ccache or sccache used as gn's `cc_wrapper`.
+
+    The cache is configured through the environment of gn and ninja, so
+    builds of several workspaces can use it concurrently. With ccache,
+    absolute paths below the workspace root are rewritten to relative ones
+    (`CCACHE_BASEDIR`) and the working directory is not hashed, so hits
+    survive moving to another workspace. sccache has no base dir support
+    and only hits for identical paths.
+    """
+
+    def __init__(
+        self,
+        tool: str = 'ccache',
+        path: Optional[str] = None,
+        max_size: int = DEFAULT_CACHE_SIZE
+    ):
+        executable = shutil.which(tool)
+        if executable is None:
+            raise CompilerCacheError(f"{tool} was not found in PATH.")
+        self.tool = tool
+        self.executable = executable
+        self.path = os.path.abspath(path) if path is not None else None
+        self.max_size = max_size
+
+    @property
+    def gn_args(self) -> List[str]:
+        return [f"cc_wrapper=\"{self.executable}\""]
+
+    def environment(self, base_dir: str) -> Dict[str, str]:
+        size = f"{max(1, self.max_size // GIGABYTE)}G"
+        if self.tool == 'sccache':
+            env = {'SCCACHE_CACHE_SIZE': size}
+            if self.path is not None:
+                env['SCCACHE_DIR'] = self.path
+            return env
+        env = {
+            'CCACHE_MAXSIZE': size,
+            'CCACHE_BASEDIR': base_dir,
+            'CCACHE_NOHASHDIR': 'true',
+            # Chromium defines __DATE__ and __TIME__ as empty macros, ccache's
+            # check for them would only cause misses.
+            'CCACHE_SLOPPINESS': 'time_macros',
+        }
+        if self.path is not None:
+            env['CCACHE_DIR'] = self.path
+        return env
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the cumulative hits and misses of the cache."""
+        env = dict(os.environ, **self.environment(os.getcwd()))
+        try:
+            if self.tool == 'sccache':
+                output = subprocess.check_output(
+                    [self.executable, '--show-stats', '--stats-format', 'json'], env=env
+                )
+                stats = json.loads(output)['stats']
+                return {
+                    'hits': sum(stats['cache_hits']['counts'].values()),
+                    'misses': sum(stats['cache_misses']['counts'].values()),
+                }
+            output = subprocess.check_output([self.executable, '--print-stats'], env=env)
+        except (subprocess.CalledProcessError, ValueError, KeyError) as error:
+            logging.warning(f"Reading {self.tool} statistics failed: {error}")
+            return {'hits': 0, 'misses': 0}
+
+        counters = {}
+        for line in output.decode('utf-8').splitlines():
+            (name, _, value) = line.partition('\t')
+            if value.strip().isdigit():
+                counters[name] = int(value)
+        return {
+            'hits': sum(counters.get(name, 0) for name in CCACHE_HITS),
+            'misses': sum(counters.get(name, 0) for name in CCACHE_MISSES),
+        }
+
+    def report(self, before: Dict[str, int]):
+        after = self.stats()
+        hits = after['hits'] - before['hits']
+        misses = after['misses'] - before['misses']
+        total = hits + misses
+        rate = 100 * hits / total if total else 0
+        logging.info(f"{self.tool}: {hits} hits, {misses} misses ({rate:.0f}% hit rate).")
+
+### - FUNCTIONS
+
+def add_compiler_cache_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--compiler-cache',
+        type=str,
+        default=None,
+        choices=TOOLS,
+        help='Compile through ccache or sccache (gn cc_wrapper). Disabled by default.'
+    )
+    parser.add_argument(
+        '--compiler-cache-dir',
+        type=str,
+        default=None,
+        help='Directory of the compiler cache. Defaults to the tool\'s own default.'
+    )
+    parser.add_argument(
+        '--compiler-cache-size',
+        type=float,
+        default=DEFAULT_CACHE_SIZE / GIGABYTE,
+        help='Maximum size of the compiler cache in GB. Defaults to %(default)s.'
+    )
+
+def compiler_cache_from_args(args: argparse.Namespace) -> Optional[CompilerCache]:
+    if args.compiler_cache is None:
+        return None
+    return CompilerCache(
+        args.compiler_cache,
+        args.compiler_cache_dir,
+        int(args.compiler_cache_size * GIGABYTE)
+    )
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import fcntl
+import logging
+import contextlib
+import argparse
+import subprocess
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+### - CONSTANTS
+
+CWD_PATH = os.path.dirname(os.path.realpath(__file__))
+DEPOT_TOOLS_URL = 'https://chromium.googlesource.com/chromium/tools/depot_tools.git'
+WEBRTC_URL = 'https://webrtc.googlesource.com/src.git'
+MIRROR_URLS = [DEPOT_TOOLS_URL, WEBRTC_URL]
+LOCKS_DIR_NAME = '.locks'
+DEFAULT_REFSPECS = ['+refs/heads/*:refs/heads/*']
+MIRROR_REFSPECS = {
+    WEBRTC_URL: DEFAULT_REFSPECS + ['+refs/branch-heads/*:refs/branch-heads/*'],
+}
+
+### - CLASSES
+
+class GitCache:
+    """Bare git mirrors shared by every workspace on a machine.
+
+    Checkouts are cloned with `--reference` and borrow objects from the
+    mirrors through `.git/objects/info/alternates`, so a new workspace only
+    copies what the mirrors are missing. The same directory is exported as
+    `GIT_CACHE_PATH`, which gclient uses for its own per-dependency mirrors.
+    Mirrors must never be deleted while checkouts borrow from them.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+
+    def mirror_path(self, url: str) -> str:
+        # Same naming as depot_tools' git_cache, so gclient and the
+        # workspace share a single mirror per repository.
+        parsed = urlparse(url)
+        name = parsed.netloc + parsed.path
+        if name.endswith('.git'):
+            name = name[:-len('.git')]
+        name = name.replace('googlesource.com/a/', 'googlesource.com/')
+        name = name.replace(':', '__')
+        return os.path.join(self.path, name.replace('-', '--').replace('/', '-').lower())
+
+    def environment(self) -> dict:
+        return {'GIT_CACHE_PATH': self.path}
+
+    def update(self, url: str) -> str:
+        """Creates or refreshes the mirror of `url` and returns its path."""
+        mirror_path = self.mirror_path(url)
+        with self._locked(mirror_path):
+            if not os.path.isfile(os.path.join(mirror_path, 'config')):
+                logging.info(f"Creating git mirror of {url}...")
+                os.makedirs(mirror_path, exist_ok=True)
+                _git(['init', '--bare', '--quiet'], mirror_path)
+                _git(['config', 'remote.origin.url', url], mirror_path)
+                for refspec in MIRROR_REFSPECS.get(url, DEFAULT_REFSPECS):
+                    _git(['config', '--add', 'remote.origin.fetch', refspec], mirror_path)
+            else:
+                logging.info(f"Updating git mirror of {url}...")
+            _fetch(mirror_path)
+        return mirror_path
+
+    def mirrors(self) -> Dict[str, str]:
+        """Returns the URL of every mirror in the cache (also gclient's) by path."""
+        mirrors = {}
+        for name in sorted(_listdir(self.path)):
+            mirror_path = os.path.join(self.path, name)
+            if not os.path.isfile(os.path.join(mirror_path, 'config')):
+                continue
+            try:
+                mirrors[mirror_path] = _git_output(
+                    ['config', '--get', 'remote.origin.url'], mirror_path
+                )
+            except subprocess.CalledProcessError:
+                logging.warning(f"Skipping {mirror_path}, it has no origin.")
+        return mirrors
+
+    def clone(self, url: str, checkout_path: str, args: Optional[List[str]] = None):
+        """Clones `url` into `checkout_path`, borrowing objects from its mirror."""
+        mirror_path = self.update(url)
+        _git(['clone', '--reference', mirror_path] + (args or []) + [url, checkout_path])
+
+    def borrow(self, checkout_path: str, url: str):
+        """Makes an existing checkout borrow objects from the mirror of `url`.
+
+        Objects that are already in the checkout stay there, only new
+        fetches get smaller.
+        """
+        mirror_path = self.update(url)
+        alternates_path = _git_output(
+            ['rev-parse', '--git-path', 'objects/info/alternates'], checkout_path
+        )
+        alternates_path = os.path.join(checkout_path, alternates_path)
+        mirror_objects = os.path.join(mirror_path, 'objects')
+        try:
+            with open(alternates_path) as f:
+                alternates = f.read().split()
+        except FileNotFoundError:
+            alternates = []
+        if mirror_objects not in alternates:
+            with open(alternates_path, 'a') as f:
+                f.write(mirror_objects + '\n')
+
+    def refresh(self):
+        """Updates the workspace mirrors and every other mirror in the cache.
+
+        gclient's mirrors are plain bare repositories with an origin, so
+        they are fetched like the workspace mirrors.
+        """
+        for url in MIRROR_URLS:
+            self.update(url)
+        for (mirror_path, url) in self.mirrors().items():
+            if url not in MIRROR_URLS:
+                logging.info(f"Updating git mirror of {url}...")
+                with self._locked(mirror_path):
+                    _fetch(mirror_path)
+
+    @contextlib.contextmanager
+    def _locked(self, mirror_path: str) -> Iterator[None]:
+        # Workspaces of concurrent milestones (threads or processes) update
+        # the same mirrors, git fails on concurrent ref updates. The locks
+        # are kept apart from depot_tools' own `<mirror>.lock` files.
+        locks_path = os.path.join(self.path, LOCKS_DIR_NAME)
+        os.makedirs(locks_path, exist_ok=True)
+        with open(os.path.join(locks_path, os.path.basename(mirror_path)), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+### - FUNCTIONS
+
+def add_git_cache_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--git-cache',
+        type=str,
+        default=os.environ.get('GIT_CACHE_PATH'),
+        help='Directory of shared git mirrors. Defaults to $GIT_CACHE_PATH, if set.'
+    )
+
+def git_cache_from_args(args: argparse.Namespace) -> Optional[GitCache]:
+    if args.git_cache is None:
+        return None
+    return GitCache(args.git_cache)
+
+def _fetch(mirror_path: str):
+    _git(['fetch', '--prune', '--quiet', 'origin'], mirror_path)
+
+def _listdir(path: str) -> List[str]:
+    try:
+        return os.listdir(path)
+    except FileNotFoundError:
+        return []
+
+def _git(args: List[str], cwd: str = CWD_PATH):
+    logging.debug(f"Running: git {' '.join(args)}")
+    subprocess.check_call(['git'] + args, cwd=cwd)
+
+def _git_output(args: List[str], cwd: str) -> str:
+    return subprocess.check_output(['git'] + args, cwd=cwd).decode('utf-8').strip()
+
+### - SCRIPT ARGUMENTS
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Create or refresh the shared git mirrors of the WebRTC workspace'
+    )
+    add_git_cache_arguments(parser)
+    args = parser.parse_args()
+    if args.git_cache is None:
+        parser.error('--git-cache is required when GIT_CACHE_PATH is not set.')
+    return args
+
+### - MAIN
+
+def main():
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    args = parse_args()
+    git_cache_from_args(args).refresh()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
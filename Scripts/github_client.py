@@ -0,0 +1,232 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import logging
+import requests
+import concurrent.futures
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+from requests.adapters import HTTPAdapter
+
+### - CONSTANTS
+
+API_TIMEOUT = (10, 60)
+UPLOAD_TIMEOUT = (10, 600)
+MAX_RETRIES = 5
+MAX_BACKOFF = 60
+# Longest wait for a rate limit reset before giving up.
+MAX_RATE_LIMIT_WAIT = 15 * 60
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+### - CLASSES
+
+class GitHubError(Exception):
+    pass
+
+class GitHubClient:
+    """GitHub REST client for the release API of a single repository.
+
+    All requests share one pooled session and are retried with
+    exponential backoff on connection errors, 5xx responses and rate
+    limits, honouring `Retry-After` and `X-RateLimit-Reset`.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        token: Optional[str],
+        max_workers: int = 4,
+        max_retries: int = MAX_RETRIES
+    ):
+        self.api_url = api_url.rstrip('/')
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_workers * 2)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'accept': 'application/vnd.github.v3+json'})
+        if token:
+            self.session.headers.update({'Authorization': f'token {token}'})
+
+    ### - Releases
+
+    def get_release_by_tag(self, tag: str) -> Optional[dict]:
+        response = self.request('GET', f"{self.api_url}/releases/tags/{tag}", allowed=(404,))
+        return None if response.status_code == 404 else response.json()
+
+    def get_release(self, id: int) -> dict:
+        return self.request('GET', f"{self.api_url}/releases/{id}").json()
+
+    def create_release(self, parameters: dict) -> dict:
+        return self.request('POST', f"{self.api_url}/releases", json=parameters).json()
+
+    def update_release(self, id: int, parameters: dict) -> dict:
+        return self.request('PATCH', f"{self.api_url}/releases/{id}", json=parameters).json()
+
+    def delete_release(self, release: dict):
+        self.delete_assets(release.get('assets', []))
+        self.request('DELETE', release['url'], allowed=(404,))
+
+    def delete_tag(self, tag_name: str):
+        self.request('DELETE', f"{self.api_url}/git/refs/tags/{tag_name}", allowed=(404, 422))
+
+    ### - Assets
+
+    def list_assets(self, release_id: int) -> List[dict]:
+        assets = []
+        url = f"{self.api_url}/releases/{release_id}/assets"
+        params = {'per_page': 100}
+        while url is not None:
+            response = self.request('GET', url, params=params)
+            assets += response.json()
+            url = response.links.get('next', {}).get('url')
+            params = None
+        return assets
+
+    def delete_assets(self, assets: List[dict]):
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as executor:
+            futures = [
+                executor.submit(self.request, 'DELETE', asset['url'], allowed=(404,))
+                for asset in assets
+            ]
+            for future in futures:
+                future.result()
+
+    def upload_asset(
+        self,
+        upload_url: str,
+        release_id: int,
+        name: str,
+        open_body: Callable[[], Iterable[bytes]],
+        content_type: str = 'application/zip'
+    ) -> dict:
+        """Uploads an asset, retrying with a fresh body from `open_body`.
+
+        GitHub requires a Content-Length, so the body must have a length
+        (e.g. a prepared archive.ZipStream) and is never sent chunked.
+        Before every retry the release is checked for an asset of the same
+        name. If the body was fully sent and GitHub reports an uploaded
+        asset with the same size (and SHA-256 digest, when available) that
+        asset is kept, otherwise the partial asset is deleted first.
+        """
+        url = upload_url.replace('{?name,label}', '')
+        for attempt in range(self.max_retries + 1):
+            body = open_body()
+            try:
+                response = self.session.post(
+                    url,
+                    params={'name': name},
+                    data=body,
+                    headers={'Content-Type': content_type, 'Content-Length': str(len(body))},
+                    timeout=UPLOAD_TIMEOUT
+                )
+                if response.ok:
+                    return response.json()
+                if response.status_code not in RETRY_STATUS_CODES and not _is_rate_limited(response):
+                    raise GitHubError(
+                        f"Uploading {name} failed: {response.status_code} {response.text}"
+                    )
+                delay = self._retry_delay(attempt, response)
+            except requests.RequestException as error:
+                logging.warning(f"Uploading {name} failed: {error}")
+                delay = self._retry_delay(attempt)
+
+            if attempt == self.max_retries:
+                break
+            existing = self._find_asset(release_id, name)
+            if existing is not None:
+                if _matches(existing, body):
+                    logging.info(f"Asset {name} was uploaded despite the error.")
+                    return existing
+                logging.info(f"Deleting incomplete asset {name}.")
+                self.request('DELETE', existing['url'], allowed=(404,))
+            logging.info(f"Retrying upload of {name} in {delay:.0f}s.")
+            time.sleep(delay)
+
+        raise GitHubError(f"Uploading {name} failed after {self.max_retries + 1} attempts.")
+
+    ### - Requests
+
+    def request(
+        self, 
+        method: str, 
+        url: str, 
+        allowed: Tuple[int, ...] = (), 
+        **kwargs
+    ) -> requests.Response:
+        kwargs.setdefault('timeout', API_TIMEOUT)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as error:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logging.warning(f"{method} {url} failed: {error}, retrying in {delay:.0f}s.")
+                time.sleep(delay)
+                continue
+
+            if response.ok or response.status_code in allowed:
+                return response
+            retry = response.status_code in RETRY_STATUS_CODES or _is_rate_limited(response)
+            if not retry or attempt == self.max_retries:
+                raise GitHubError(
+                    f"{method} {url} failed: {response.status_code} {response.text}"
+                )
+            delay = self._retry_delay(attempt, response)
+            logging.warning(
+                f"{method} {url} returned {response.status_code}, retrying in {delay:.0f}s."
+            )
+            time.sleep(delay)
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        delay = min(2 ** attempt, MAX_BACKOFF)
+        if response is None:
+            return delay
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), MAX_RATE_LIMIT_WAIT)
+        if _is_rate_limited(response):
+            reset = float(response.headers.get('X-RateLimit-Reset', 0))
+            return min(max(reset - time.time(), delay), MAX_RATE_LIMIT_WAIT)
+        return delay
+
+    def _find_asset(self, release_id: int, name: str) -> Optional[dict]:
+        try:
+            assets = self.list_assets(release_id)
+        except (GitHubError, requests.RequestException) as error:
+            logging.warning(f"Listing assets failed: {error}")
+            return None
+        return next((asset for asset in assets if asset['name'] == name), None)
+
+### - FUNCTIONS
+
+def _is_rate_limited(response: requests.Response) -> bool:
+    if response.status_code not in (403, 429):
+        return False
+    return (
+        response.headers.get('X-RateLimit-Remaining') == '0'
+        or 'Retry-After' in response.headers
+    )
+
+def _matches(asset: dict, body: Any) -> bool:
+    # Bodies that know their checksum (a prepared archive.ZipStream) can be
+    # verified, anything else is uploaded again.
+    if asset.get('state') != 'uploaded' or not getattr(body, 'complete', False):
+        return False
+    if asset.get('size') != len(body):
+        return False
+    digest = asset.get('digest')
+    return digest is None or digest == f"sha256:{body.checksum}"
@@ -0,0 +1,255 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import mmap
+import struct
+import logging
+import contextlib
+from typing import Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass
+
+### - CONSTANTS
+
+MH_MAGIC = 0xfeedface
+MH_CIGAM = 0xcefaedfe
+MH_MAGIC_64 = 0xfeedfacf
+MH_CIGAM_64 = 0xcffaedfe
+FAT_MAGIC = 0xcafebabe
+FAT_MAGIC_64 = 0xcafebabf
+
+CPU_ARCH_ABI64 = 0x01000000
+CPU_SUBTYPE_MASK = 0xff000000
+CPU_TYPE_X86 = 7
+CPU_TYPE_X86_64 = CPU_TYPE_X86 | CPU_ARCH_ABI64
+CPU_TYPE_ARM = 12
+CPU_TYPE_ARM64 = CPU_TYPE_ARM | CPU_ARCH_ABI64
+
+# Subtypes accepted for each CPU type, without the capability bits.
+CPU_SUBTYPES = {
+    CPU_TYPE_X86_64: {3: 'x86_64', 8: 'x86_64h'},
+    CPU_TYPE_ARM64: {0: 'arm64', 2: 'arm64e'},
+}
+# Page size alignment (as a power of 2) used by lipo for each CPU type.
+CPU_ALIGNMENTS = {
+    CPU_TYPE_X86_64: 12,
+    CPU_TYPE_ARM64: 14,
+}
+MH_DYLIB = 6
+MH_DSYM = 10
+MACH_HEADER_64_SIZE = 32
+LC_SEGMENT_64 = 0x19
+LC_UUID = 0x1b
+
+FAT_HEADER_FORMAT = '>II'
+FAT_ARCH_FORMAT = '>iiIII'
+FAT_ARCH_64_FORMAT = '>iiQQII'
+UINT32_MAX = 0xffffffff
+
+### - CLASSES
+
+class MachOError(Exception):
+    pass
+
+@dataclass
+class MachOSlice:
+    cputype: int
+    cpusubtype: int
+    filetype: int
+    offset: int
+    size: int
+
+    @property
+    def architecture(self) -> str:
+        return CPU_SUBTYPES[self.cputype][self.cpusubtype & ~CPU_SUBTYPE_MASK]
+
+    @property
+    def alignment(self) -> int:
+        return CPU_ALIGNMENTS[self.cputype]
+
+### - FUNCTIONS
+
+@contextlib.contextmanager
+def map_file(path: str) -> Iterator[mmap.mmap]:
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+def read_slices(buffer, path: str = '') -> List[MachOSlice]:
+    if len(buffer) < 8:
+        raise MachOError(f"{path}: file is too small to be a Mach-O binary")
+
+    (magic,) = struct.unpack_from('>I', buffer, 0)
+    if magic in (FAT_MAGIC, FAT_MAGIC_64):
+        (_, count) = struct.unpack_from(FAT_HEADER_FORMAT, buffer, 0)
+        arch_format = FAT_ARCH_FORMAT if magic == FAT_MAGIC else FAT_ARCH_64_FORMAT
+        arch_size = struct.calcsize(arch_format)
+        slices = []
+        for index in range(count):
+            fields = struct.unpack_from(
+                arch_format,
+                buffer,
+                struct.calcsize(FAT_HEADER_FORMAT) + index * arch_size
+            )
+            (offset, size) = (fields[2], fields[3])
+            if offset + size > len(buffer):
+                raise MachOError(f"{path}: slice {index} exceeds the file size")
+            thin = _read_thin_header(buffer, offset, path)
+            slices.append(MachOSlice(thin.cputype, thin.cpusubtype, thin.filetype, offset, size))
+        return slices
+
+    thin = _read_thin_header(buffer, 0, path)
+    thin.size = len(buffer)
+    return [thin]
+
+def read_load_commands(buffer, thin: MachOSlice, path: str = '') -> Iterator[Tuple[int, int]]:
+    """Yields `(cmd, offset)` of every load command of a thin slice."""
+    byte_order = _byte_order(buffer, thin.offset)
+    (ncmds, sizeofcmds) = struct.unpack_from(byte_order + 'II', buffer, thin.offset + 16)
+    offset = thin.offset + MACH_HEADER_64_SIZE
+    end = offset + sizeofcmds
+    if end > len(buffer):
+        raise MachOError(f"{path}: load commands exceed the file size")
+    for index in range(ncmds):
+        if offset + 8 > end:
+            raise MachOError(f"{path}: load command {index} exceeds the load commands")
+        (cmd, cmdsize) = struct.unpack_from(byte_order + 'II', buffer, offset)
+        if cmdsize < 8:
+            raise MachOError(f"{path}: load command {index} has an invalid size")
+        yield (cmd, offset)
+        offset += cmdsize
+
+def read_uuid(buffer, thin: MachOSlice, path: str = '') -> Optional[str]:
+    """Returns the LC_UUID of a thin slice, formatted like `dwarfdump --uuid`."""
+    for (cmd, offset) in read_load_commands(buffer, thin, path):
+        if cmd == LC_UUID:
+            uuid = bytes(buffer[offset + 8:offset + 24]).hex().upper()
+            return '-'.join([uuid[:8], uuid[8:12], uuid[12:16], uuid[16:20], uuid[20:]])
+    return None
+
+def read_segments(buffer, thin: MachOSlice, path: str = '') -> Dict[str, int]:
+    """Returns the file size of every LC_SEGMENT_64 of a thin slice by name."""
+    byte_order = _byte_order(buffer, thin.offset)
+    segments = {}
+    for (cmd, offset) in read_load_commands(buffer, thin, path):
+        if cmd != LC_SEGMENT_64:
+            continue
+        (name, _, _, _, filesize) = struct.unpack_from(byte_order + '16sQQQQ', buffer, offset + 8)
+        name = name.rstrip(b'\0').decode('utf-8', errors='replace')
+        segments[name] = segments.get(name, 0) + filesize
+    return segments
+
+def create_fat(input_paths: List[str], output_path: str):
+    """Writes a fat Mach-O binary with the slices of all `input_paths`.
+
+    Equivalent of `lipo <inputs> -create -output <output>`. Inputs may be
+    thin or fat binaries; their slices are read through memory maps and
+    written page aligned after the fat header.
+    """
+    with contextlib.ExitStack() as stack:
+        sources = []
+        for path in input_paths:
+            buffer = stack.enter_context(map_file(path))
+            for thin in read_slices(buffer, path):
+                sources.append((path, buffer, thin))
+
+        _validate(sources)
+        sources.sort(key=lambda s: (s[2].alignment, s[2].cputype, s[2].cpusubtype))
+
+        (offsets, end) = _layout(sources, FAT_ARCH_FORMAT)
+        # Offsets and sizes only fit in 32 bits below 4 GB.
+        is_64 = end > UINT32_MAX
+        if is_64:
+            (offsets, end) = _layout(sources, FAT_ARCH_64_FORMAT)
+
+        tmp_path = output_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            magic = FAT_MAGIC_64 if is_64 else FAT_MAGIC
+            f.write(struct.pack(FAT_HEADER_FORMAT, magic, len(sources)))
+            for ((_, _, thin), offset) in zip(sources, offsets):
+                if is_64:
+                    f.write(struct.pack(
+                        FAT_ARCH_64_FORMAT,
+                        thin.cputype, thin.cpusubtype, offset, thin.size, thin.alignment, 0
+                    ))
+                else:
+                    f.write(struct.pack(
+                        FAT_ARCH_FORMAT,
+                        thin.cputype, thin.cpusubtype, offset, thin.size, thin.alignment
+                    ))
+            for ((_, buffer, thin), offset) in zip(sources, offsets):
+                f.write(b'\0' * (offset - f.tell()))
+                with memoryview(buffer) as view:
+                    f.write(view[thin.offset:thin.offset + thin.size])
+
+        os.chmod(tmp_path, os.stat(input_paths[0]).st_mode & 0o7777)
+        os.replace(tmp_path, output_path)
+
+    architectures = ', '.join(thin.architecture for (_, _, thin) in sources)
+    logging.info(f"Created fat binary {output_path} ({architectures}).")
+
+def _read_thin_header(buffer, offset: int, path: str) -> MachOSlice:
+    if offset + 28 > len(buffer):
+        raise MachOError(f"{path}: truncated Mach-O header")
+    (magic,) = struct.unpack_from('<I', buffer, offset)
+    if magic == MH_MAGIC_64:
+        byte_order = '<'
+    elif magic == MH_CIGAM_64:
+        byte_order = '>'
+    elif magic in (MH_MAGIC, MH_CIGAM):
+        raise MachOError(f"{path}: 32-bit Mach-O binaries are not supported")
+    else:
+        raise MachOError(f"{path}: not a Mach-O binary")
+
+    (cputype, cpusubtype, filetype) = struct.unpack_from(byte_order + 'iiI', buffer, offset + 4)
+    subtypes = CPU_SUBTYPES.get(cputype)
+    if subtypes is None:
+        raise MachOError(f"{path}: unsupported CPU type {cputype:#x}")
+    if (cpusubtype & ~CPU_SUBTYPE_MASK) not in subtypes:
+        raise MachOError(f"{path}: unsupported CPU subtype {cpusubtype:#x}")
+    return MachOSlice(cputype, cpusubtype, filetype, offset, 0)
+
+def _byte_order(buffer, offset: int) -> str:
+    (magic,) = struct.unpack_from('<I', buffer, offset)
+    return '>' if magic == MH_CIGAM_64 else '<'
+
+def _validate(sources: List):
+    if not sources:
+        raise MachOError('No input binaries')
+
+    seen = dict()
+    for (path, _, thin) in sources:
+        key = (thin.cputype, thin.cpusubtype & ~CPU_SUBTYPE_MASK)
+        if key in seen:
+            raise MachOError(
+                f"{path} and {seen[key]} have the same architecture ({thin.architecture})"
+            )
+        seen[key] = path
+
+    filetypes = set(thin.filetype for (_, _, thin) in sources)
+    if len(filetypes) > 1:
+        raise MachOError(f"Mixed Mach-O file types: {sorted(filetypes)}")
+
+def _layout(sources: List, arch_format: str) -> Tuple[List[int], int]:
+    offsets = []
+    end = struct.calcsize(FAT_HEADER_FORMAT) + len(sources) * struct.calcsize(arch_format)
+    for (_, _, thin) in sources:
+        offset = _align(end, thin.alignment)
+        offsets.append(offset)
+        end = offset + thin.size
+    return (offsets, end)
+
+def _align(offset: int, alignment: int) -> int:
+    step = 1 << alignment
+    return (offset + step - 1) // step * step
@@ -0,0 +1,155 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import logging
+import threading
+import requests
+from typing import Optional
+
+### - CONSTANTS
+
+CWD_PATH = os.path.dirname(os.path.realpath(__file__))
+CACHE_PATH = os.path.join(CWD_PATH, '.cache', 'milestones.json')
+CHROMIUMDASH_URL = 'https://chromiumdash.appspot.com/fetch_milestones'
+STABLE_TTL = 6 * 60 * 60
+TIMEOUT = (3, 10)
+
+### - CLASSES
+
+class MilestoneError(Exception):
+    pass
+
+class MilestoneResolver:
+    """Resolves WebRTC milestones and branches with an on-disk cache.
+
+    The branch of a milestone never changes once it is branched, so
+    branches are cached forever. The current stable milestone is cached
+    for `stable_ttl` seconds and then revalidated with its ETag; if
+    chromiumdash can not be reached the last known value is used. A pin
+    file (`{"stable": "115", "branches": {"115": "5790"}}`) overrides both.
+    """
+
+    def __init__(
+        self,
+        cache_path: str = CACHE_PATH,
+        pin_path: Optional[str] = None,
+        stable_ttl: int = STABLE_TTL
+    ):
+        self.cache_path = cache_path
+        self.stable_ttl = stable_ttl
+        self.pins = {}
+        if pin_path is not None:
+            with open(pin_path) as f:
+                self.pins = json.load(f)
+        self._cache = _load_json(cache_path)
+        self._lock = threading.Lock()
+
+    def stable_milestone(self) -> str:
+        if 'stable' in self.pins:
+            return str(self.pins['stable'])
+
+        stable = self._cache.get('stable', {})
+        if stable and time.time() - stable.get('fetched', 0) < self.stable_ttl:
+            return stable['milestone']
+
+        logging.info('Fetching latest stable WebRTC milestone...')
+        headers = {}
+        if stable.get('etag'):
+            headers['If-None-Match'] = stable['etag']
+        try:
+            response = requests.get(
+                CHROMIUMDASH_URL,
+                params={'only_branched': 'true'},
+                headers=headers,
+                timeout=TIMEOUT
+            )
+            if response.status_code == 304:
+                milestone = stable['milestone']
+            else:
+                response.raise_for_status()
+                releases = response.json()
+                release = next(
+                    filter(lambda m: m['schedule_phase'] == 'stable', releases),
+                    releases[0]
+                )
+                milestone = str(release['milestone'])
+                stable = {'milestone': milestone, 'etag': response.headers.get('ETag')}
+                self._remember_branch(milestone, release.get('webrtc_branch'))
+        except (requests.RequestException, ValueError, KeyError, IndexError) as error:
+            if not stable:
+                raise MilestoneError(f"Can not resolve the stable milestone: {error}")
+            logging.warning(f"Using cached stable milestone, fetching failed: {error}")
+            return stable['milestone']
+
+        with self._lock:
+            self._cache['stable'] = dict(stable, fetched=time.time())
+            self._save()
+        return milestone
+
+    def branch(self, milestone: str) -> str:
+        milestone = str(milestone)
+        pinned = self.pins.get('branches', {}).get(milestone)
+        if pinned is not None:
+            return str(pinned)
+        cached = self._cache.get('branches', {}).get(milestone)
+        # 'None' was cached by earlier versions for milestones without a branch.
+        if cached is not None and cached != 'None':
+            return cached
+
+        logging.info(f"Fetching WebRTC branch name for m{milestone}...")
+        try:
+            response = requests.get(
+                CHROMIUMDASH_URL,
+                params={'mstone': milestone},
+                timeout=TIMEOUT
+            )
+            response.raise_for_status()
+            branch = response.json()[0]['webrtc_branch']
+        except (requests.RequestException, ValueError, KeyError, IndexError) as error:
+            raise MilestoneError(f"Can not resolve the branch of m{milestone}: {error}")
+        if branch is None:
+            # Not branched yet, asked again next time.
+            raise MilestoneError(f"m{milestone} has no WebRTC branch yet")
+        branch = str(branch)
+        self._remember_branch(milestone, branch)
+        return branch
+
+    def _remember_branch(self, milestone: str, branch: Optional[str]):
+        if branch is None:
+            return
+        with self._lock:
+            self._cache.setdefault('branches', {})[milestone] = str(branch)
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.cache_path)
+
+### - FUNCTIONS
+
+def _load_json(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logging.warning(f"Ignoring malformed {path}")
+        return {}
@@ -0,0 +1,203 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import logging
+import subprocess
+from typing import Dict, List, Optional
+from dataclasses import dataclass
+
+### - CONSTANTS
+
+NINJA_LOG_NAME = '.ninja_log'
+NINJA_LOG_HEADER = re.compile(r'^# ninja log v(\d+)')
+# Versions with the same five tab separated fields (v6 since ninja 1.12).
+NINJA_LOG_VERSIONS = [5, 6]
+COMPILE_EXTENSIONS = ('.o', '.obj', '.pch', '.gch')
+SLOWEST_COUNT = 10
+
+### - CLASSES
+
+@dataclass
+class Edge:
+    """A ninja build edge; outputs built by the same command share one edge."""
+    outputs: List[str]
+    # Milliseconds since the start of the ninja run.
+    start: int
+    end: int
+    command_hash: str
+
+    @property
+    def duration(self) -> int:
+        return self.end - self.start
+
+    @property
+    def kind(self) -> str:
+        return 'compile' if self.outputs[0].endswith(COMPILE_EXTENSIONS) else 'link'
+
+    def info(self) -> dict:
+        return {
+            'output': self.outputs[0],
+            'kind': self.kind,
+            'start': self.start / 1000,
+            'duration': self.duration / 1000
+        }
+
+### - FUNCTIONS
+
+def read_edges(build_dir: str) -> List[Edge]:
+    """Reads the edges of the latest ninja run from `build_dir/.ninja_log` (v5 or v6)."""
+    path = os.path.join(build_dir, NINJA_LOG_NAME)
+    with open(path) as f:
+        header = f.readline()
+        match = NINJA_LOG_HEADER.match(header)
+        if match is None:
+            logging.warning(f"Unsupported {path} format: {header.strip()}")
+            return []
+        if int(match.group(1)) not in NINJA_LOG_VERSIONS:
+            logging.warning(
+                f"Unknown {path} version v{match.group(1)}, reading it like v{NINJA_LOG_VERSIONS[-1]}."
+            )
+        edges = {}
+        last_end = 0
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 5:
+                continue
+            (start, end, _, output, command_hash) = fields
+            (start, end) = (int(start), int(end))
+            # Every ninja run appends to the log with times starting at 0,
+            # like Chromium's post_build_ninja_summary.py a decreasing end
+            # time marks the start of a new run.
+            if end < last_end:
+                edges = {}
+            last_end = end
+            key = (start, end, command_hash)
+            if key in edges:
+                edges[key].outputs.append(output)
+            else:
+                edges[key] = Edge([output], start, end, command_hash)
+    return list(edges.values())
+
+def critical_path(edges: List[Edge], inputs: Optional[Dict[str, List[str]]] = None) -> List[Edge]:
+    """Returns the chain of edges that determined the duration of the run.
+
+    With `inputs` (output path -> input paths, e.g. from `ninja -t graph`)
+    this is the longest path through the dependency graph. Without it the
+    path is approximated from the timings alone: starting at the last edge
+    to finish, each step goes to the edge that finished last before the
+    current one started.
+    """
+    if not edges:
+        return []
+    if inputs is not None:
+        return _longest_path(edges, inputs)
+
+    ordered = sorted(edges, key=lambda edge: edge.end)
+    path = [ordered[-1]]
+    while True:
+        previous = [edge for edge in ordered if edge.end <= path[-1].start]
+        if not previous:
+            break
+        path.append(previous[-1])
+    return list(reversed(path))
+
+def summarize(
+    build_dir: str,
+    count: int = SLOWEST_COUNT,
+    ninja_path: Optional[str] = None
+) -> dict:
+    """Summarizes the slowest edges and the critical path of the latest run.
+
+    With `ninja_path` the critical path is computed from the build graph,
+    which is exact but takes a while for a complete WebRTC build dir.
+    """
+    edges = read_edges(build_dir)
+    inputs = None
+    if ninja_path is not None:
+        dot = subprocess.check_output([ninja_path, '-C', build_dir, '-t', 'graph'])
+        inputs = read_graph_inputs(dot.decode('utf-8', errors='replace'))
+    path = critical_path(edges, inputs)
+    by_kind = {}
+    for kind in ['compile', 'link']:
+        kind_edges = [edge for edge in edges if edge.kind == kind]
+        kind_edges.sort(key=lambda edge: edge.duration, reverse=True)
+        by_kind[kind] = {
+            'edges': len(kind_edges),
+            'total': sum(edge.duration for edge in kind_edges) / 1000,
+            'slowest': [edge.info() for edge in kind_edges[:count]]
+        }
+    return {
+        'edges': len(edges),
+        'duration': max((edge.end for edge in edges), default=0) / 1000,
+        'compile': by_kind['compile'],
+        'link': by_kind['link'],
+        'critical_path': {
+            'duration': sum(edge.duration for edge in path) / 1000,
+            'edges': [edge.info() for edge in path]
+        }
+    }
+
+def read_graph_inputs(dot: str) -> Dict[str, List[str]]:
+    """Parses the output of `ninja -t graph` into output path -> input paths.
+
+    Files are boxes labelled with their path. An edge with one input and
+    one output is drawn as a single arrow, any other edge as an ellipse
+    node with arrows from its inputs and to its outputs.
+    """
+    labels = {}
+    rules = set()
+    arrows = []
+    for line in dot.splitlines():
+        line = line.strip()
+        if '->' in line:
+            (source, _, rest) = line.partition(' -> ')
+            arrows.append((source.strip('"'), rest.split(' ', 1)[0].strip('"')))
+        elif line.startswith('"0x') and 'label="' in line:
+            node = line.split(' ', 1)[0].strip('"')
+            label = line.split('label="', 1)[1].split('"', 1)[0]
+            if 'shape=ellipse' in line:
+                rules.add(node)
+            else:
+                labels[node] = label
+
+    rule_inputs = {}
+    inputs = {}
+    for (source, target) in arrows:
+        if target in rules:
+            rule_inputs.setdefault(target, []).append(labels[source])
+    for (source, target) in arrows:
+        if source in rules:
+            inputs.setdefault(labels[target], []).extend(rule_inputs.get(source, []))
+        elif target in labels:
+            inputs.setdefault(labels[target], []).append(labels[source])
+    return inputs
+
+def _longest_path(edges: List[Edge], inputs: Dict[str, List[str]]) -> List[Edge]:
+    by_output = {output: edge for edge in edges for output in edge.outputs}
+    # Longest (duration, path) ending at each edge, edges in finishing order
+    # are a valid topological order of the edges that were run.
+    best = {}
+    for edge in sorted(edges, key=lambda edge: edge.end):
+        predecessors = {
+            id(by_output[path]): by_output[path]
+            for output in edge.outputs
+            for path in inputs.get(output, [])
+            if path in by_output and by_output[path] is not edge
+        }
+        candidates = [best[key] for key in predecessors if key in best]
+        (duration, path) = max(candidates, key=lambda entry: entry[0], default=(0, []))
+        best[id(edge)] = (duration + edge.duration, path + [edge])
+    return max(best.values(), key=lambda entry: entry[0])[1]
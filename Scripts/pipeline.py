@@ -0,0 +1,108 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import queue
+import logging
+import threading
+import telemetry
+from typing import Any, Callable, Iterable, List, Tuple
+
+### - CONSTANTS
+
+_DONE = object()
+
+### - CLASSES
+
+class PipelineError(Exception):
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+
+class Pipeline:
+    """Runs items through stages on separate threads joined by bounded queues.
+
+    Every stage has its own worker threads (one unless a stage is given as
+    `(name, function, workers)`), so a slow stage (e.g. an upload) overlaps
+    with the next item in an earlier stage (e.g. a build). Results are
+    returned in the order of the input items. After a failure the remaining
+    items are drained without being processed and `run` raises a
+    PipelineError once every stage has stopped.
+    """
+
+    def __init__(self, stages: List[Tuple], queue_size: int = 1):
+        self.stages = [stage if len(stage) == 3 else stage + (1,) for stage in stages]
+        self.queue_size = queue_size
+
+    def run(self, items: Iterable[Any]) -> List[Any]:
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        results = []
+        errors = []
+        failed = threading.Event()
+
+        def worker(index: int, name: str, function: Callable[[Any], Any]):
+            while True:
+                entry = queues[index].get()
+                if entry is _DONE:
+                    break
+                if failed.is_set():
+                    continue
+                (position, item) = entry
+                try:
+                    with telemetry.span(name, 'pipeline', item=position):
+                        result = function(item)
+                except BaseException as error:
+                    logging.error(f"Pipeline stage '{name}' failed: {error}")
+                    errors.append(PipelineError(name, error))
+                    failed.set()
+                    continue
+                if index + 1 < len(queues):
+                    queues[index + 1].put((position, result))
+                else:
+                    results.append((position, result))
+
+        def stage(index: int, name: str, function: Callable[[Any], Any], workers: int):
+            threads = [
+                threading.Thread(target=worker, args=(index, name, function), daemon=True)
+                for _ in range(workers)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if index + 1 < len(queues):
+                # One marker per worker of the next stage.
+                for _ in range(self.stages[index + 1][2]):
+                    queues[index + 1].put(_DONE)
+
+        stage_threads = [
+            threading.Thread(target=stage, args=(index,) + tuple(stage_info), daemon=True)
+            for (index, stage_info) in enumerate(self.stages)
+        ]
+        for thread in stage_threads:
+            thread.start()
+        try:
+            for (position, item) in enumerate(items):
+                if failed.is_set():
+                    break
+                queues[0].put((position, item))
+        finally:
+            for _ in range(self.stages[0][2]):
+                queues[0].put(_DONE)
+            for thread in stage_threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+        return [result for (_, result) in sorted(results, key=lambda r: r[0])]
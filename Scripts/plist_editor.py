@@ -0,0 +1,58 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import logging
+import plistlib
+from typing import Any, Dict, List
+
+### - CONSTANTS
+
+INFO_PLIST_NAME = 'Info.plist'
+
+### - FUNCTIONS
+
+def framework_info_plist_path(framework_path: str) -> str:
+    # Versioned (macOS) frameworks keep Info.plist in Resources,
+    # shallow (iOS) frameworks at the root of the bundle.
+    resources_dir = os.path.join(framework_path, 'Resources')
+    if not os.path.exists(resources_dir):
+        resources_dir = framework_path
+    return os.path.join(resources_dir, INFO_PLIST_NAME)
+
+def edit_plist(path: str, edits: Dict[str, Any], fmt=plistlib.FMT_BINARY):
+    """Applies `edits` to the plist at `path` in a single read-modify-write.
+
+    A value of None removes the key. The file is replaced atomically, so
+    hardlinked copies of the original plist are left untouched.
+    """
+    with open(path, 'rb') as f:
+        contents = plistlib.load(f)
+
+    for (key, value) in edits.items():
+        if value is None:
+            contents.pop(key, None)
+        else:
+            contents[key] = value
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        plistlib.dump(contents, f, fmt=fmt)
+    os.replace(tmp_path, path)
+
+def stamp_frameworks(framework_paths: List[str], edits: Dict[str, Any]):
+    for framework_path in framework_paths:
+        infoplist_path = framework_info_plist_path(framework_path)
+        logging.info(f"Stamping {infoplist_path}: {', '.join(edits.keys())}")
+        edit_plist(infoplist_path, edits)
@@ -19,34 +19,53 @@ import sys
 import logging
 import shutil
 import argparse
-import requests
 import subprocess
 import hashlib
-from typing import Any, List
+import archive
+import artifacts
+import telemetry
+from typing import Any, List, Optional
 from dataclasses import dataclass
 from webrtc_workspace import WebRTCWorkspace
-from webrtc_builder import WebRTCBuilder
-from webrtc_builder import XCFRAMEWORK_NAME
+from webrtc_builder import WebRTCBuilder, LICENSE_CACHE_PATH
+from webrtc_builder import XCFRAMEWORK_NAME, DSYMS_BUNDLE_NAME, FRAMEWORK_NAME, DSYM_NAME, BuildSlice
+from pipeline import Pipeline
+from github_client import GitHubClient, GitHubError
+from run_manifest import RunManifest, manifest_path, fingerprint
+from build_scheduler import BuildScheduler, add_scheduler_arguments, scheduler_from_args
+from build_cache import BuildCache, add_cache_arguments, cache_from_args
+from git_cache import add_git_cache_arguments, git_cache_from_args
+from compiler_cache import CompilerCache, add_compiler_cache_arguments, compiler_cache_from_args
 
 ### - CONSTANTS
 
 CWD_PATH = os.path.dirname(os.path.realpath(__file__))
 ROOT_PATH = os.path.join(CWD_PATH, os.pardir)
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
-GITHUB_URL = 'https://github.com/pexip/webrtc-objc'
-GITHUB_API_URL = 'https://api.github.com/repos/pexip/webrtc-objc'
-GITHUB_HEADERS = {
-    'accept': 'application/vnd.github.v3+json', 
-    'Authorization': f'token {GITHUB_TOKEN}'
-}
+GITHUB_REPOSITORY = 'pexip/webrtc-objc'
+GITHUB_URL = f"https://github.com/{GITHUB_REPOSITORY}"
+# GITHUB_API_URL is the API root (as set by GitHub Actions), e.g. of a
+# local stand-in server, the repository path is added to it.
+GITHUB_API_URL = "{}/repos/{}".format(
+    os.environ.get("GITHUB_API_URL", 'https://api.github.com').rstrip('/'),
+    GITHUB_REPOSITORY
+)
 PLATFORMS = {
     'ios': ['ios', 'simulator'],
     'universal': ['ios', 'simulator', 'mac']
 }
-BUILD_CONFIGS = [
-    {'dsyms': False},
-    {'dsyms': True}
-]
+# Published with --platform-bundles.
+PLATFORM_BUNDLES = {
+    'ios-device': ['ios'],
+    'ios-simulator': ['simulator'],
+    'macos': ['mac']
+}
+# dSYMs of every platform are published as one side asset next to the
+# xcframeworks, which are shipped without debug symbols.
+DSYMS_BUNDLE = 'dSYMs'
+# Platforms of Package.swift and the podspec.
+MANIFEST_PLATFORMS = ['ios', 'simulator', 'mac']
+SLICES_FOLDER_NAME = 'slices'
 
 ### - CLASSES
 
@@ -54,6 +73,42 @@ BUILD_CONFIGS = [
 class Asset:
     name: str
     checksum: str     
+    size: Optional[int] = None
+
+@dataclass
+class Bundle:
+    name: str
+    platforms: List[str]
+    # A bundle of dSYMs instead of an xcframework.
+    dsyms: bool = False
+
+    @property
+    def folder_name(self) -> str:
+        return self.name
+
+    @property
+    def zip_name(self) -> str:
+        return f"WebRTC-{self.folder_name}.zip"
+
+    @property
+    def contents(self) -> str:
+        return DSYMS_BUNDLE_NAME if self.dsyms else XCFRAMEWORK_NAME
+
+@dataclass
+class AssetOptions:
+    cache: Optional[BuildCache] = None
+    incremental: bool = False
+    scheduler: Optional[BuildScheduler] = None
+    spill_archives: bool = True
+    compress_level: int = archive.COMPRESS_LEVEL
+    compress_threads: Optional[int] = None
+    upload_workers: int = 1
+    compiler_cache: Optional[CompilerCache] = None
+    manifest: Optional[RunManifest] = None
+    resume: bool = False
+    platform_bundles: bool = False
+    license_cache_path: str = LICENSE_CACHE_PATH
+    size_history_path: str = artifacts.SIZE_HISTORY_PATH
 
 @dataclass
 class ReleaseDetails:
@@ -71,49 +126,182 @@ class ReleaseDetails:
 
 ### - FUNCTIONS
 
-def create_assets(workspace: WebRTCWorkspace, upload_url: str) -> str:
+def plan_bundles(platform_bundles: bool = False) -> List[Bundle]:
+    bundles = [Bundle(name, platforms) for (name, platforms) in PLATFORMS.items()]
+    if platform_bundles:
+        bundles += [Bundle(name, platforms) for (name, platforms) in PLATFORM_BUNDLES.items()]
+    all_platforms = []
+    for bundle in bundles:
+        all_platforms += [p for p in bundle.platforms if p not in all_platforms]
+    # Last, every platform has been built and merged by then.
+    bundles.append(Bundle(DSYMS_BUNDLE, all_platforms, dsyms=True))
+    return bundles
+
+def manifest_asset(bundles: List[Bundle], assets: List[Asset]) -> Asset:
+    """Returns the smallest xcframework asset with all platforms of the package manifests."""
+    candidates = [
+        asset for (bundle, asset) in zip(bundles, assets)
+        if not bundle.dsyms and set(MANIFEST_PLATFORMS) <= set(bundle.platforms)
+    ]
+    return min(candidates, key=lambda asset: asset.size or 0)
+
+def create_assets(
+    workspace: WebRTCWorkspace, 
+    client: GitHubClient,
+    release: Any, 
+    options: Optional[AssetOptions] = None
+) -> List[Asset]:
     logging.info(f"Creating release assets.")
-    assets = []
-
-    for (name, platforms) in list(PLATFORMS.items()):
-        for config in BUILD_CONFIGS:
-            folder_name = name
-            dsyms = config['dsyms']
-            if dsyms:
-                folder_name += '_dsyms'
-            
-            builder = WebRTCBuilder(
-                workspace.webrtc_path,
-                workspace.depot_tools_path,
-                os.path.join(workspace.output_path, folder_name),
-                dsyms,
-                platforms,
-                workspace.version_number
-            )
-            builder.clean()
-            builder.build()
-            
-            zip_name = f"WebRTC-{folder_name}.zip"
-            zip_path = os.path.join(builder.output_path, zip_name)
-            subprocess.check_call(
-                ['zip', '--symlinks', '-r', zip_name, f"{XCFRAMEWORK_NAME}/"], 
-                cwd=builder.output_path
+    options = options or AssetOptions()
+    bundles = plan_bundles(options.platform_bundles)
+    platform_names = []
+    for bundle in bundles:
+        platform_names += [p for p in bundle.platforms if p not in platform_names]
+
+    # Every slice is compiled once, with dSYMs, and shared by all bundles.
+    builder = WebRTCBuilder(
+        workspace.webrtc_path,
+        workspace.depot_tools_path,
+        os.path.join(workspace.output_path, SLICES_FOLDER_NAME),
+        # Slices are built with dSYMs for the dSYMs bundle.
+        any(bundle.dsyms for bundle in bundles),
+        platform_names,
+        workspace.version_number,
+        options.cache,
+        options.incremental,
+        options.scheduler,
+        options.compiler_cache,
+        options.license_cache_path
+    )
+    manifest = options.manifest
+    uploaded = {}
+    if options.resume and manifest is not None:
+        # Slices and uploads of the interrupted run are reused as they are.
+        uploaded = verified_assets(client, release, manifest)
+    else:
+        builder.clean()
+    if options.compiler_cache is not None:
+        compiler_cache_stats = options.compiler_cache.stats()
+
+    def slice_entry(build_slice: BuildSlice) -> dict:
+        products = [FRAMEWORK_NAME] + ([DSYM_NAME] if builder.dsyms else [])
+        return {
+            'gn_args': sorted(build_slice.gn_args),
+            'products': fingerprint(
+                [os.path.join(build_slice.lib_path, product) for product in products]
             )
-            asset = upload_asset(zip_name, zip_path, upload_url)  
-            assets.append(Asset(zip_name, checksum(zip_path)))
+        }
+
+    def slice_name(build_slice: BuildSlice) -> str:
+        return f"{build_slice.platform.environment}-{build_slice.architecture}"
+
+    def build(bundle: Bundle) -> Bundle:
+        slices = builder.plan(bundle.platforms)
+        if options.resume and manifest is not None:
+            restored = []
+            for build_slice in slices:
+                entry = slice_entry(build_slice)
+                recorded = manifest.entry('slices', slice_name(build_slice))
+                if entry['products'] is not None and entry == recorded:
+                    restored.append(build_slice)
+            if restored:
+                logging.info(f"Reusing slices {', '.join(map(slice_name, restored))}.")
+            builder.restore_slices(restored)
+        builder.build_platforms(bundle.platforms)
+        if manifest is not None:
+            for build_slice in slices:
+                manifest.record('slices', slice_name(build_slice), slice_entry(build_slice))
+        return bundle
+
+    def package(bundle: Bundle) -> Bundle:
+        bundle_path = os.path.join(workspace.output_path, bundle.folder_name)
+        shutil.rmtree(bundle_path, ignore_errors = True)
+        if bundle.dsyms:
+            builder.create_dsyms_bundle(bundle_path, bundle.platforms)
+            return bundle
+        builder.create_bundle(bundle_path, bundle.platforms, dsyms=False)
+        artifacts.record_sizes(
+            bundle.folder_name,
+            workspace.version_number,
+            artifacts.size_report(os.path.join(bundle_path, XCFRAMEWORK_NAME)),
+            options.size_history_path
+        )
+        return bundle
+
+    def upload(bundle: Bundle) -> Asset:
+        # Sized and hashed first, GitHub rejects uploads without a Content-Length.
+        bundle_path = os.path.join(workspace.output_path, bundle.folder_name)
+        zip_name = bundle.zip_name
+        zip_path = os.path.join(bundle_path, zip_name) if options.spill_archives else None
+        stream = archive.ZipStream(
+            bundle_path, 
+            [bundle.contents], 
+            zip_path,
+            compress_level=options.compress_level,
+            threads=options.compress_threads
+        )
+        with telemetry.span('archive', 'release', asset=zip_name):
+            stream.prepare()
+        response = upload_asset(client, release, zip_name, stream)
+        if manifest is not None:
+            manifest.record('assets', zip_name, {
+                'id': response['id'],
+                'size': stream.size,
+                'checksum': stream.checksum
+            })
+        return Asset(zip_name, stream.checksum, stream.size)
+
+    # Packaging and uploading of a bundle overlap with the build of the next one.
+    created = Pipeline([
+        ('build', build),
+        ('package', package),
+        ('upload', upload, options.upload_workers)
+    ]).run([bundle for bundle in bundles if bundle.zip_name not in uploaded])
+    if options.compiler_cache is not None:
+        options.compiler_cache.report(compiler_cache_stats)
+    builder.compact([
+        os.path.join(workspace.output_path, bundle.folder_name) for bundle in bundles
+    ])
+    created = {asset.name: asset for asset in created}
+    return [uploaded.get(bundle.zip_name) or created[bundle.zip_name] for bundle in bundles]
+
+def verified_assets(client: GitHubClient, release: Any, manifest: RunManifest) -> dict:
+    """Returns the assets recorded in `manifest` that are still intact on GitHub."""
+    assets = {}
+    for existing in client.list_assets(release['id']):
+        entry = manifest.entry('assets', existing['name'])
+        if entry is None or entry['id'] != existing['id']:
+            continue
+        digest = existing.get('digest')
+        if (
+            existing.get('state') == 'uploaded'
+            and existing.get('size') == entry['size']
+            and (digest is None or digest == f"sha256:{entry['checksum']}")
+        ):
+            logging.info(f"Reusing uploaded asset {existing['name']}.")
+            assets[existing['name']] = Asset(existing['name'], entry['checksum'], entry['size'])
     return assets
 
-def upload_asset(name: str, path: str, url: str) -> Any:
+def resumable_release(client: GitHubClient, manifest: RunManifest, tag: str) -> Optional[Any]:
+    """Returns the draft release recorded in `manifest`, if it still exists."""
+    recorded = manifest.stage('release')
+    if recorded is None:
+        return None
+    try:
+        release = client.get_release(recorded['id'])
+    except GitHubError as error:
+        logging.warning(f"Draft release {tag} can't be reused: {error}")
+        return None
+    if not release.get('draft') or release.get('tag_name') != tag:
+        logging.warning(f"Release {recorded['id']} is no longer a draft of {tag}.")
+        return None
+    return release
+
+def upload_asset(client: GitHubClient, release: Any, name: str, data: archive.ZipStream) -> Any:
     logging.info(f"Uploading an asset with name {name}.")
-    url = url.replace(u'{?name,label}','')
-    data = open(path, 'rb')  
-    params = {'name': name}
-    headers = {
-        'Authorization': f'token {GITHUB_TOKEN}', 
-        'Content-Length': str(os.stat(path).st_size), 
-        'Content-Type': 'application/zip'
-    }
-    return requests.post(url, params = params, data = data, headers = headers).json()
+    # The prepared stream has a length, so it is not sent chunked.
+    with telemetry.span('upload asset', 'release', asset=name):
+        return client.upload_asset(release['upload_url'], release['id'], name, lambda: data)
 
 def checksum(file: str) -> str:
     sha256_hash = hashlib.sha256()
@@ -131,7 +319,7 @@ def update_source_code(asset: Asset, details: ReleaseDetails):
     os.system(f"sed -i '' 's#http:.*,#http: \"{details.asset_url(asset)}\",#' {podspec_path}")
     os.system(f"sed -i '' 's#sha256:.*,#sha256: \"{asset.checksum}\",#' {podspec_path}")
 
-def draft_release(details: ReleaseDetails) -> Any:
+def draft_release(client: GitHubClient, details: ReleaseDetails) -> Any:
     logging.info(f"Creating a new draft release {details.tag} on GitHub.")
     parameters = { 
         'name': details.name,
@@ -139,17 +327,25 @@ def draft_release(details: ReleaseDetails) -> Any:
         'draft': True,
         'body': ""
     }
-    return requests.post(
-        f"{GITHUB_API_URL}/releases", 
-        json = parameters, 
-        headers = GITHUB_HEADERS
-    ).json()
+    return client.create_release(parameters)
 
-def publish_release(id: int, details: ReleaseDetails, assets: List[Asset]):
+def publish_release(
+    client: GitHubClient, 
+    id: int, 
+    details: ReleaseDetails, 
+    assets: List[Asset]
+):
     logging.info(f"Publishing a release {details.tag} on GitHub.")
     commit_message = f"\"Release {details.name}\""
     subprocess.check_call(['git', 'add', '.'], cwd=ROOT_PATH)
-    subprocess.check_call(['git', 'commit', '-m', commit_message], cwd=ROOT_PATH)
+    # A resumed run may have committed (and pushed) before it was
+    # interrupted, a clean tree is only pushed again, which is a no-op
+    # if the push went through.
+    status = subprocess.check_output(['git', 'status', '--porcelain'], cwd=ROOT_PATH)
+    if status.strip():
+        subprocess.check_call(['git', 'commit', '-m', commit_message], cwd=ROOT_PATH)
+    else:
+        logging.info('Release changes are already committed.')
     subprocess.check_call(['git', 'push', 'origin', 'main'], cwd=ROOT_PATH)
     
     body = f"**Milestone**: {details.name}\n"
@@ -160,28 +356,23 @@ def publish_release(id: int, details: ReleaseDetails, assets: List[Asset]):
     for asset in assets:
         body += f"Name: {asset.name}\n"
         body += f"URL: {details.asset_url(asset)}\n"
+        if asset.size is not None:
+            body += f"Size: {asset.size / 1024 ** 2:.1f} MB\n"
         body += f"Checksum: {asset.checksum}\n\n"    
+    body += f"dSYMs of all xcframeworks are in WebRTC-{DSYMS_BUNDLE}.zip.\n"
     
     parameters = {'draft': False, 'body': body}
     
-    requests.patch(
-        f"{GITHUB_API_URL}/releases/{id}", 
-        json = parameters, 
-        headers = GITHUB_HEADERS
-    )
+    client.update_release(id, parameters)
 
-def delete_release(release: Any):
-    for asset in release['assets']:
-        requests.delete(asset['url'], headers = GITHUB_HEADERS)
-    requests.delete(release['url'], headers = GITHUB_HEADERS)
-    delete_tag(release['tag_name'])
+def delete_release(client: GitHubClient, release: Any):
+    logging.info(f"Deleting a release {release['tag_name']} on GitHub.")
+    client.delete_release(release)
+    delete_tag(client, release['tag_name'])
 
-def delete_tag(tag_name: str):
+def delete_tag(client: GitHubClient, tag_name: str):
     logging.info(f"Deleting a tag {tag_name} on GitHub.")
-    requests.delete(
-        f"{GITHUB_API_URL}/git/refs/tags/{tag_name}", 
-        headers = GITHUB_HEADERS
-    )
+    client.delete_tag(tag_name)
 
 ### - SCRIPT ARGUMENTS
 
@@ -195,21 +386,121 @@ def parse_args() -> List:
         default='stable',
         help='WebRTC milestone. Defaults to latest stable milestone.'
     )
+    parser.add_argument(
+        '--milestones-file',
+        type=str,
+        default=None,
+        help='JSON file pinning the stable milestone and milestone branches.'
+    )
+    parser.add_argument(
+        '--isolated-workspace',
+        action='store_true',
+        default=False,
+        help='Check out the milestone in Scripts/workspaces/m<milestone>, e.g. to release several milestones at once.'
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        default=False,
+        help='Keep ninja build dirs from a previous run and only rebuild what changed.'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        default=False,
+        help='Continue an interrupted release from its run manifest, reusing the draft release, built slices and uploaded assets.'
+    )
+    parser.add_argument(
+        '--platform-bundles',
+        action='store_true',
+        default=False,
+        help='Also publish an xcframework per platform (iOS device, iOS simulator, macOS).'
+    )
+    parser.add_argument(
+        '--spill-archives',
+        action='store_true',
+        default=True,
+        help=(
+            'Write each zip archive to disk while it is sized and hashed, and upload it '
+            'from there. Every asset is compressed once, the archives take up disk space '
+            'next to their bundles. This is the default.'
+        )
+    )
+    parser.add_argument(
+        '--no-spill-archives',
+        dest='spill_archives',
+        action='store_false',
+        help=(
+            'Do not write zip archives to disk. Each archive is compressed once to size and '
+            'hash it and again for every upload attempt, trading CPU time for disk space.'
+        )
+    )
+    parser.add_argument(
+        '--compression-level',
+        type=int,
+        default=archive.COMPRESS_LEVEL,
+        choices=range(0, 10),
+        metavar='[0-9]',
+        help='Deflate level of the zip archives. Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--compression-threads',
+        type=int,
+        default=None,
+        help='Threads compressing the zip archives. Defaults to the number of CPUs.'
+    )
+    parser.add_argument(
+        '--github-workers',
+        type=int,
+        default=2,
+        help='Concurrent GitHub uploads and deletions. Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--minimal-sync',
+        action='store_true',
+        default=False,
+        help='Fetch only the milestone branch head and skip dependencies unused on Apple platforms.'
+    )
+    parser.add_argument(
+        '--clone',
+        type=str,
+        default='full',
+        choices=['full', 'shallow', 'blobless'],
+        help='History fetched by --minimal-sync. Defaults to %(default)s.'
+    )
+    add_cache_arguments(parser)
+    add_compiler_cache_arguments(parser)
+    add_git_cache_arguments(parser)
+    add_scheduler_arguments(parser)
+    telemetry.add_telemetry_arguments(parser)
     return parser.parse_args()
 
 ### - MAIN
 
-def main():
-    logging.basicConfig()
-    logging.getLogger().setLevel(logging.INFO)
-    args = parse_args()    
-    milestone = f"{args.milestone}"
-    
-    # 1. Prepare workspace
-    from webrtc_workspace import WebRTCWorkspace
-    workspace = WebRTCWorkspace(milestone)
-    workspace.clean()
-    workspace.prepare()
+def release_milestone(args: argparse.Namespace, workspace: WebRTCWorkspace) -> int:
+    # Every finished stage is checkpointed, `--resume` continues after the
+    # last one that can still be verified.
+    manifest = None
+    if args.resume:
+        manifest = RunManifest.load(manifest_path(workspace.version_number))
+    resume = manifest is not None
+    if manifest is None:
+        manifest = RunManifest(manifest_path(workspace.version_number))
+    if resume and manifest.stage('publish') is not None:
+        logging.info(f"Release {workspace.version_number} was already published.")
+        return 0
+
+    sync = manifest.stage('sync')
+    if resume and sync is not None and workspace.resume(sync['commit']):
+        logging.info(f"Resuming release {workspace.version_number} at {sync['commit']}.")
+    else:
+        if resume:
+            logging.warning('The workspace changed since the interrupted run, starting over.')
+            resume = False
+        manifest.discard(['sync', 'slices'])
+        workspace.clean()
+        workspace.prepare()
+        manifest.complete('sync', {'commit': workspace.commit.strip()})
 
     # 2. Create a new release
     release_details = ReleaseDetails(
@@ -218,35 +509,83 @@ def main():
         workspace.commit,
         workspace.version_number
     )
-    request = requests.get(
-        f"{GITHUB_API_URL}/releases/tags/{release_details.tag}", 
-        headers = GITHUB_HEADERS
-    )
-    
-    if request.status_code == 200:
-        print(f"Release {workspace.version_number} already exists on GitHub. Do you want to delete it?")
-        answer = input("yes/no")
-        if answer == 'yes' or answer == 'y':
-            delete_release(request.json())
-        else:
-            logging.info(f"Cancelled by user.")
-            return 0
-    release = draft_release(release_details)
+    client = GitHubClient(GITHUB_API_URL, GITHUB_TOKEN, args.github_workers)
+    release = resumable_release(client, manifest, release_details.tag) if resume else None
+    if release is None:
+        existing_release = client.get_release_by_tag(release_details.tag)
+
+        if existing_release is not None:
+            print(f"Release {workspace.version_number} already exists on GitHub. Do you want to delete it?")
+            answer = input("yes/no")
+            if answer == 'yes' or answer == 'y':
+                delete_release(client, existing_release)
+            else:
+                logging.info(f"Cancelled by user.")
+                return 0
+        release = draft_release(client, release_details)
+        manifest.discard(['assets'])
+        manifest.complete('release', {'id': release['id'], 'tag': release_details.tag})
 
     # 3. Build and upload xcframeworks
-    shutil.rmtree(workspace.output_path, ignore_errors = True)
-    assets = create_assets(workspace, release['upload_url'])
+    if not args.incremental and not resume:
+        shutil.rmtree(workspace.output_path, ignore_errors = True)
+    options = AssetOptions(
+        cache_from_args(args),
+        args.incremental,
+        scheduler_from_args(args),
+        args.spill_archives,
+        args.compression_level,
+        args.compression_threads,
+        args.github_workers,
+        compiler_cache_from_args(args),
+        manifest,
+        resume,
+        args.platform_bundles
+    )
+    assets = create_assets(workspace, client, release, options)
     
     # 4. Update Package.swift
-    update_source_code(asset = assets[-1], details=release_details)
+    asset = manifest_asset(plan_bundles(args.platform_bundles), assets)
+    update_source_code(asset = asset, details=release_details)
 
     # 5. Publish a new release
-    publish_release(release['id'], release_details, assets)
+    publish_release(client, release['id'], release_details, assets)
+    manifest.complete('publish', {'assets': [asset.name for asset in assets]})
 
     # 4. Clean workspace
     workspace.clean()
     
     return 0
 
+def main():
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    args = parse_args()    
+    milestone = f"{args.milestone}"
+    
+    # 1. Prepare workspace
+    from webrtc_workspace import DEPOT_TOOLS_PATH
+    from milestones import MilestoneResolver
+    workspace = WebRTCWorkspace(
+        milestone,
+        MilestoneResolver(pin_path=args.milestones_file),
+        git_cache_from_args(args),
+        args.minimal_sync,
+        args.clone,
+        args.isolated_workspace
+    )
+    succeeded = False
+    try:
+        result = release_milestone(args, workspace)
+        succeeded = True
+    finally:
+        telemetry.finish(
+            [workspace.output_path],
+            args.telemetry_dir,
+            {'command': 'release', 'milestone': workspace.milestone, 'succeeded': succeeded},
+            os.path.join(DEPOT_TOOLS_PATH, 'ninja') if args.ninja_graph else None
+        )
+    return result
+
 if __name__ == '__main__':
     sys.exit(main())
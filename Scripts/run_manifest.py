@@ -0,0 +1,116 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+### - CONSTANTS
+
+CWD_PATH = os.path.dirname(os.path.realpath(__file__))
+MANIFESTS_PATH = os.path.join(CWD_PATH, '.cache', 'releases')
+VERSION = 1
+
+### - CLASSES
+
+class RunManifest:
+    """Checkpoints of a release run, saved to disk after every change.
+
+    A stage (e.g. `sync`) is completed once with its outputs, stages made
+    of several items (e.g. `assets`) record one entry per item. A resumed
+    run verifies the recorded outputs against the workspace and GitHub
+    before skipping anything, so a stale manifest only costs the checks.
+    Entries are recorded from pipeline worker threads.
+    """
+
+    def __init__(self, path: str, stages: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self._stages = stages or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> Optional['RunManifest']:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logging.warning(f"Ignoring malformed run manifest {path}")
+            return None
+        if data.get('version') != VERSION:
+            logging.warning(f"Ignoring run manifest {path} of version {data.get('version')}")
+            return None
+        return cls(path, data['stages'])
+
+    def stage(self, name: str) -> Optional[Dict[str, Any]]:
+        """Returns the outputs of a completed stage."""
+        with self._lock:
+            return self._stages.get(name)
+
+    def complete(self, name: str, outputs: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self._stages[name] = dict(outputs or {}, completed=time.time())
+            self._save()
+
+    def entry(self, stage: str, name: str) -> Optional[Any]:
+        with self._lock:
+            return self._stages.get(stage, {}).get(name)
+
+    def record(self, stage: str, name: str, entry: Any):
+        with self._lock:
+            self._stages.setdefault(stage, {})[name] = entry
+            self._save()
+
+    def discard(self, stages: List[str]):
+        with self._lock:
+            for name in stages:
+                self._stages.pop(name, None)
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + f".{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': VERSION, 'stages': self._stages}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+### - FUNCTIONS
+
+def manifest_path(tag: str) -> str:
+    return os.path.join(MANIFESTS_PATH, f"{tag}.json")
+
+def fingerprint(paths: List[str]) -> Optional[str]:
+    """Hashes the names, sizes and modification times of files below `paths`.
+
+    Cheap enough for complete frameworks and dSYMs, and changes whenever
+    ninja or the build cache rewrites a product. Returns None if any of
+    the paths is missing.
+    """
+    sha256_hash = hashlib.sha256()
+    for path in paths:
+        if not os.path.exists(path):
+            return None
+        for (dir_path, dir_names, file_names) in os.walk(path):
+            dir_names.sort()
+            for name in sorted(file_names):
+                file_path = os.path.join(dir_path, name)
+                stat = os.lstat(file_path)
+                relative_path = os.path.relpath(file_path, path)
+                sha256_hash.update(f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return sha256_hash.hexdigest()
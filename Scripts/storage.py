@@ -0,0 +1,142 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import stat
+import shutil
+import hashlib
+from typing import Iterator, List, Tuple
+from dataclasses import dataclass
+
+### - CONSTANTS
+
+# Object files and static libraries below ninja's obj/ dirs, only needed
+# to relink a slice.
+INTERMEDIATE_DIRS = ['obj']
+INTERMEDIATE_EXTENSIONS = ('.o', '.a')
+# Directories of ninja build dirs that are never deduplicated (huge and
+# only ever read by ninja itself).
+SKIPPED_DIRS = {'obj', 'gen'}
+HASH_BLOCK_SIZE = 1024 * 1024
+MEGABYTE = 1024 ** 2
+
+### - CLASSES
+
+@dataclass
+class StorageStats:
+    files: int = 0
+    bytes: int = 0
+
+    def __str__(self) -> str:
+        return f"{self.files} files, {self.bytes / MEGABYTE:.1f} MB"
+
+### - FUNCTIONS
+
+def dedupe(paths: List[str]) -> StorageStats:
+    """Hardlinks files with identical contents and permissions below `paths`.
+
+    Files are only compared with files of the same size and replaced
+    atomically. Everything that edits build products (create_fat,
+    plist_editor) writes a new file and replaces the old one, so linked
+    copies never change along with each other. Returns the number of
+    replaced files and the bytes saved.
+    """
+    before = disk_usage(paths)
+    candidates = {}
+    for (path, file_stat) in _files(paths):
+        key = (file_stat.st_dev, file_stat.st_size, stat.S_IMODE(file_stat.st_mode))
+        candidates.setdefault(key, []).append((path, file_stat))
+
+    replaced = 0
+    for (key, files) in candidates.items():
+        if key[1] == 0 or len({file_stat.st_ino for (_, file_stat) in files}) < 2:
+            continue
+        # Content hash by inode, files that are already linked are read once.
+        digests = {}
+        originals = {}
+        for (path, file_stat) in files:
+            if file_stat.st_ino not in digests:
+                digests[file_stat.st_ino] = _hash(path)
+            original = originals.setdefault(digests[file_stat.st_ino], (path, file_stat))
+            if original[1].st_ino == file_stat.st_ino:
+                continue
+            tmp_path = path + '.dedupe'
+            os.link(original[0], tmp_path)
+            os.replace(tmp_path, path)
+            replaced += 1
+
+    return StorageStats(replaced, before - disk_usage(paths))
+
+def prune_intermediates(build_dir: str) -> StorageStats:
+    """Removes object files and static libraries of a ninja build dir.
+
+    The dir stays a valid gn build dir (e.g. for `gn desc`), but the next
+    build of it has to compile everything again.
+    """
+    stats = StorageStats()
+    for name in INTERMEDIATE_DIRS:
+        for (dir_path, _, file_names) in os.walk(os.path.join(build_dir, name)):
+            for file_name in file_names:
+                if not file_name.endswith(INTERMEDIATE_EXTENSIONS):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                stats.bytes += _unlink(path)
+                stats.files += 1
+    return stats
+
+def remove_tree(path: str) -> StorageStats:
+    if not os.path.isdir(path):
+        return StorageStats()
+    stats = StorageStats(
+        sum(1 for _ in _files([path])),
+        disk_usage([path])
+    )
+    shutil.rmtree(path)
+    return stats
+
+def disk_usage(paths: List[str]) -> int:
+    """Bytes used by the files below `paths`, hardlinked files counted once."""
+    inodes = {}
+    for (_, file_stat) in _files(paths):
+        inodes[(file_stat.st_dev, file_stat.st_ino)] = file_stat.st_size
+    return sum(inodes.values())
+
+def _files(paths: List[str]) -> Iterator[Tuple[str, os.stat_result]]:
+    paths = [os.path.abspath(path) for path in paths]
+    # Paths inside of other paths are walked once.
+    paths = [
+        path for path in paths
+        if not any(path.startswith(other + os.sep) for other in paths)
+    ]
+    for path in sorted(set(paths)):
+        for (dir_path, dir_names, file_names) in os.walk(path):
+            dir_names[:] = [name for name in dir_names if name not in SKIPPED_DIRS]
+            for name in file_names:
+                file_path = os.path.join(dir_path, name)
+                file_stat = os.lstat(file_path)
+                if stat.S_ISREG(file_stat.st_mode):
+                    yield (file_path, file_stat)
+
+def _hash(path: str) -> str:
+    sha256_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha256_hash.update(block)
+    return sha256_hash.hexdigest()
+
+def _unlink(path: str) -> int:
+    # Returns the bytes freed, nothing if the file is still linked elsewhere.
+    file_stat = os.lstat(path)
+    os.remove(path)
+    return file_stat.st_size if file_stat.st_nlink == 1 else 0
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import contextlib
+from typing import Any, Dict, Iterator, List, Optional
+from dataclasses import dataclass, asdict, field
+import ninja_log
+
+### - CONSTANTS
+
+CWD_PATH = os.path.dirname(os.path.realpath(__file__))
+HISTORY_PATH = os.path.join(CWD_PATH, '.cache', 'build_history.jsonl')
+SPANS_NAME = 'spans.json'
+TRACE_NAME = 'trace.json'
+NINJA_NAME = 'ninja.json'
+
+### - CLASSES
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    # Seconds since the start of the recorder.
+    start: float
+    duration: float
+    thread: int
+    args: Dict[str, Any] = field(default_factory=dict)
+
+class Recorder:
+    """Collects timing spans of the current process.
+
+    Spans may be recorded from any thread. There is one process-wide
+    recorder (see `span`), so modules can be instrumented without
+    passing it around, just like `logging`.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._origin = time.perf_counter()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    @property
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args) -> Iterator[Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as error:
+            args['error'] = type(error).__name__
+            raise
+        finally:
+            span = Span(
+                name,
+                category,
+                start - self._origin,
+                time.perf_counter() - start,
+                threading.get_ident(),
+                args
+            )
+            with self._lock:
+                self._spans.append(span)
+
+    def totals(self) -> Dict[str, float]:
+        """Sums the durations per `category/name`."""
+        totals = {}
+        for span in self.spans:
+            key = f"{span.category}/{span.name}"
+            totals[key] = totals.get(key, 0) + span.duration
+        return totals
+
+    def export(self, output_dir: str, ninja_summaries: Dict[str, dict]):
+        """Writes spans as JSON, as a Chrome trace and the ninja log summaries."""
+        os.makedirs(output_dir, exist_ok=True)
+        spans = self.spans
+        with open(os.path.join(output_dir, SPANS_NAME), 'w') as f:
+            json.dump({
+                'started': self.started,
+                'spans': [asdict(span) for span in spans]
+            }, f, indent=2)
+        # https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+        threads = sorted({span.thread for span in spans})
+        events = [{
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': int(span.start * 1e6),
+            'dur': int(span.duration * 1e6),
+            'pid': os.getpid(),
+            'tid': threads.index(span.thread),
+            'args': {key: str(value) for (key, value) in span.args.items()}
+        } for span in spans]
+        with open(os.path.join(output_dir, TRACE_NAME), 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        with open(os.path.join(output_dir, NINJA_NAME), 'w') as f:
+            json.dump(ninja_summaries, f, indent=2)
+        logging.info(f"Wrote build telemetry to {output_dir}")
+
+### - FUNCTIONS
+
+_recorder = Recorder()
+
+def recorder() -> Recorder:
+    return _recorder
+
+def span(name: str, category: str, **args):
+    """Context manager timing its block, e.g. `with telemetry.span('gn gen', 'builder'):`."""
+    return _recorder.span(name, category, **args)
+
+def command_name(cmd: List[str]) -> str:
+    # "python .../gn.py gen out" -> "gn.py gen", "git fetch --all" -> "git fetch"
+    words = [os.path.basename(word) for word in cmd if not word.startswith('-')]
+    if words and os.path.basename(sys.executable) == words[0] and len(words) > 1:
+        words = words[1:]
+    return ' '.join(words[:2])
+
+def summarize_ninja_logs(
+    output_paths: List[str],
+    ninja_path: Optional[str] = None
+) -> Dict[str, dict]:
+    """Summarizes the `.ninja_log` of every `<arch>_libs` dir below `output_paths`."""
+    summaries = {}
+    for output_path in output_paths:
+        for (dir_path, dir_names, file_names) in os.walk(output_path):
+            if not os.path.basename(dir_path).endswith('_libs'):
+                continue
+            dir_names.clear()
+            if ninja_log.NINJA_LOG_NAME in file_names:
+                relative_path = os.path.relpath(dir_path, CWD_PATH)
+                summaries[relative_path] = ninja_log.summarize(
+                    dir_path, ninja_path=ninja_path
+                )
+    return summaries
+
+def finish(
+    output_paths: List[str],
+    telemetry_dir: Optional[str],
+    details: Dict[str, Any],
+    ninja_path: Optional[str] = None,
+    history_path: str = HISTORY_PATH
+):
+    """Exports the telemetry of this run and appends it to the build history.
+
+    Called from `finally` blocks, so errors are logged instead of raised
+    and never hide the error of the run itself.
+    """
+    try:
+        _finish(output_paths, telemetry_dir, details, ninja_path, history_path)
+    except Exception as error:
+        logging.warning(f"Recording telemetry failed: {error}")
+
+def read_history(history_path: str = HISTORY_PATH) -> List[dict]:
+    entries = []
+    try:
+        with open(history_path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logging.warning(f"Ignoring malformed line in {history_path}")
+    except FileNotFoundError:
+        pass
+    return entries
+
+def add_telemetry_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--telemetry-dir',
+        type=str,
+        default=None,
+        help='Write timing spans, a Chrome trace and ninja log summaries to this directory.'
+    )
+    parser.add_argument(
+        '--ninja-graph',
+        action='store_true',
+        default=False,
+        help='Compute the exact ninja critical path from the build graph (slow).'
+    )
+
+def _finish(
+    output_paths: List[str],
+    telemetry_dir: Optional[str],
+    details: Dict[str, Any],
+    ninja_path: Optional[str],
+    history_path: str
+):
+    ninja_summaries = summarize_ninja_logs(output_paths, ninja_path)
+    if telemetry_dir is not None:
+        _recorder.export(telemetry_dir, ninja_summaries)
+    entry = dict(details)
+    entry['started'] = _recorder.started
+    entry['duration'] = time.time() - _recorder.started
+    entry['stages'] = {key: round(value, 3) for (key, value) in _recorder.totals().items()}
+    entry['ninja'] = {
+        path: {
+            'duration': summary['duration'],
+            'edges': summary['edges'],
+            'critical_path': summary['critical_path']['duration']
+        }
+        for (path, summary) in ninja_summaries.items()
+    }
+    os.makedirs(os.path.dirname(history_path), exist_ok=True)
+    with open(history_path, 'a') as f:
+        f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+### - SCRIPT ARGUMENTS
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Compare stage timings of previous builds and releases'
+    )
+    parser.add_argument(
+        '--last',
+        type=int,
+        default=10,
+        help='Number of runs to show. Defaults to %(default)s.'
+    )
+    parser.add_argument(
+        '--history',
+        type=str,
+        default=HISTORY_PATH,
+        help='Build history file. Defaults to %(default)s.'
+    )
+    return parser.parse_args()
+
+### - MAIN
+
+def main():
+    args = parse_args()
+    entries = read_history(args.history)[-args.last:]
+    if not entries:
+        print(f"No builds recorded in {args.history}")
+        return 0
+
+    stages = sorted({stage for entry in entries for stage in entry['stages']})
+    columns = [
+        time.strftime('%m-%d %H:%M', time.localtime(entry['started']))
+        + f" m{entry.get('milestone', '?')}"
+        for entry in entries
+    ]
+    width = max(len(stage) for stage in stages + ['total'])
+    print(' ' * width + ''.join(f"{column:>18}" for column in columns))
+    for stage in stages + ['total']:
+        values = [
+            entry['duration'] if stage == 'total' else entry['stages'].get(stage)
+            for entry in entries
+        ]
+        cells = ''.join(
+            f"{'-':>18}" if value is None else f"{value:>17.1f}s" for value in values
+        )
+        print(f"{stage:<{width}}{cells}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import json
+import struct
+import hashlib
+import threading
+import subprocess
+import http.server
+from typing import Callable, Dict, List, Optional
+import macho
+
+### - CONSTANTS
+
+# (cputype, cpusubtype) of the architectures WebRTC is built for.
+ARCHITECTURES = {
+    'arm64': (macho.CPU_TYPE_ARM64, 0),
+    'x86_64': (macho.CPU_TYPE_X86_64, 3),
+}
+SEGMENT_COMMAND_SIZE = 72
+UUID_COMMAND_SIZE = 24
+GIT_ENVIRONMENT = {
+    'GIT_AUTHOR_NAME': 'Test',
+    'GIT_AUTHOR_EMAIL': 'test@example.com',
+    'GIT_COMMITTER_NAME': 'Test',
+    'GIT_COMMITTER_EMAIL': 'test@example.com',
+    'GIT_CONFIG_NOSYSTEM': '1',
+}
+
+### - CLASSES
+
+class GitOrigin:
+    """Bare repository standing in for a remote, with a clone to commit in."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.work_path = path + '.work'
+        self._commits = 0
+        git(['init', '--bare', '--quiet', path])
+        git(['symbolic-ref', 'HEAD', 'refs/heads/main'], path)
+        git(['init', '--quiet', self.work_path])
+        git(['symbolic-ref', 'HEAD', 'refs/heads/main'], self.work_path)
+        git(['remote', 'add', 'origin', path], self.work_path)
+
+    def commit(self, ref: str = 'refs/heads/main') -> str:
+        """Commits a new file on top of the last commit and pushes it to `ref`."""
+        self._commits += 1
+        name = f"file_{self._commits}.txt"
+        with open(os.path.join(self.work_path, name), 'w') as f:
+            f.write(f"{self._commits}\n")
+        git(['add', name], self.work_path)
+        git(['commit', '--quiet', '-m', name], self.work_path)
+        git(['push', '--quiet', '--force', 'origin', f"HEAD:{ref}"], self.work_path)
+        return git(['rev-parse', 'HEAD'], self.work_path)
+
+    def delete(self, ref: str):
+        git(['push', '--quiet', 'origin', f":{ref}"], self.work_path)
+
+class GitHubServer(http.server.ThreadingHTTPServer):
+    """Local stand-in for the GitHub release API of release 1.
+
+    Serves on a thread until `close`. Every request is recorded in
+    `requests`. Replies queued in `replies` answer the next requests
+    instead of the API, as dicts with a `status` and optional `headers`.
+    An upload answered from the queue is still stored with `upload` set
+    to 'stored', or with the wrong digest if it is set to 'corrupt'.
+    Like GitHub, uploads without a Content-Length are rejected.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay: float = 0):
+        super().__init__(('127.0.0.1', 0), _GitHubHandler)
+        self.delay = delay
+        self.replies = []
+        self.requests = []
+        self.assets = {}
+        self.peak_requests = 0
+        self.lock = threading.Lock()
+        self._in_flight = 0
+        self._next_id = 1
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def upload_url(self) -> str:
+        return f"{self.url}/uploads/releases/1/assets{{?name,label}}"
+
+    def add_asset(self, name: str, data: bytes, corrupt: bool = False) -> dict:
+        with self.lock:
+            asset = {
+                'id': self._next_id,
+                'name': name,
+                'url': f"{self.url}/assets/{self._next_id}",
+                'size': len(data),
+                'state': 'uploaded',
+                'digest': f"sha256:{hashlib.sha256(data + (b'!' if corrupt else b'')).hexdigest()}",
+            }
+            self.assets[asset['id']] = asset
+            self._next_id += 1
+            return asset
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+class _GitHubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_PATCH(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+    def _handle(self):
+        server = self.server
+        if self.command == 'POST' and 'Content-Length' not in self.headers:
+            self.close_connection = True
+            self._reply(411, {'message': 'Length Required'})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests.append((self.command, self.path))
+            reply = server.replies.pop(0) if server.replies else None
+            server._in_flight += 1
+            server.peak_requests = max(server.peak_requests, server._in_flight)
+        try:
+            # Not time.sleep, which tests of retries replace.
+            threading.Event().wait(server.delay)
+            if reply is None:
+                self._reply(*self._route(body))
+                return
+            if reply.get('upload') is not None:
+                server.add_asset(self._name(), body, corrupt=reply['upload'] == 'corrupt')
+            self._reply(reply['status'], {'message': 'stub'}, reply.get('headers', {}))
+        finally:
+            with server.lock:
+                server._in_flight -= 1
+
+    def _route(self, body: bytes) -> tuple:
+        server = self.server
+        path = self.path.split('?')[0]
+        if self.command == 'POST' and path == '/uploads/releases/1/assets':
+            return (201, server.add_asset(self._name(), body))
+        if self.command == 'GET' and path == '/releases/1/assets':
+            with server.lock:
+                return (200, list(server.assets.values()))
+        if self.command == 'PATCH' and path == '/releases/1':
+            return (200, dict(json.loads(body), id=1))
+        match = re.fullmatch(r'/assets/(\d+)', path)
+        if self.command == 'DELETE' and match is not None:
+            with server.lock:
+                asset = server.assets.pop(int(match.group(1)), None)
+            return (404, {'message': 'Not Found'}) if asset is None else (204, None)
+        return (404, {'message': 'Not Found'})
+
+    def _name(self) -> str:
+        match = re.search(r'name=([^&]+)', self.path)
+        return match.group(1) if match else ''
+
+    def _reply(self, status: int, body, headers: Optional[dict] = None):
+        data = b'' if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        for (name, value) in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+### - FUNCTIONS
+
+def thin_macho(
+    architecture: str,
+    filetype: int = macho.MH_DYLIB,
+    uuid: Optional[str] = None,
+    segments: Optional[Dict[str, int]] = None,
+    payload: Optional[Callable[[str, int], bytes]] = None
+) -> bytes:
+    """Returns a thin little-endian 64-bit Mach-O binary.
+
+    It has an LC_UUID (derived from `architecture` unless given, a UUID
+    of '' leaves it out) and one LC_SEGMENT_64 per entry of `segments`
+    with that many bytes of payload, filled by `payload(name, size)` if
+    given.
+    """
+    (cputype, cpusubtype) = ARCHITECTURES[architecture]
+    segments = segments if segments is not None else {'__TEXT': 64, '__LINKEDIT': 32}
+    if uuid is None:
+        uuid = hashlib.md5(architecture.encode()).hexdigest()
+    uuid = uuid.replace('-', '')
+
+    commands = b''
+    if uuid:
+        commands += struct.pack('<II16s', macho.LC_UUID, UUID_COMMAND_SIZE, bytes.fromhex(uuid))
+    offset = macho.MACH_HEADER_64_SIZE + len(commands) + len(segments) * SEGMENT_COMMAND_SIZE
+    contents = b''
+    for (name, size) in segments.items():
+        commands += struct.pack(
+            '<II16sQQQQiiII',
+            macho.LC_SEGMENT_64, SEGMENT_COMMAND_SIZE, name.encode(),
+            offset, size, offset, size, 1, 1, 0, 0
+        )
+        if payload is None:
+            contents += bytes([len(contents) % 251]) * size
+        else:
+            contents += payload(name, size)
+        offset += size
+    header = struct.pack(
+        '<IiiIIIII',
+        macho.MH_MAGIC_64, cputype, cpusubtype, filetype,
+        len(segments) + (1 if uuid else 0), len(commands), 0, 0
+    )
+    return header + commands + contents
+
+def git(args: List[str], cwd: Optional[str] = None) -> str:
+    return subprocess.check_output(
+        ['git'] + args,
+        cwd=cwd,
+        env=dict(os.environ, **GIT_ENVIRONMENT),
+        text=True
+    ).strip()
+
+def write_file(path: str, contents: bytes, mode: int = 0o644) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(contents)
+    os.chmod(path, mode)
+    return path
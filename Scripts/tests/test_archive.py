@@ -0,0 +1,158 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import stat
+import random
+import hashlib
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+import archive
+from archive import ZipStream
+from tests.fixtures import write_file
+
+FRAMEWORK = 'WebRTC.framework'
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.root = tmp_dir.name
+        # Small blocks, so that files are deflated in several primed blocks.
+        for patcher in [
+            mock.patch.object(archive, 'BLOCK_SIZE', 4096),
+            mock.patch.dict(os.environ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop('SOURCE_DATE_EPOCH', None)
+
+        generator = random.Random(0)
+        block = generator.randbytes(2048)
+        self.binary = b''.join(block + generator.randbytes(1024) for _ in range(12))
+        self.files = {
+            f"{FRAMEWORK}/Versions/A/WebRTC": self.binary,
+            f"{FRAMEWORK}/Versions/A/Headers/WebRTC.h": b'#import <WebRTC/RTCStub.h>\n' * 100,
+            f"{FRAMEWORK}/Versions/A/Resources/Info.plist": b'',
+        }
+        for (path, contents) in self.files.items():
+            write_file(os.path.join(self.root, path), contents)
+        os.chmod(os.path.join(self.root, FRAMEWORK, 'Versions', 'A', 'WebRTC'), 0o700)
+        self.links = {
+            f"{FRAMEWORK}/Versions/Current": 'A',
+            f"{FRAMEWORK}/WebRTC": 'Versions/Current/WebRTC',
+        }
+        for (path, target) in self.links.items():
+            os.symlink(target, os.path.join(self.root, path))
+
+    def write(self, **kwargs) -> bytes:
+        output = io.BytesIO()
+        archive.write_zip(self.root, [FRAMEWORK], output, **kwargs)
+        return output.getvalue()
+
+class ArchiveTests(ArchiveTestCase):
+    def test_round_trip(self):
+        with zipfile.ZipFile(io.BytesIO(self.write())) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            names = zip_file.namelist()
+            self.assertEqual(names, sorted(names))
+            self.assertIn(f"{FRAMEWORK}/Versions/A/Headers/", names)
+            for (path, contents) in self.files.items():
+                self.assertEqual(zip_file.read(path), contents)
+            info = zip_file.getinfo(f"{FRAMEWORK}/Versions/A/WebRTC")
+            self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(info.external_attr >> 16, stat.S_IFREG | 0o755)
+            self.assertEqual(info.date_time, (1980, 1, 1, 0, 0, 0))
+
+    def test_symlinks(self):
+        with zipfile.ZipFile(io.BytesIO(self.write())) as zip_file:
+            for (path, target) in self.links.items():
+                info = zip_file.getinfo(path)
+                self.assertTrue(stat.S_ISLNK(info.external_attr >> 16))
+                self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+                self.assertEqual(zip_file.read(path), target.encode())
+
+    def test_reproducible(self):
+        data = self.write(threads=1)
+        self.assertEqual(self.write(threads=4), data)
+        # Modification times and permissions beyond the executable bit are ignored.
+        for path in self.files:
+            os.utime(os.path.join(self.root, path), (1700000000, 1700000000))
+        os.chmod(os.path.join(self.root, FRAMEWORK, 'Versions', 'A', 'WebRTC'), 0o750)
+        self.assertEqual(self.write(threads=3), data)
+
+    def test_source_date_epoch(self):
+        with mock.patch.dict(os.environ, {'SOURCE_DATE_EPOCH': '1700000000'}):
+            data = self.write(threads=1)
+            self.assertEqual(self.write(threads=4), data)
+        with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+            for info in zip_file.infolist():
+                self.assertEqual(info.date_time, (2023, 11, 14, 22, 13, 20))
+        self.assertNotEqual(self.write(), data)
+        # Timestamps before 1980 can not be stored.
+        with mock.patch.dict(os.environ, {'SOURCE_DATE_EPOCH': '0'}):
+            early = self.write()
+        self.assertEqual(early, self.write())
+
+    def test_compress_level(self):
+        stored = self.write(compress_level=0)
+        self.assertGreater(len(stored), len(self.write()))
+        with zipfile.ZipFile(io.BytesIO(stored)) as zip_file:
+            self.assertEqual(zip_file.read(f"{FRAMEWORK}/Versions/A/WebRTC"), self.binary)
+
+    def test_zip64(self):
+        with mock.patch.object(archive, 'ZIP64_LIMIT', 1024):
+            data = self.write()
+        self.assertIn(archive.ZIP64_END_SIGNATURE.to_bytes(4, 'little'), data)
+        with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            for (path, contents) in self.files.items():
+                self.assertEqual(zip_file.read(path), contents)
+            info = zip_file.getinfo(f"{FRAMEWORK}/Versions/A/WebRTC")
+            self.assertEqual(info.file_size, len(self.binary))
+            # Offsets past the limit are stored in the zip64 extra field too.
+            self.assertGreater(zip_file.infolist()[-1].header_offset, 1024)
+
+class ZipStreamTests(ArchiveTestCase):
+    def stream(self, spill: bool) -> ZipStream:
+        spill_path = os.path.join(self.root, 'WebRTC.zip') if spill else None
+        return ZipStream(self.root, [FRAMEWORK], spill_path, threads=2)
+
+    def test_stream(self):
+        for spill in [True, False]:
+            with self.subTest(spill=spill):
+                stream = self.stream(spill)
+                self.assertFalse(stream.complete)
+                with self.assertRaises(RuntimeError):
+                    len(stream)
+                stream.prepare()
+
+                data = b''.join(stream)
+                self.assertEqual(len(stream), len(data))
+                self.assertEqual(stream.checksum, hashlib.sha256(data).hexdigest())
+                self.assertEqual(data, self.write())
+                # Retries yield the same archive again.
+                self.assertEqual(b''.join(stream), data)
+
+    def test_changed_after_prepare(self):
+        stream = self.stream(spill=False).prepare()
+        write_file(os.path.join(self.root, FRAMEWORK, 'Versions', 'A', 'WebRTC'), b'changed')
+        with self.assertRaises(RuntimeError):
+            b''.join(stream)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import plistlib
+import tempfile
+import threading
+import unittest
+from typing import Dict, List, Optional
+import macho
+import artifacts
+from artifacts import ValidationError
+from xcframework import Library, create_xcframework
+from tests.fixtures import thin_macho, write_file
+
+IDENTIFIER = 'ios-arm64_x86_64-simulator'
+ARCHITECTURES = ['arm64', 'x86_64']
+VERSION = '120.0.6099'
+
+class ValidateXCFrameworkTests(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = tmp_dir.name
+        self.xcframework_path = os.path.join(self.tmp_path, 'WebRTC.xcframework')
+
+    def fat_binary(self, path: str, slices: Dict[str, bytes]) -> str:
+        thin_paths = [
+            write_file(f"{path}.{architecture}", contents)
+            for (architecture, contents) in slices.items()
+        ]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        macho.create_fat(thin_paths, path)
+        for thin_path in thin_paths:
+            os.remove(thin_path)
+        return path
+
+    def create(
+        self,
+        architectures: List[str] = ARCHITECTURES,
+        filetype: int = macho.MH_DYLIB,
+        version: Optional[str] = VERSION,
+        dsym_uuids: Optional[Dict[str, str]] = None,
+        dsyms: bool = True
+    ):
+        framework_path = os.path.join(self.tmp_path, 'slices', 'WebRTC.framework')
+        self.fat_binary(
+            os.path.join(framework_path, 'WebRTC'),
+            {architecture: thin_macho(architecture, filetype) for architecture in architectures}
+        )
+        info = {'CFBundleExecutable': 'WebRTC', artifacts.COMMIT_KEY: 'abc'}
+        if version is not None:
+            info.update({key: version for key in artifacts.VERSION_KEYS})
+        write_file(os.path.join(framework_path, 'Info.plist'), plistlib.dumps(info))
+
+        dsym_path = None
+        if dsyms:
+            dsym_uuids = dsym_uuids or {}
+            dsym_path = os.path.join(self.tmp_path, 'slices', 'WebRTC.framework.dSYM')
+            self.fat_binary(
+                os.path.join(dsym_path, 'Contents', 'Resources', 'DWARF', 'WebRTC'),
+                {
+                    architecture: thin_macho(architecture, macho.MH_DSYM, dsym_uuids.get(architecture))
+                    for architecture in architectures
+                }
+            )
+        # The Info.plist always lists both architectures, like the expected slices.
+        create_xcframework(
+            self.xcframework_path,
+            [Library(framework_path, 'ios', 'simulator', ARCHITECTURES, dsym_path)]
+        )
+
+    def validate(self, dsyms: bool = True):
+        artifacts.validate_xcframework(
+            self.xcframework_path, {IDENTIFIER: ARCHITECTURES}, VERSION, dsyms
+        )
+
+    def assertInvalid(self, message: str, dsyms: bool = True):
+        with self.assertRaises(ValidationError) as context:
+            self.validate(dsyms)
+        self.assertIn(message, str(context.exception))
+
+    def test_valid(self):
+        self.create()
+        self.validate()
+
+    def test_valid_without_dsyms(self):
+        self.create(dsyms=False)
+        self.validate(dsyms=False)
+        self.assertInvalid('expected one dSYM, found 0')
+
+    def test_missing_library(self):
+        self.create()
+        with self.assertRaises(ValidationError) as context:
+            artifacts.validate_xcframework(
+                self.xcframework_path,
+                {IDENTIFIER: ARCHITECTURES, 'ios-arm64': ['arm64']},
+                VERSION,
+                True
+            )
+        self.assertIn('ios-arm64: missing library', str(context.exception))
+
+    def test_missing_architecture(self):
+        self.create(architectures=['arm64'])
+        self.assertInvalid("WebRTC has ['arm64'], expected ['arm64', 'x86_64']")
+
+    def test_wrong_filetype(self):
+        self.create(filetype=macho.MH_DSYM)
+        self.assertInvalid(f"WebRTC (arm64) has file type {macho.MH_DSYM}")
+
+    def test_unstamped_version(self):
+        self.create(version=None)
+        self.assertInvalid(f"CFBundleVersion is None, expected {VERSION!r}")
+
+    def test_uuid_mismatch(self):
+        uuid = '00112233-4455-6677-8899-aabbccddeeff'
+        self.create(dsym_uuids={'x86_64': uuid})
+        self.assertInvalid(f"x86_64 dSYM UUID {uuid.upper()} does not match")
+
+    def test_missing_uuid(self):
+        self.create(dsym_uuids={'arm64': ''})
+        self.assertInvalid('WebRTC (arm64) has no LC_UUID')
+
+class ValidateDSYMsTests(ValidateXCFrameworkTests):
+    def create(self, dsym_uuids: Optional[Dict[str, str]] = None, **kwargs):
+        super().create(dsym_uuids=dsym_uuids, **kwargs)
+        # Moves the dSYMs of the xcframework into a standalone bundle.
+        self.dsyms_path = os.path.join(self.tmp_path, 'dSYMs')
+        library_path = os.path.join(self.xcframework_path, IDENTIFIER)
+        os.makedirs(self.dsyms_path)
+        if os.path.isdir(os.path.join(library_path, 'dSYMs')):
+            os.rename(
+                os.path.join(library_path, 'dSYMs'),
+                os.path.join(self.dsyms_path, IDENTIFIER)
+            )
+
+    def validate(self, dsyms: bool = True):
+        binary_path = os.path.join(self.xcframework_path, IDENTIFIER, 'WebRTC.framework', 'WebRTC')
+        artifacts.validate_dsyms(
+            self.dsyms_path, {IDENTIFIER: binary_path}, {IDENTIFIER: ARCHITECTURES}
+        )
+
+    def test_valid_without_dsyms(self):
+        self.create(dsyms=False)
+        self.assertInvalid('expected one dSYM, found 0')
+
+    def test_missing_library(self):
+        self.create()
+        os.makedirs(os.path.join(self.dsyms_path, 'ios-arm64'))
+        self.assertInvalid('ios-arm64: unexpected dSYM')
+
+    def test_unstamped_version(self):
+        # The version is only checked in xcframeworks.
+        self.create(version=None)
+        self.validate()
+
+class SizeHistoryTests(unittest.TestCase):
+    def test_concurrent_records(self):
+        with tempfile.TemporaryDirectory() as tmp_path:
+            history_path = os.path.join(tmp_path, 'history', 'sizes.jsonl')
+            report = {IDENTIFIER: {'arm64': {'size': 1024, 'segments': {'__TEXT': 512}}}}
+            threads = [
+                threading.Thread(
+                    target=artifacts.record_sizes,
+                    args=(f"bundle-{index}", VERSION, report, history_path)
+                )
+                for index in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            entries = artifacts.read_size_history(history_path)
+            self.assertEqual(
+                sorted(entry['bundle'] for entry in entries),
+                [f"bundle-{index}" for index in range(8)]
+            )
+            self.assertTrue(all(entry['sizes'] == report for entry in entries))
+
+if __name__ == '__main__':
+    unittest.main()
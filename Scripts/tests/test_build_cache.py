@@ -0,0 +1,163 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from typing import Optional
+import build_cache
+from build_cache import BuildCache, LocalRemote
+from tests.fixtures import write_file
+
+PRODUCT = 'WebRTC.framework'
+
+class BuildCacheTests(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = tmp_dir.name
+        self.output_path = os.path.join(self.tmp_path, 'out')
+        self.cache = BuildCache(os.path.join(self.tmp_path, 'cache'))
+
+    def build(self, contents: bytes):
+        shutil.rmtree(os.path.join(self.output_path, PRODUCT), ignore_errors=True)
+        write_file(os.path.join(self.output_path, PRODUCT, 'WebRTC'), contents)
+        os.symlink('WebRTC', os.path.join(self.output_path, PRODUCT, 'Current'))
+
+    def read(self, output_path: str) -> bytes:
+        with open(os.path.join(output_path, PRODUCT, 'WebRTC'), 'rb') as f:
+            return f.read()
+
+    def store(self, key: str, contents: bytes, mtime: int):
+        self.build(contents)
+        self.cache.store(key, self.output_path, [PRODUCT], {'key': key})
+        os.utime(self.cache._entry_path(key), (mtime, mtime))
+
+    def test_key(self):
+        key = BuildCache.key('abc\n', ['b=1', 'a=2'], 'framework_objc', 'arm64')
+        self.assertEqual(key, BuildCache.key('abc', ['a=2', 'b=1'], 'framework_objc', 'arm64'))
+        self.assertNotEqual(key, BuildCache.key('abc', ['a=2', 'b=1'], 'framework_objc', 'x64'))
+
+    def test_store_and_restore(self):
+        key = 'aa' + '0' * 62
+        self.assertFalse(self.cache.restore(key, self.output_path, [PRODUCT]))
+        self.store(key, b'slice', 1)
+
+        restored_path = os.path.join(self.tmp_path, 'restored')
+        self.assertTrue(self.cache.restore(key, restored_path, [PRODUCT]))
+        self.assertEqual(self.read(restored_path), b'slice')
+        self.assertEqual(os.readlink(os.path.join(restored_path, PRODUCT, 'Current')), 'WebRTC')
+        # A hit counts as a use.
+        self.assertGreater(os.stat(self.cache._entry_path(key)).st_mtime, 1)
+
+    def test_lru_eviction(self):
+        self.cache.max_size = 2500
+        keys = [f"{index:02}" + '0' * 62 for index in range(3)]
+        self.store(keys[0], b'0' * 1000, 100)
+        self.store(keys[1], b'1' * 1000, 200)
+        # The oldest entry is used again and outlives the second one.
+        self.assertTrue(self.cache.restore(keys[0], self.output_path, [PRODUCT]))
+        self.store(keys[2], b'2' * 1000, 300)
+
+        self.assertEqual(
+            sorted(os.path.basename(path) for (_, _, path) in self.cache._entries()),
+            [keys[0], keys[2]]
+        )
+        self.assertLessEqual(self.cache._size, self.cache.max_size)
+
+    def test_remote(self):
+        key = 'bb' + '0' * 62
+        remote = LocalRemote(os.path.join(self.tmp_path, 'remote'))
+        self.cache.remote = remote
+        self.store(key, b'shared', 1)
+        self.assertTrue(os.path.isfile(os.path.join(remote.path, key + '.tar.gz')))
+
+        other = BuildCache(os.path.join(self.tmp_path, 'other'), remote=remote)
+        restored_path = os.path.join(self.tmp_path, 'restored')
+        self.assertTrue(other.restore(key, restored_path, [PRODUCT]))
+        self.assertEqual(self.read(restored_path), b'shared')
+
+    def test_untrusted_remote(self):
+        key = 'cc' + '0' * 62
+        remote = LocalRemote(os.path.join(self.tmp_path, 'remote'))
+        archive_path = os.path.join(remote.path, key + '.tar.gz')
+        os.makedirs(remote.path)
+        with tarfile.open(archive_path, 'w:gz') as tar:
+            add_member(tar, '../escaped', b'x')
+        self.cache.remote = remote
+
+        with self.assertLogs(level='WARNING'):
+            self.assertFalse(self.cache.restore(key, self.output_path, [PRODUCT]))
+        self.assertFalse(os.path.exists(os.path.join(self.cache.path, 'escaped')))
+        self.assertFalse(os.path.isdir(self.cache._entry_path(key)))
+
+class CheckedMembersTests(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.extract_path = os.path.join(tmp_dir.name, 'entry')
+        self.archive = io.BytesIO()
+        self.tar = tarfile.open(fileobj=self.archive, mode='w')
+
+    def checked(self) -> list:
+        self.tar.close()
+        self.archive.seek(0)
+        with tarfile.open(fileobj=self.archive) as tar:
+            return [
+                member.name for member in build_cache._checked_members(tar, self.extract_path)
+            ]
+
+    def test_framework_links(self):
+        add_member(self.tar, 'WebRTC.framework/Versions/A/WebRTC', b'x')
+        add_member(self.tar, 'WebRTC.framework/Versions/Current', link='A')
+        add_member(self.tar, 'WebRTC.framework/WebRTC', link='Versions/Current/WebRTC')
+        self.assertEqual(len(self.checked()), 3)
+
+    def test_path_traversal(self):
+        add_member(self.tar, 'WebRTC.framework/../../escaped', b'x')
+        with self.assertRaises(tarfile.TarError):
+            self.checked()
+
+    def test_absolute_symlink(self):
+        add_member(self.tar, 'WebRTC.framework/WebRTC', link='/etc/passwd')
+        with self.assertRaises(tarfile.TarError):
+            self.checked()
+
+    def test_relative_symlink_outside(self):
+        add_member(self.tar, 'WebRTC.framework/WebRTC', link='../../escaped')
+        with self.assertRaises(tarfile.TarError):
+            self.checked()
+
+    def test_device(self):
+        member = tarfile.TarInfo('null')
+        member.type = tarfile.CHRTYPE
+        self.tar.addfile(member)
+        with self.assertRaises(tarfile.TarError):
+            self.checked()
+
+def add_member(tar: tarfile.TarFile, name: str, contents: bytes = b'', link: Optional[str] = None):
+    member = tarfile.TarInfo(name)
+    if link is not None:
+        member.type = tarfile.SYMTYPE
+        member.linkname = link
+        tar.addfile(member)
+    else:
+        member.size = len(contents)
+        tar.addfile(member, io.BytesIO(contents))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import threading
+import subprocess
+import unittest
+from unittest import mock
+import build_scheduler
+from build_scheduler import BuildScheduler, JobSlot
+from tests.fixtures import write_file
+
+# Records its arguments and prints ninja status lines for 10 edges.
+STUB_NINJA = f"""#!{sys.executable}
+import os, sys, json
+with open(os.environ['STUB_NINJA_ARGS'], 'w') as f:
+    json.dump(sys.argv[1:], f)
+for edge in range(1, 11):
+    print(f"[{{edge}}/10] CXX obj/{{edge}}.o", flush=True)
+sys.exit(int(os.environ.get('STUB_NINJA_EXIT', '0')))
+"""
+
+class JobSlotTests(unittest.TestCase):
+    def slot(self, jobs: int, **kwargs) -> JobSlot:
+        scheduler = BuildScheduler(8, **kwargs)
+        scheduler._free -= jobs
+        return JobSlot(scheduler, 'ios-arm64', jobs)
+
+    def test_ninja_args(self):
+        self.assertEqual(self.slot(4).ninja_args(), ['-j', '4'])
+        self.assertEqual(self.slot(4, load_average=2.5).ninja_args(), ['-j', '4', '-l', '2.5'])
+
+    def test_drain(self):
+        slot = self.slot(4)
+        slot.drain(10)
+        self.assertEqual((slot.jobs, slot.in_tail, slot.scheduler._free), (4, False, 4))
+
+        with self.assertLogs(level='INFO') as logs:
+            slot.drain(3)
+            slot.drain(3)
+            # At least one job is kept until ninja exits.
+            slot.drain(0)
+        self.assertEqual((slot.jobs, slot.in_tail, slot.scheduler._free), (1, True, 7))
+        self.assertEqual(len([line for line in logs.output if 'serial tail' in line]), 1)
+
+    def test_run_ninja(self):
+        with tempfile.TemporaryDirectory() as tmp_path:
+            ninja_path = write_file(os.path.join(tmp_path, 'ninja'), STUB_NINJA.encode(), 0o755)
+            args_path = os.path.join(tmp_path, 'args.json')
+            env = dict(os.environ, STUB_NINJA_ARGS=args_path)
+            slot = self.slot(4, load_average=2.5)
+            cmd = [ninja_path, '-C', 'out/ios-arm64', 'framework_objc']
+            with mock.patch('sys.stdout'):
+                slot.run_ninja(cmd, tmp_path, env)
+            with open(args_path) as f:
+                self.assertEqual(
+                    json.load(f),
+                    ['-j', '4', '-l', '2.5', '-C', 'out/ios-arm64', 'framework_objc']
+                )
+            self.assertEqual(slot.jobs, 1)
+            self.assertTrue(slot.in_tail)
+
+            env['STUB_NINJA_EXIT'] = '1'
+            with mock.patch('sys.stdout'):
+                with self.assertRaises(subprocess.CalledProcessError):
+                    self.slot(4).run_ninja(cmd, tmp_path, env)
+
+class BuildSchedulerTests(unittest.TestCase):
+    def run_tasks(self, scheduler: BuildScheduler, tasks: list):
+        # Runs on a thread, a scheduling bug fails the test instead of hanging it.
+        errors = []
+
+        def run():
+            try:
+                scheduler.run(tasks)
+            except BaseException as error:
+                errors.append(error)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), 'scheduler did not finish')
+        if errors:
+            raise errors[0]
+
+    def test_memory_limit(self):
+        scheduler = BuildScheduler(16, 2, memory_limit=5 * build_scheduler.GIGABYTE)
+        self.assertEqual((scheduler.jobs, scheduler.share), (2, 1))
+
+    def test_shares(self):
+        scheduler = BuildScheduler(8, 2)
+        lock = threading.Lock()
+        jobs = {}
+        running = []
+        peak = []
+
+        def task(slot: JobSlot):
+            with lock:
+                jobs[slot.name] = slot.jobs
+                running.append(slot.name)
+                peak.append(len(running))
+            with lock:
+                running.remove(slot.name)
+
+        self.run_tasks(scheduler, [(name, task) for name in ['a', 'b', 'c']])
+        self.assertEqual(jobs['a'], 4)
+        self.assertLessEqual(max(peak), 2)
+        self.assertEqual(scheduler._free, 8)
+
+    def test_tail_starts_next_build(self):
+        scheduler = BuildScheduler(4, 1)
+        started = threading.Event()
+        jobs = {}
+
+        def first(slot: JobSlot):
+            slot.drain(1)
+            # Only returns once the next build started next to it.
+            self.assertTrue(started.wait(5))
+
+        def second(slot: JobSlot):
+            jobs['second'] = slot.jobs
+            started.set()
+
+        self.run_tasks(scheduler, [('first', first), ('second', second)])
+        self.assertEqual(jobs['second'], 3)
+        self.assertEqual(scheduler._free, 4)
+
+    def test_error(self):
+        scheduler = BuildScheduler(4, 1)
+        ran = []
+
+        def fail(slot: JobSlot):
+            raise subprocess.CalledProcessError(1, ['ninja'])
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.run_tasks(scheduler, [('a', fail), ('b', lambda slot: ran.append(slot))])
+        self.assertEqual(ran, [])
+        self.assertEqual(scheduler._free, 4)
+
+    def test_from_args(self):
+        parser = argparse.ArgumentParser()
+        build_scheduler.add_scheduler_arguments(parser)
+        self.assertIsNone(build_scheduler.scheduler_from_args(parser.parse_args([])))
+        self.assertIsNotNone(build_scheduler.scheduler_from_args(parser.parse_args([]), shared=True))
+        scheduler = build_scheduler.scheduler_from_args(
+            parser.parse_args(['--jobs', '6', '--parallel-builds', '2'])
+        )
+        self.assertEqual((scheduler.jobs, scheduler.max_parallel), (6, 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import concurrent.futures
+import unittest
+from unittest import mock
+import git_cache
+from git_cache import GitCache
+from tests.fixtures import GitOrigin, git
+
+class GitCacheTests(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = tmp_dir.name
+        self.origin = GitOrigin(os.path.join(self.tmp_path, 'origin.git'))
+        # file:// disables the hardlinking of local clones, like a remote.
+        self.url = 'file://' + self.origin.path
+        self.cache = GitCache(os.path.join(self.tmp_path, 'cache'))
+
+    def refs(self, path: str) -> dict:
+        output = git(['for-each-ref', '--format=%(refname) %(objectname)'], path)
+        return dict(line.split(' ') for line in output.splitlines())
+
+    def alternates(self, checkout_path: str) -> list:
+        path = os.path.join(checkout_path, '.git', 'objects', 'info', 'alternates')
+        with open(path) as f:
+            return f.read().split()
+
+    def test_update(self):
+        first = self.origin.commit()
+        self.origin.commit('refs/heads/feature')
+        mirror_path = self.cache.update(self.url)
+
+        self.assertEqual(mirror_path, self.cache.mirror_path(self.url))
+        self.assertEqual(git(['rev-parse', '--is-bare-repository'], mirror_path), 'true')
+        self.assertEqual(self.refs(mirror_path), {
+            'refs/heads/main': first,
+            'refs/heads/feature': git(['rev-parse', 'HEAD'], self.origin.work_path)
+        })
+
+        # New commits are fetched and deleted branches pruned.
+        self.origin.delete('refs/heads/feature')
+        second = self.origin.commit()
+        self.assertEqual(self.cache.update(self.url), mirror_path)
+        self.assertEqual(self.refs(mirror_path), {'refs/heads/main': second})
+
+    def test_update_refspecs(self):
+        main = self.origin.commit()
+        branch_head = self.origin.commit('refs/branch-heads/1')
+        refspecs = {self.url: git_cache.DEFAULT_REFSPECS + ['+refs/branch-heads/*:refs/branch-heads/*']}
+        with mock.patch.object(git_cache, 'MIRROR_REFSPECS', refspecs):
+            mirror_path = self.cache.update(self.url)
+        self.assertEqual(self.refs(mirror_path), {
+            'refs/heads/main': main,
+            'refs/branch-heads/1': branch_head
+        })
+
+        # Only refs/heads/* without extra refspecs.
+        other_cache = GitCache(os.path.join(self.tmp_path, 'other'))
+        self.assertEqual(self.refs(other_cache.update(self.url)), {'refs/heads/main': main})
+
+    def test_concurrent_update(self):
+        commit = self.origin.commit()
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(self.cache.update, self.url) for _ in range(8)]
+            paths = {future.result() for future in futures}
+
+        (mirror_path,) = paths
+        self.assertEqual(self.refs(mirror_path), {'refs/heads/main': commit})
+        refspecs = git(['config', '--get-all', 'remote.origin.fetch'], mirror_path)
+        self.assertEqual(refspecs.splitlines(), git_cache.DEFAULT_REFSPECS)
+
+    def test_clone(self):
+        commit = self.origin.commit()
+        checkout_path = os.path.join(self.tmp_path, 'checkout')
+        self.cache.clone(self.url, checkout_path)
+
+        self.assertEqual(git(['rev-parse', 'HEAD'], checkout_path), commit)
+        self.assertEqual(git(['remote', 'get-url', 'origin'], checkout_path), self.url)
+        mirror_objects = os.path.join(self.cache.mirror_path(self.url), 'objects')
+        self.assertEqual(self.alternates(checkout_path), [mirror_objects])
+        # Every object is borrowed, none was copied into the checkout.
+        count = git(['count-objects', '-v'], checkout_path)
+        self.assertIn('count: 0', count.splitlines())
+        self.assertIn('in-pack: 0', count.splitlines())
+
+    def test_borrow(self):
+        self.origin.commit()
+        checkout_path = os.path.join(self.tmp_path, 'checkout')
+        git(['clone', '--quiet', self.url, checkout_path])
+        self.cache.borrow(checkout_path, self.url)
+        self.cache.borrow(checkout_path, self.url)
+
+        mirror_objects = os.path.join(self.cache.mirror_path(self.url), 'objects')
+        self.assertEqual(self.alternates(checkout_path), [mirror_objects])
+        commit = self.origin.commit()
+        git(['fetch', '--quiet', 'origin'], checkout_path)
+        self.assertEqual(git(['rev-parse', 'origin/main'], checkout_path), commit)
+        git(['fsck', '--connectivity-only'], checkout_path)
+
+    def test_refresh(self):
+        self.origin.commit()
+        # A gclient mirror, named and created by depot_tools.
+        dependency = GitOrigin(os.path.join(self.tmp_path, 'dependency.git'))
+        dependency.commit()
+        gclient_mirror = os.path.join(self.cache.path, 'example.com-dependency')
+        git(['clone', '--quiet', '--mirror', dependency.path, gclient_mirror])
+
+        with mock.patch.object(git_cache, 'MIRROR_URLS', [self.url]):
+            self.cache.refresh()
+            self.assertEqual(self.cache.mirrors(), {
+                self.cache.mirror_path(self.url): self.url,
+                gclient_mirror: dependency.path
+            })
+            main = self.origin.commit()
+            dependency_main = dependency.commit()
+            self.cache.refresh()
+
+        self.assertEqual(self.refs(self.cache.mirror_path(self.url)), {'refs/heads/main': main})
+        self.assertEqual(self.refs(gclient_mirror)['refs/heads/main'], dependency_main)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import hashlib
+import unittest
+from unittest import mock
+import github_client
+from github_client import GitHubClient, GitHubError
+from tests.fixtures import GitHubServer
+
+class Body:
+    """Upload body that knows its size and checksum, like a prepared ZipStream."""
+
+    complete = True
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.checksum = hashlib.sha256(data).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __iter__(self):
+        yield self.data
+
+class GitHubClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = GitHubServer()
+        self.addCleanup(self.server.close)
+        self.client = GitHubClient(self.server.url, 'token', max_retries=3)
+        self.addCleanup(self.client.session.close)
+        patcher = mock.patch.object(github_client.time, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def delays(self) -> list:
+        return [call.args[0] for call in self.sleep.call_args_list]
+
+    def upload(self, data: bytes) -> dict:
+        return self.client.upload_asset(self.server.upload_url, 1, 'WebRTC.zip', lambda: Body(data))
+
+    def test_retry_server_errors(self):
+        self.server.replies = [{'status': 502}, {'status': 503}]
+        response = self.client.update_release(1, {'draft': False})
+        self.assertEqual(response, {'id': 1, 'draft': False})
+        self.assertEqual(self.delays(), [1, 2])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_give_up(self):
+        self.server.replies = [{'status': 500}] * 4
+        with self.assertRaises(GitHubError):
+            self.client.update_release(1, {})
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_client_errors(self):
+        self.server.replies = [{'status': 422}]
+        with self.assertRaises(GitHubError):
+            self.client.update_release(1, {})
+        # A 403 without rate limit headers is a permission problem.
+        self.server.replies = [{'status': 403}]
+        with self.assertRaises(GitHubError):
+            self.client.update_release(1, {})
+        self.assertEqual(self.delays(), [])
+
+    def test_retry_after(self):
+        for status in [429, 403]:
+            with self.subTest(status=status):
+                self.sleep.reset_mock()
+                self.server.replies = [{'status': status, 'headers': {'Retry-After': '7'}}]
+                self.client.update_release(1, {})
+                self.assertEqual(self.delays(), [7])
+
+    def test_rate_limit_reset(self):
+        reset = int(time.time()) + 30
+        self.server.replies = [{
+            'status': 403,
+            'headers': {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(reset)}
+        }]
+        self.client.update_release(1, {})
+        (delay,) = self.delays()
+        self.assertTrue(25 <= delay <= 30, delay)
+
+    def test_rate_limit_wait_is_capped(self):
+        self.server.replies = [{'status': 429, 'headers': {'Retry-After': '86400'}}]
+        self.client.update_release(1, {})
+        self.assertEqual(self.delays(), [github_client.MAX_RATE_LIMIT_WAIT])
+
+    def test_upload(self):
+        asset = self.upload(b'archive')
+        self.assertEqual(asset['size'], 7)
+        self.assertEqual(list(self.server.assets.values()), [asset])
+
+    def test_upload_dropped_but_stored(self):
+        self.server.replies = [{'status': 502, 'upload': 'stored'}]
+        asset = self.upload(b'archive')
+        self.assertEqual(asset['digest'], f"sha256:{hashlib.sha256(b'archive').hexdigest()}")
+        self.assertEqual(len(self.server.assets), 1)
+        self.assertEqual(
+            [method for (method, _) in self.server.requests], ['POST', 'GET']
+        )
+
+    def test_upload_dropped_and_corrupt(self):
+        self.server.replies = [{'status': 502, 'upload': 'corrupt'}]
+        asset = self.upload(b'archive')
+        self.assertEqual(list(self.server.assets.values()), [asset])
+        self.assertEqual(asset['id'], 2)
+        self.assertEqual(
+            [method for (method, _) in self.server.requests], ['POST', 'GET', 'DELETE', 'POST']
+        )
+
+    def test_upload_failure(self):
+        self.server.replies = [{'status': 422}]
+        with self.assertRaises(GitHubError):
+            self.upload(b'archive')
+
+    def test_delete_assets(self):
+        self.server.delay = 0.05
+        assets = [self.server.add_asset(f"WebRTC-{index}.zip", b'archive') for index in range(6)]
+        # Already deleted assets are skipped.
+        self.server.assets.pop(assets[0]['id'])
+        client = GitHubClient(self.server.url, None, max_workers=3)
+        self.addCleanup(client.session.close)
+        client.delete_assets(assets)
+
+        self.assertEqual(self.server.assets, {})
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertGreater(self.server.peak_requests, 1)
+        self.assertLessEqual(self.server.peak_requests, 3)
+
+if __name__ == '__main__':
+    unittest.main()
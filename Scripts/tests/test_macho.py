@@ -0,0 +1,185 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import stat
+import struct
+import tempfile
+import unittest
+from unittest import mock
+import macho
+from tests.fixtures import thin_macho, write_file
+
+class CreateFatTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmp_dir.name, name)
+
+    def read(self, path: str):
+        with macho.map_file(path) as buffer:
+            (magic,) = struct.unpack_from('>I', buffer, 0)
+            slices = macho.read_slices(buffer, path)
+            contents = {
+                thin.architecture: bytes(buffer[thin.offset:thin.offset + thin.size])
+                for thin in slices
+            }
+        return (magic, slices, contents)
+
+    def test_thin_inputs(self):
+        arm64 = thin_macho('arm64')
+        x86_64 = thin_macho('x86_64', segments={'__TEXT': 5000})
+        inputs = [
+            write_file(self.path('arm64'), arm64, 0o755),
+            write_file(self.path('x86_64'), x86_64, 0o755)
+        ]
+        macho.create_fat(inputs, self.path('fat'))
+
+        (magic, slices, contents) = self.read(self.path('fat'))
+        self.assertEqual(magic, macho.FAT_MAGIC)
+        # Sorted by alignment like lipo, x86_64 (2^12) before arm64 (2^14).
+        self.assertEqual([thin.architecture for thin in slices], ['x86_64', 'arm64'])
+        self.assertEqual([thin.offset for thin in slices], [1 << 12, 1 << 14])
+        for thin in slices:
+            self.assertEqual(thin.offset % (1 << thin.alignment), 0)
+            self.assertEqual(thin.filetype, macho.MH_DYLIB)
+        self.assertEqual(contents, {'arm64': arm64, 'x86_64': x86_64})
+        self.assertEqual(stat.S_IMODE(os.stat(self.path('fat')).st_mode), 0o755)
+
+    def test_fat_input(self):
+        arm64 = thin_macho('arm64', macho.MH_DSYM)
+        x86_64 = thin_macho('x86_64', macho.MH_DSYM)
+        write_file(self.path('arm64'), arm64)
+        macho.create_fat([self.path('arm64')], self.path('arm64_fat'))
+        macho.create_fat(
+            [self.path('arm64_fat'), write_file(self.path('x86_64'), x86_64)],
+            self.path('fat')
+        )
+
+        (_, slices, contents) = self.read(self.path('fat'))
+        self.assertEqual(contents, {'arm64': arm64, 'x86_64': x86_64})
+        self.assertEqual({thin.filetype for thin in slices}, {macho.MH_DSYM})
+
+    def test_alignment_after_large_slice(self):
+        x86_64 = thin_macho('x86_64', segments={'__TEXT': (1 << 14) + 1})
+        arm64 = thin_macho('arm64')
+        inputs = [
+            write_file(self.path('x86_64'), x86_64),
+            write_file(self.path('arm64'), arm64)
+        ]
+        macho.create_fat(inputs, self.path('fat'))
+
+        (_, slices, contents) = self.read(self.path('fat'))
+        (x86_64_slice, arm64_slice) = slices
+        self.assertEqual(x86_64_slice.offset, 1 << 12)
+        self.assertEqual(arm64_slice.offset, 2 << 14)
+        self.assertEqual(contents, {'arm64': arm64, 'x86_64': x86_64})
+        with open(self.path('fat'), 'rb') as f:
+            data = f.read()
+        # Padding between the slices is zeroed.
+        self.assertEqual(set(data[(1 << 12) + len(x86_64):2 << 14]), {0})
+
+    def test_64_bit_fat_header(self):
+        # Slices ending past 4 GB need the 64-bit fat format, lower the
+        # limit instead of writing gigabytes.
+        arm64 = thin_macho('arm64')
+        x86_64 = thin_macho('x86_64')
+        inputs = [
+            write_file(self.path('arm64'), arm64),
+            write_file(self.path('x86_64'), x86_64)
+        ]
+        with mock.patch.object(macho, 'UINT32_MAX', 1 << 14):
+            macho.create_fat(inputs, self.path('fat'))
+
+        (magic, slices, contents) = self.read(self.path('fat'))
+        self.assertEqual(magic, macho.FAT_MAGIC_64)
+        self.assertEqual([thin.offset for thin in slices], [1 << 12, 1 << 14])
+        self.assertEqual(contents, {'arm64': arm64, 'x86_64': x86_64})
+
+    def test_32_bit_fat_header_at_limit(self):
+        arm64 = thin_macho('arm64')
+        path = write_file(self.path('arm64'), arm64)
+        with mock.patch.object(macho, 'UINT32_MAX', (1 << 14) + len(arm64)):
+            macho.create_fat([path], self.path('fat'))
+
+        (magic, _, contents) = self.read(self.path('fat'))
+        self.assertEqual(magic, macho.FAT_MAGIC)
+        self.assertEqual(contents, {'arm64': arm64})
+
+    def test_layout(self):
+        sources = [
+            (None, None, macho.MachOSlice(macho.CPU_TYPE_X86_64, 3, macho.MH_DYLIB, 0, 5 << 30)),
+            (None, None, macho.MachOSlice(macho.CPU_TYPE_ARM64, 0, macho.MH_DYLIB, 0, 100))
+        ]
+        (offsets, end) = macho._layout(sources, macho.FAT_ARCH_64_FORMAT)
+        self.assertEqual(offsets, [1 << 12, (5 << 30) + (1 << 14)])
+        self.assertEqual(end, offsets[1] + 100)
+
+    def test_duplicate_architecture(self):
+        inputs = [
+            write_file(self.path('a'), thin_macho('arm64')),
+            write_file(self.path('b'), thin_macho('arm64', uuid='00' * 16))
+        ]
+        with self.assertRaisesRegex(macho.MachOError, 'same architecture'):
+            macho.create_fat(inputs, self.path('fat'))
+        self.assertFalse(os.path.exists(self.path('fat')))
+
+    def test_mixed_filetypes(self):
+        inputs = [
+            write_file(self.path('arm64'), thin_macho('arm64')),
+            write_file(self.path('x86_64'), thin_macho('x86_64', macho.MH_DSYM))
+        ]
+        with self.assertRaisesRegex(macho.MachOError, 'Mixed Mach-O file types'):
+            macho.create_fat(inputs, self.path('fat'))
+
+    def test_unsupported_inputs(self):
+        arm64 = bytearray(thin_macho('arm64'))
+        cases = {
+            'cputype': (struct.pack('<i', 18), 4, 'unsupported CPU type'),
+            'cpusubtype': (struct.pack('<i', 7), 8, 'unsupported CPU subtype'),
+            '32-bit': (struct.pack('<I', macho.MH_MAGIC), 0, '32-bit'),
+            'magic': (b'\0\0\0\0', 0, 'not a Mach-O binary'),
+        }
+        for (name, (value, offset, message)) in cases.items():
+            with self.subTest(name):
+                data = bytearray(arm64)
+                data[offset:offset + len(value)] = value
+                path = write_file(self.path(name), bytes(data))
+                with self.assertRaisesRegex(macho.MachOError, message):
+                    macho.create_fat([path], self.path('fat'))
+
+class LoadCommandTests(unittest.TestCase):
+    def test_uuid_and_segments(self):
+        data = thin_macho(
+            'arm64',
+            uuid='0123456789abcdef0123456789abcdef',
+            segments={'__TEXT': 100, '__DATA': 20, '__LINKEDIT': 10}
+        )
+        thin = macho.read_slices(data)[0]
+        self.assertEqual(thin.architecture, 'arm64')
+        self.assertEqual(thin.size, len(data))
+        self.assertEqual(macho.read_uuid(data, thin), '01234567-89AB-CDEF-0123-456789ABCDEF')
+        self.assertEqual(
+            macho.read_segments(data, thin),
+            {'__TEXT': 100, '__DATA': 20, '__LINKEDIT': 10}
+        )
+
+    def test_missing_uuid(self):
+        data = thin_macho('x86_64', uuid='')
+        self.assertIsNone(macho.read_uuid(data, macho.read_slices(data)[0]))
+
+if __name__ == '__main__':
+    unittest.main()
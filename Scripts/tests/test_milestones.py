@@ -0,0 +1,148 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+from typing import Optional
+import requests
+import milestones
+from milestones import MilestoneError, MilestoneResolver
+
+STABLE_RELEASES = [
+    {'milestone': 121, 'schedule_phase': 'beta', 'webrtc_branch': '6167'},
+    {'milestone': 120, 'schedule_phase': 'stable', 'webrtc_branch': '6099'},
+]
+
+def response(status: int = 200, body=None, etag: Optional[str] = None) -> mock.Mock:
+    result = mock.Mock(status_code=status, headers={'ETag': etag} if etag else {})
+    result.json.return_value = body
+    if status >= 400:
+        result.raise_for_status.side_effect = requests.HTTPError(f"{status}")
+    return result
+
+class MilestoneResolverTests(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = tmp_dir.name
+        self.cache_path = os.path.join(self.tmp_path, 'cache', 'milestones.json')
+        patcher = mock.patch.object(milestones.requests, 'get')
+        self.get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def resolver(self, **kwargs) -> MilestoneResolver:
+        return MilestoneResolver(self.cache_path, **kwargs)
+
+    def cache(self) -> dict:
+        with open(self.cache_path) as f:
+            return json.load(f)
+
+    def test_stable_milestone(self):
+        self.get.return_value = response(body=STABLE_RELEASES, etag='"v1"')
+        resolver = self.resolver()
+        self.assertEqual(resolver.stable_milestone(), '120')
+        # The branch of the stable milestone comes with it.
+        self.assertEqual(resolver.branch('120'), '6099')
+        self.assertEqual(self.get.call_count, 1)
+        self.assertEqual(self.cache()['stable']['etag'], '"v1"')
+
+        # Cached for the TTL, also by other resolvers.
+        self.assertEqual(self.resolver().stable_milestone(), '120')
+        self.assertEqual(self.get.call_count, 1)
+
+    def test_revalidation(self):
+        self.get.return_value = response(body=STABLE_RELEASES, etag='"v1"')
+        self.resolver(stable_ttl=0).stable_milestone()
+        fetched = self.cache()['stable']['fetched']
+
+        self.get.return_value = response(304)
+        self.assertEqual(self.resolver(stable_ttl=0).stable_milestone(), '120')
+        self.assertEqual(self.get.call_args.kwargs['headers'], {'If-None-Match': '"v1"'})
+        self.assertGreaterEqual(self.cache()['stable']['fetched'], fetched)
+
+        releases = [dict(STABLE_RELEASES[0], schedule_phase='stable')]
+        self.get.return_value = response(body=releases, etag='"v2"')
+        self.assertEqual(self.resolver(stable_ttl=0).stable_milestone(), '121')
+        self.assertEqual(self.cache()['stable']['etag'], '"v2"')
+
+    def test_offline(self):
+        self.get.side_effect = requests.ConnectionError('offline')
+        with self.assertRaises(MilestoneError):
+            self.resolver().stable_milestone()
+
+        self.get.side_effect = None
+        self.get.return_value = response(body=STABLE_RELEASES)
+        self.resolver(stable_ttl=0).stable_milestone()
+        self.get.side_effect = requests.ConnectionError('offline')
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(self.resolver(stable_ttl=0).stable_milestone(), '120')
+
+    def test_branch(self):
+        self.get.return_value = response(body=[{'milestone': 119, 'webrtc_branch': 6045}])
+        self.assertEqual(self.resolver().branch(119), '6045')
+        self.assertEqual(self.get.call_args.kwargs['params'], {'mstone': '119'})
+        # Branches never change and are cached forever.
+        self.assertEqual(self.resolver(stable_ttl=0).branch('119'), '6045')
+        self.assertEqual(self.get.call_count, 1)
+
+    def test_missing_branch(self):
+        self.get.return_value = response(body=[{'milestone': 125, 'webrtc_branch': None}])
+        resolver = self.resolver()
+        with self.assertRaises(MilestoneError):
+            resolver.branch('125')
+        self.assertFalse(os.path.exists(self.cache_path))
+
+        # Asked again once it is branched.
+        self.get.return_value = response(body=[{'milestone': 125, 'webrtc_branch': '6422'}])
+        self.assertEqual(resolver.branch('125'), '6422')
+        self.assertEqual(self.cache()['branches'], {'125': '6422'})
+
+    def test_legacy_none_branch(self):
+        os.makedirs(os.path.dirname(self.cache_path))
+        with open(self.cache_path, 'w') as f:
+            json.dump({'branches': {'125': 'None'}}, f)
+        self.get.return_value = response(body=[{'milestone': 125, 'webrtc_branch': '6422'}])
+        self.assertEqual(self.resolver().branch('125'), '6422')
+        self.assertEqual(self.get.call_count, 1)
+
+    def test_branch_errors(self):
+        for result in [response(500), response(body=[])]:
+            with self.subTest(result=result):
+                self.get.return_value = result
+                with self.assertRaises(MilestoneError):
+                    self.resolver().branch('120')
+
+    def test_pins(self):
+        pin_path = os.path.join(self.tmp_path, 'pins.json')
+        with open(pin_path, 'w') as f:
+            json.dump({'stable': 118, 'branches': {'118': 5993}}, f)
+        resolver = self.resolver(pin_path=pin_path)
+        self.assertEqual(resolver.stable_milestone(), '118')
+        self.assertEqual(resolver.branch('118'), '5993')
+        self.get.assert_not_called()
+
+    def test_malformed_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path))
+        with open(self.cache_path, 'w') as f:
+            f.write('{')
+        self.get.return_value = response(body=STABLE_RELEASES)
+        with self.assertLogs(level='WARNING'):
+            resolver = self.resolver()
+        self.assertEqual(resolver.stable_milestone(), '120')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import threading
+import unittest
+from pipeline import Pipeline, PipelineError
+
+class PipelineTests(unittest.TestCase):
+    def run_pipeline(self, pipeline: Pipeline, items) -> list:
+        # Fails instead of hanging when a stage never stops.
+        outcome = []
+
+        def run():
+            try:
+                outcome.append(pipeline.run(items))
+            except BaseException as error:
+                outcome.append(error)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), 'The pipeline did not finish.')
+        if isinstance(outcome[0], BaseException):
+            raise outcome[0]
+        return outcome[0]
+
+    def test_multiple_workers(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def upload(item: int) -> int:
+            with lock:
+                active.append(item)
+                peak.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.remove(item)
+            return item * 10
+
+        pipeline = Pipeline([
+            ('build', lambda item: item + 1),
+            ('upload', upload, 3)
+        ], queue_size=4)
+        self.assertEqual(
+            self.run_pipeline(pipeline, range(12)),
+            [item * 10 for item in range(1, 13)]
+        )
+        self.assertGreater(max(peak), 1)
+
+    def test_multiple_workers_in_every_stage(self):
+        pipeline = Pipeline([
+            ('build', lambda item: item, 2),
+            ('package', lambda item: item, 3),
+            ('upload', lambda item: item, 4)
+        ])
+        self.assertEqual(self.run_pipeline(pipeline, range(5)), list(range(5)))
+        self.assertEqual(self.run_pipeline(pipeline, []), [])
+
+    def test_failure(self):
+        processed = []
+
+        def package(item: int) -> int:
+            if item == 1:
+                raise ValueError('broken bundle')
+            return item
+
+        pipeline = Pipeline([
+            ('package', package),
+            ('upload', processed.append, 2)
+        ])
+        with self.assertRaises(PipelineError) as context:
+            self.run_pipeline(pipeline, range(4))
+        self.assertEqual(context.exception.stage, 'package')
+        self.assertIsInstance(context.exception.error, ValueError)
+        self.assertNotIn(1, processed)
+
+if __name__ == '__main__':
+    unittest.main()
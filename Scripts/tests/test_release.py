@@ -0,0 +1,80 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import release
+from release import Asset, ReleaseDetails
+from tests.fixtures import GIT_ENVIRONMENT, GitOrigin, git
+
+class PublishReleaseTests(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.origin = GitOrigin(os.path.join(tmp_dir.name, 'origin.git'))
+        self.origin.commit()
+        self.root_path = self.origin.work_path
+        for patcher in [
+            mock.patch.object(release, 'ROOT_PATH', self.root_path),
+            mock.patch.dict(os.environ, GIT_ENVIRONMENT),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = mock.Mock()
+        self.details = ReleaseDetails('120', '6099', 'abc', '120.0.6099')
+        self.assets = [Asset('WebRTC.zip', '0' * 64, 1024)]
+
+    def update_package(self):
+        with open(os.path.join(self.root_path, 'Package.swift'), 'w') as f:
+            f.write('// 120.0.6099\n')
+
+    def test_publish(self):
+        self.update_package()
+        release.publish_release(self.client, 1, self.details, self.assets)
+
+        self.assertEqual(git(['log', '-1', '--format=%s', 'main'], self.origin.path), '"Release M120"')
+        self.client.update_release.assert_called_once()
+        (id, parameters) = self.client.update_release.call_args.args
+        self.assertEqual(id, 1)
+        self.assertFalse(parameters['draft'])
+        self.assertIn(self.details.asset_url(self.assets[0]), parameters['body'])
+
+    def test_resume_after_commit(self):
+        # Interrupted after the commit, before the push.
+        self.update_package()
+        git(['add', '.'], self.root_path)
+        git(['commit', '--quiet', '-m', 'Release M120'], self.root_path)
+        release.publish_release(self.client, 1, self.details, self.assets)
+
+        self.assertEqual(
+            git(['rev-parse', 'main'], self.origin.path),
+            git(['rev-parse', 'HEAD'], self.root_path)
+        )
+        self.client.update_release.assert_called_once()
+
+    def test_resume_after_push(self):
+        # Interrupted after the push, before the release was published.
+        self.update_package()
+        release.publish_release(mock.Mock(), 1, self.details, self.assets)
+        head = git(['rev-parse', 'HEAD'], self.root_path)
+        release.publish_release(self.client, 1, self.details, self.assets)
+
+        self.assertEqual(git(['rev-parse', 'HEAD'], self.root_path), head)
+        self.assertEqual(git(['rev-parse', 'main'], self.origin.path), head)
+        self.client.update_release.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
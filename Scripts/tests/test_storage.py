@@ -0,0 +1,112 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import storage
+from storage import StorageStats
+from tests.fixtures import write_file
+
+class StorageTests(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.root = tmp_dir.name
+
+    def path(self, *names: str) -> str:
+        return os.path.join(self.root, *names)
+
+    def inode(self, *names: str) -> int:
+        return os.lstat(self.path(*names)).st_ino
+
+    def test_dedupe(self):
+        binary = b'\xcf\xfa\xed\xfe' * 256
+        for name in ['ios', 'simulator', 'bundle']:
+            write_file(self.path(name, 'WebRTC.framework', 'WebRTC'), binary)
+        write_file(self.path('ios', 'WebRTC.framework', 'Info.plist'), b'ios')
+        write_file(self.path('simulator', 'WebRTC.framework', 'Info.plist'), b'sim')
+        # Same contents, different permissions.
+        write_file(self.path('tool'), binary, 0o755)
+        write_file(self.path('empty'), b'')
+        write_file(self.path('empty_too'), b'')
+
+        stats = storage.dedupe([self.root])
+        self.assertEqual(stats, StorageStats(2, 2 * len(binary)))
+        inodes = {
+            self.inode(name, 'WebRTC.framework', 'WebRTC') for name in ['ios', 'simulator', 'bundle']
+        }
+        self.assertEqual(len(inodes), 1)
+        self.assertNotEqual(self.inode('tool'), self.inode('ios', 'WebRTC.framework', 'WebRTC'))
+        self.assertNotEqual(self.inode('empty'), self.inode('empty_too'))
+        self.assertNotEqual(
+            self.inode('ios', 'WebRTC.framework', 'Info.plist'),
+            self.inode('simulator', 'WebRTC.framework', 'Info.plist')
+        )
+        # Already linked files are left alone.
+        self.assertEqual(storage.dedupe([self.root]), StorageStats(0, 0))
+
+    def test_dedupe_skips_ninja_dirs(self):
+        for name in ['obj', 'gen']:
+            write_file(self.path('out', name, 'stub.o'), b'object')
+        write_file(self.path('out', 'stub.o'), b'object')
+        self.assertEqual(storage.dedupe([self.path('out')]), StorageStats(0, 0))
+        self.assertNotEqual(self.inode('out', 'obj', 'stub.o'), self.inode('out', 'gen', 'stub.o'))
+
+    def test_dedupe_nested_paths(self):
+        write_file(self.path('a', 'WebRTC'), b'binary')
+        write_file(self.path('a', 'b', 'WebRTC'), b'binary')
+        stats = storage.dedupe([self.path('a', 'b'), self.path('a'), self.path('a')])
+        self.assertEqual(stats, StorageStats(1, 6))
+
+    def test_dedupe_replaces_atomically(self):
+        write_file(self.path('a'), b'binary')
+        write_file(self.path('b'), b'binary')
+        with mock.patch.object(storage.os, 'replace', wraps=os.replace) as replace:
+            storage.dedupe([self.root])
+        # Linked next to the duplicate first, then moved over it.
+        ((source, destination),) = [call.args for call in replace.call_args_list]
+        self.assertEqual(source, destination + '.dedupe')
+        self.assertFalse(os.path.exists(source))
+        self.assertEqual(self.inode('a'), self.inode('b'))
+
+    def test_disk_usage(self):
+        write_file(self.path('a'), b'x' * 100)
+        os.link(self.path('a'), self.path('b'))
+        os.symlink('a', self.path('c'))
+        self.assertEqual(storage.disk_usage([self.root]), 100)
+
+    def test_prune_intermediates(self):
+        write_file(self.path('out', 'obj', 'sdk', 'a.o'), b'x' * 10)
+        write_file(self.path('out', 'obj', 'sdk', 'libsdk.a'), b'x' * 20)
+        write_file(self.path('out', 'obj', 'sdk', 'sdk.ninja'), b'build')
+        write_file(self.path('out', 'WebRTC.framework', 'WebRTC.o'), b'x')
+        # Still linked into a cache entry.
+        os.link(self.path('out', 'obj', 'sdk', 'a.o'), self.path('cached.o'))
+
+        stats = storage.prune_intermediates(self.path('out'))
+        self.assertEqual(stats, StorageStats(2, 20))
+        self.assertTrue(os.path.exists(self.path('out', 'obj', 'sdk', 'sdk.ninja')))
+        self.assertTrue(os.path.exists(self.path('out', 'WebRTC.framework', 'WebRTC.o')))
+
+    def test_remove_tree(self):
+        write_file(self.path('out', 'a'), b'x' * 10)
+        write_file(self.path('out', 'b', 'c'), b'x' * 5)
+        self.assertEqual(storage.remove_tree(self.path('out')), StorageStats(2, 15))
+        self.assertFalse(os.path.exists(self.path('out')))
+        self.assertEqual(storage.remove_tree(self.path('out')), StorageStats())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,19 +16,38 @@
 
 import sys
 import os
+import re
 import logging
+import json
 import shutil
+import hashlib
+import tempfile
 import subprocess
-from typing import List
-from dataclasses import dataclass
-
-os.environ['PATH'] = '/usr/libexec' + os.pathsep + os.environ['PATH']
+import concurrent.futures
+from typing import List, Optional, Set, Tuple
+from dataclasses import dataclass, field
+from functools import cached_property
+import macho
+import artifacts
+import plist_editor
+import storage
+import xcframework
+import telemetry
+from build_cache import BuildCache
+from compiler_cache import CompilerCache
+from build_scheduler import BuildScheduler, JobSlot
 
 ### - CONSTANTS
 
+CWD_PATH = os.path.dirname(os.path.realpath(__file__))
+LICENSE_CACHE_PATH = os.path.join(CWD_PATH, '.cache', 'licenses')
 FRAMEWORK_NAME = 'WebRTC.framework'
 DSYM_NAME = 'WebRTC.dSYM'
 XCFRAMEWORK_NAME = 'WebRTC.xcframework'
+DSYMS_BUNDLE_NAME = 'WebRTC.dSYMs'
+CACHED_PRODUCTS = [FRAMEWORK_NAME, DSYM_NAME]
+# gn target_cpu -> Mach-O architecture
+MACHO_ARCHITECTURES = {'arm64': 'arm64', 'x64': 'x86_64'}
 
 ### - CLASSES
 
@@ -43,6 +62,39 @@ class Platform:
         is_mac = self.environment == 'mac'
         return 'mac_framework_objc' if is_mac else 'framework_objc'
 
+    @property
+    def xcframework_platform(self) -> str:
+        return 'macos' if self.environment == 'mac' else 'ios'
+
+    @property
+    def xcframework_variant(self) -> Optional[str]:
+        if self.environment == 'simulator':
+            return 'simulator'
+        elif self.environment == 'catalyst':
+            return 'maccatalyst'
+        return None
+
+@dataclass(eq=False)
+class BuildSlice:
+    platform: Platform
+    architecture: str
+    gn_args: List[str]
+    lib_path: str
+
+    @property
+    def key(self) -> Tuple:
+        return (
+            self.platform.environment, 
+            self.architecture, 
+            tuple(sorted(self.gn_args))
+        )
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, BuildSlice) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
 @dataclass
 class WebRTCBuilder:
     run_path: str
@@ -51,41 +103,204 @@ class WebRTCBuilder:
     dsyms: bool
     platform_names: List[str]
     version_number: str
+    cache: Optional[BuildCache] = None
+    incremental: bool = False
+    scheduler: Optional[BuildScheduler] = None
+    compiler_cache: Optional[CompilerCache] = None
+    license_cache_path: str = LICENSE_CACHE_PATH
+    _built_slices: Set[Tuple] = field(default_factory=set, init=False, repr=False)
 
     @property
     def xcframework_path(self) -> str:
         return os.path.join(self.output_path, XCFRAMEWORK_NAME)
+
+    @cached_property
+    def _commit(self) -> str:
+        cmd = ['git', 'rev-parse', 'HEAD']
+        return subprocess.check_output(cmd, cwd=self.run_path).decode('utf-8').strip()
     
     ### - Public
 
     def build(self):
-        platforms = [self._parse_platform(name) for name in self.platform_names]
-        platform_paths = []
-        target_lib_paths = dict()
-    
+        if self.compiler_cache is not None:
+            compiler_cache_stats = self.compiler_cache.stats()
+
         # 1. Build libs for all selected platforms
+        self.build_platforms(self.platform_names)
+
+        # 2. Create xcframework and generate the license file
+        self.create_bundle(self.output_path, self.platform_names, self.dsyms)
+
+        # 3. Drop intermediates and hardlink duplicates
+        self.compact([self.xcframework_path])
+        
+        if self.compiler_cache is not None:
+            self.compiler_cache.report(compiler_cache_stats)
+        logging.info('Done.')
+
+    def plan(self, platform_names: List[str]) -> List[BuildSlice]:
+        slices = []
+        for name in platform_names:
+            platform = self._parse_platform(name)
+            platform_path = self._platform_path(platform)
+            for architecture in platform.architectures:
+                build_slice = BuildSlice(
+                    platform,
+                    architecture,
+                    self._gn_args(platform, architecture),
+                    os.path.join(platform_path, architecture + '_libs')
+                )
+                if build_slice not in slices:
+                    slices.append(build_slice)
+        return slices
+
+    def build_platforms(self, platform_names: List[str]):
+        slices = self.plan(platform_names)
+        platforms = []
+
+        # 1. Build WebRTC dylibs, skipping slices built by an earlier call
+        slices_to_build = []
+        for build_slice in slices:
+            if build_slice.key in self._built_slices:
+                continue
+            slices_to_build.append(build_slice)
+            if build_slice.platform not in platforms:
+                platforms.append(build_slice.platform)
+        # Slices restored from an earlier run may not have been merged yet.
+        for build_slice in slices:
+            merged_path = os.path.join(self._platform_path(build_slice.platform), FRAMEWORK_NAME)
+            if build_slice.platform not in platforms and not os.path.isdir(merged_path):
+                platforms.append(build_slice.platform)
+
+        if self.scheduler is None:
+            for build_slice in slices_to_build:
+                self._build_slice(build_slice)
+        else:
+            if self.cache is not None:
+                # Resolve the commit before builds start on worker threads.
+                _ = self._commit
+            self.scheduler.run([
+                (
+                    f"{s.platform.environment}-{s.architecture}", 
+                    lambda slot, s=s: self._build_slice(s, slot)
+                )
+                for s in slices_to_build
+            ])
+        self._built_slices.update(s.key for s in slices_to_build)
+
+        # 2. Merge the slices of every platform that has been (re)built
+        platform_paths = []
         for platform in platforms:
-            platform_path = os.path.join(self.output_path, platform.environment)
+            platform_path = self._platform_path(platform)
             platform_paths.append(platform_path)
-            gn_target_name = platform.gn_target_name
-            lib_paths = self._build_libs(platform, platform_path)
+            lib_paths = [s.lib_path for s in slices if s.platform == platform]
+            self._assemble_platform(platform, platform_path, lib_paths)
+
+        # 3. Stamp version number and provenance of all merged frameworks
+        self._set_version_number(platform_paths)
+
+    def create_dsyms_bundle(self, output_path: str, platform_names: List[str]):
+        """Collects the dSYMs of merged platforms for a separate debug symbols asset.
 
+        Every dSYM is placed in `WebRTC.dSYMs/<library identifier>`, the
+        identifier of its framework in the xcframeworks.
+        """
+        platforms = [self._parse_platform(name) for name in platform_names]
+        dsyms_path = os.path.join(output_path, DSYMS_BUNDLE_NAME)
+        shutil.rmtree(dsyms_path, ignore_errors = True)
+        binaries = {}
+        expected = {}
+        for platform in platforms:
+            platform_path = self._platform_path(platform)
+            (identifier, architectures) = self._library_identifier(platform)
+            xcframework.place(
+                os.path.join(platform_path, DSYM_NAME),
+                os.path.join(dsyms_path, identifier, DSYM_NAME)
+            )
+            binaries[identifier] = os.path.join(platform_path, FRAMEWORK_NAME, 'WebRTC')
+            expected[identifier] = architectures
+        with telemetry.span('validate dsyms', 'builder', path=dsyms_path):
+            artifacts.validate_dsyms(dsyms_path, binaries, expected)
+
+    def compact(self, bundle_paths: Optional[List[str]] = None):
+        """Reduces the disk footprint of the outputs once all bundles are created.
+
+        Unless incremental, per-arch dSYMs that were merged into a platform
+        dSYM are removed. Identical files of slices and `bundle_paths` are
+        hardlinked; ninja build dirs of an incremental build are left
+        alone, so their timestamps stay valid for the next build.
+        """
+        pruned = storage.StorageStats()
+        roots = list(bundle_paths or [])
+        platform_paths = []
+        for build_slice in self.plan(self.platform_names):
+            platform_path = self._platform_path(build_slice.platform)
+            if platform_path not in platform_paths:
+                platform_paths.append(platform_path)
+            merged_path = os.path.join(platform_path, DSYM_NAME)
+            if not self.incremental and os.path.isdir(merged_path):
+                stats = storage.remove_tree(os.path.join(build_slice.lib_path, DSYM_NAME))
+                pruned.files += stats.files
+                pruned.bytes += stats.bytes
+        if self.incremental:
+            roots += [
+                os.path.join(path, product) for path in platform_paths for product in CACHED_PRODUCTS
+            ]
+        else:
+            roots.append(self.output_path)
+        with telemetry.span('dedupe', 'builder'):
+            deduped = storage.dedupe(roots)
+        logging.info(
+            f"Pruned dSYM copies ({pruned}), hardlinked {deduped.files} duplicate files "
+            f"({deduped.bytes / storage.MEGABYTE:.1f} MB saved)."
+        )
+
+    def restore_slices(self, slices: List[BuildSlice]):
+        """Marks slices built by an earlier run as built, e.g. when resuming a release."""
+        self._built_slices.update(s.key for s in slices)
+
+    def create_bundle(self, output_path: str, platform_names: List[str], dsyms: bool):
+        platforms = [self._parse_platform(name) for name in platform_names]
+        target_lib_paths = dict()
+
+        for build_slice in self.plan(platform_names):
+            gn_target_name = build_slice.platform.gn_target_name
             if target_lib_paths.get(gn_target_name) is None:
                 target_lib_paths[gn_target_name] = []
-        
-            target_lib_paths[gn_target_name] += lib_paths
+            target_lib_paths[gn_target_name].append(build_slice.lib_path)
 
-        # 2. Create xcframework
-        self._create_xcframework(platform_paths)
-
-        # 3. Generate the license file
-        self._generate_license(target_lib_paths)
-        
-        logging.info('Done.')
+        xcframework_path = os.path.join(output_path, XCFRAMEWORK_NAME)
+        # License generation (on a cache miss) overlaps with the assembly.
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            license_future = executor.submit(self._cached_license, target_lib_paths)
+            with telemetry.span('create xcframework', 'builder', path=xcframework_path):
+                self._create_xcframework(xcframework_path, platforms, dsyms)
+            license_path = license_future.result()
+        for name in sorted(os.listdir(license_path)):
+            shutil.copyfile(os.path.join(license_path, name), os.path.join(xcframework_path, name))
+        with telemetry.span('validate xcframework', 'builder', path=xcframework_path):
+            self._validate_xcframework(xcframework_path, platforms, dsyms)
 
     def clean(self):
-        logging.info(f"Deleting {self.output_path}")
-        shutil.rmtree(self.output_path, ignore_errors = True)
+        self._built_slices.clear()
+        if not self.incremental:
+            logging.info(f"Deleting {self.output_path}")
+            shutil.rmtree(self.output_path, ignore_errors = True)
+            return
+
+        # Keep the "<arch>_libs" ninja dirs, remove assembled products only.
+        logging.info(f"Deleting assembled products in {self.output_path}")
+        if not os.path.isdir(self.output_path):
+            return
+        for name in os.listdir(self.output_path):
+            path = os.path.join(self.output_path, name)
+            if name == XCFRAMEWORK_NAME:
+                shutil.rmtree(path, ignore_errors = True)
+            elif name.endswith('.zip'):
+                os.remove(path)
+            elif os.path.isdir(path):
+                for product in [FRAMEWORK_NAME, DSYM_NAME]:
+                    shutil.rmtree(os.path.join(path, product), ignore_errors = True)
 
     ### - Private
 
@@ -137,30 +352,10 @@ class WebRTCBuilder:
         else:
             raise NotImplementedError
             
-    def _build_libs(self, platform: str, platform_path: str) -> List[str]:
-        lib_paths = []
-    
-        # 1. Build WebRTC dylibs
-        for architecture in platform.architectures:
-            lib_path = os.path.join(platform_path, architecture + '_libs')
-            lib_paths.append(lib_path)
-            self._build_dlyb(platform, architecture, lib_path)            
-        
-        # 2. Merge dylibs
-        logging.info(f"Merging dylibs for {platform.environment}.")
-        self._merge_dylibs(platform_path, lib_paths)
-        
-        # 3. Merge dsyms if needed
-        if self.dsyms:
-            logging.info(f"Merging dsyms for {platform.environment}.")
-            self._merge_dsyms(platform_path, lib_paths)
-        
-        # 4. Set version number
-        self._set_version_number(platform_path)
+    def _platform_path(self, platform: Platform) -> str:
+        return os.path.join(self.output_path, platform.environment)
 
-        return lib_paths
-
-    def _build_dlyb(self, platform: Platform, architecture: str, lib_path: str):
+    def _gn_args(self, platform: Platform, architecture: str) -> List[str]:
         gn_args = []
         if platform.environment == 'mac':
             gn_args = self._mac_gn_args(
@@ -173,11 +368,74 @@ class WebRTCBuilder:
                 platform.environment,
                 platform.deployment_target
             )
-        gn_args += self._common_gn_args
-        self._build_webrtc(gn_args, platform.gn_target_name, lib_path)
+        return gn_args + self._common_gn_args
+            
+    def _assemble_platform(
+        self, 
+        platform: Platform, 
+        platform_path: str, 
+        lib_paths: List[str]
+    ):
+        # 1. Merge dylibs
+        logging.info(f"Merging dylibs for {platform.environment}.")
+        with telemetry.span('merge dylibs', 'builder', platform=platform.environment):
+            self._merge_dylibs(platform_path, lib_paths)
+        
+        # 2. Merge dsyms if needed
+        if self.dsyms:
+            logging.info(f"Merging dsyms for {platform.environment}.")
+            with telemetry.span('merge dsyms', 'builder', platform=platform.environment):
+                self._merge_dsyms(platform_path, lib_paths)
+
+    def _build_slice(self, build_slice: BuildSlice, slot: Optional[JobSlot] = None):
+        gn_target_name = build_slice.platform.gn_target_name
+        if self.cache is None:
+            self._gn_gen(build_slice.gn_args, build_slice.lib_path)
+            self._ninja(gn_target_name, build_slice.lib_path, slot)
+            self._prune_slice(build_slice)
+            return
+
+        key = self.cache.key(
+            self._commit,
+            build_slice.gn_args,
+            gn_target_name,
+            build_slice.architecture
+        )
+        # The lib dir still has to be a valid gn build dir,
+        # "generate_licenses.py" runs "gn desc" on it.
+        self._gn_gen(build_slice.gn_args, build_slice.lib_path)
+        if self.cache.restore(key, build_slice.lib_path, CACHED_PRODUCTS):
+            logging.info(f"Restored {gn_target_name} ({build_slice.architecture}) from cache.")
+            return
+
+        self._ninja(gn_target_name, build_slice.lib_path, slot)
+        self.cache.store(key, build_slice.lib_path, CACHED_PRODUCTS, {
+            'commit': self._commit,
+            'gn_args': build_slice.gn_args,
+            'gn_target_name': gn_target_name,
+            'architecture': build_slice.architecture
+        })
+        self._prune_slice(build_slice)
+
+    def _prune_slice(self, build_slice: BuildSlice):
+        # Object files are only needed to relink the slice incrementally.
+        if self.incremental:
+            return
+        stats = storage.prune_intermediates(build_slice.lib_path)
+        logging.info(f"Pruned intermediates of {build_slice.lib_path} ({stats}).")
 
-    def _build_webrtc(self, gn_args: List[str], gn_target_name: str, output_dir: str):
+    def _gn_gen(self, gn_args: List[str], output_dir: str):
+        # cc_wrapper does not change the build products, so it is not part
+        # of the slice's gn args (and of its artifact cache key).
+        if self.compiler_cache is not None:
+            gn_args = gn_args + self.compiler_cache.gn_args
         args_string = ' '.join(gn_args)
+        args_path = os.path.join(output_dir, 'args.gn')
+        if self.incremental and os.path.exists(args_path):
+            with open(args_path) as f:
+                if _parse_gn_args(f.read()) == _parse_gn_args(args_string):
+                    logging.info(f"Reusing gn build dir {output_dir}")
+                    return
         
         logging.info(f"Building WebRTC with args: {args_string}")
         self._run([
@@ -187,21 +445,33 @@ class WebRTCBuilder:
             output_dir,
             f"--args={args_string}"
         ])
-        
+
+    def _ninja(
+        self, 
+        gn_target_name: str, 
+        output_dir: str, 
+        slot: Optional[JobSlot] = None
+    ):
         logging.info(f"Building target: {gn_target_name}")
-        self._run([
+        cmd = [
             os.path.join(self.depot_tools_path, 'ninja'),
             '-C',
             output_dir,
             gn_target_name
-        ])
+        ]
+        with telemetry.span('ninja', 'builder', target=gn_target_name, dir=output_dir):
+            if slot is None:
+                self._run(cmd)
+            else:
+                slot.run_ninja(cmd, self.run_path, self._environment)
 
     def _merge_dylibs(self, platform_path: str, lib_paths: List[str]):
         dylib_path = os.path.join(FRAMEWORK_NAME, 'WebRTC')
-        shutil.copytree(
+        # Headers and resources are hardlinked, the binary is replaced below.
+        shutil.rmtree(os.path.join(platform_path, FRAMEWORK_NAME), ignore_errors = True)
+        xcframework.place(
             os.path.join(lib_paths[0], FRAMEWORK_NAME),
-            os.path.join(platform_path, FRAMEWORK_NAME),
-            symlinks=True
+            os.path.join(platform_path, FRAMEWORK_NAME)
         )
         in_dylib_paths = [os.path.join(path, dylib_path) for path in lib_paths]
         out_dylib_path = os.path.join(platform_path, dylib_path)
@@ -210,61 +480,155 @@ class WebRTCBuilder:
                 os.path.dirname(out_dylib_path),
                 os.readlink(out_dylib_path)
             )
-        self._run(['lipo'] + in_dylib_paths + ['-create', '-output', out_dylib_path])
+        macho.create_fat(in_dylib_paths, out_dylib_path)
 
     def _merge_dsyms(self, platform_path: str, lib_paths: List[str]):
         dsym_dir_path = os.path.join(lib_paths[0], DSYM_NAME)
         if os.path.isdir(dsym_dir_path):
             logging.info('Merging dSYMs.')
-            shutil.copytree(
+            shutil.rmtree(os.path.join(platform_path, DSYM_NAME), ignore_errors = True)
+            xcframework.place(
                 dsym_dir_path,
                 os.path.join(platform_path, DSYM_NAME)
             )
             dsym_path = os.path.join(DSYM_NAME, 'Contents', 'Resources', 'DWARF', 'WebRTC')
             in_dsym_paths = [os.path.join(path, dsym_path) for path in lib_paths]
             out_dsym_path = os.path.join(platform_path, dsym_path)
-            self._run(['lipo'] + in_dsym_paths + ['-create', '-output', out_dsym_path])
+            macho.create_fat(in_dsym_paths, out_dsym_path)
 
-    def _set_version_number(self, platform_path: str):
-        resources_dir = os.path.join(platform_path, FRAMEWORK_NAME, 'Resources')
-        if not os.path.exists(resources_dir):
-            resources_dir = os.path.dirname(resources_dir)
-        infoplist_path = os.path.join(resources_dir, 'Info.plist')
-        
+    def _set_version_number(self, platform_paths: List[str]):
         logging.info(f"Setting version number: {self.version_number}")
-        self._run([
-            'PlistBuddy', '-c', 'Set :CFBundleVersion ' + self.version_number,
-            infoplist_path
-        ])
-        self._run([
-            'PlistBuddy', '-c', 'Set :CFBundleShortVersionString ' + self.version_number,
-            infoplist_path
-        ])
-        self._run(['plutil', '-convert', 'binary1', infoplist_path])
-
-    def _create_xcframework(self, platform_paths: List[str]):
-        logging.info('Creating xcframework.')
-        command = ['xcodebuild', '-create-xcframework', '-output', self.xcframework_path]
+        plist_editor.stamp_frameworks(
+            [os.path.join(path, FRAMEWORK_NAME) for path in platform_paths],
+            {
+                'CFBundleVersion': self.version_number,
+                'CFBundleShortVersionString': self.version_number,
+                'WebRTCCommit': self._commit
+            }
+        )
 
-        for platform_path in platform_paths:
-            command += ['-framework', os.path.join(platform_path, FRAMEWORK_NAME)]
+    def _create_xcframework(
+        self, 
+        xcframework_path: str, 
+        platforms: List[Platform], 
+        dsyms: bool
+    ):
+        libraries = []
+        for platform in platforms:
+            platform_path = self._platform_path(platform)
+            framework_path = os.path.join(platform_path, FRAMEWORK_NAME)
             dsym_path = os.path.join(platform_path, DSYM_NAME)
-            if os.path.exists(dsym_path):
-                command += ['-debug-symbols', dsym_path]
+            library = xcframework.Library(
+                framework_path,
+                platform.xcframework_platform,
+                platform.xcframework_variant,
+                self._architectures(framework_path),
+                dsym_path if dsyms and os.path.exists(dsym_path) else None
+            )
+            libraries.append(library)
+        xcframework.create_xcframework(xcframework_path, libraries)
 
-        self._run(command)
+    def _validate_xcframework(
+        self,
+        xcframework_path: str,
+        platforms: List[Platform],
+        dsyms: bool
+    ):
+        expected = dict(self._library_identifier(platform) for platform in platforms)
+        # dSYMs are only bundled when the slices were built with them.
+        artifacts.validate_xcframework(
+            xcframework_path, 
+            expected, 
+            self.version_number, 
+            dsyms and self.dsyms
+        )
+
+    def _library_identifier(self, platform: Platform) -> Tuple[str, List[str]]:
+        # xcframework library identifier and Mach-O architectures of a platform.
+        library = xcframework.Library(
+            FRAMEWORK_NAME,
+            platform.xcframework_platform,
+            platform.xcframework_variant,
+            [MACHO_ARCHITECTURES[a] for a in platform.architectures]
+        )
+        return (library.identifier, library.architectures)
+
+    def _architectures(self, framework_path: str) -> List[str]:
+        binary_path = os.path.join(framework_path, 'WebRTC')
+        with macho.map_file(binary_path) as buffer:
+            return [s.architecture for s in macho.read_slices(buffer, binary_path)]
+
+    def _cached_license(self, target_lib_paths: dict) -> str:
+        """Returns a dir with the license file of `target_lib_paths`.
+
+        generate_licenses.py runs `gn desc` over the whole dependency graph,
+        but its output only depends on the commit, the gn targets and their
+        gn args, so it is generated once per key and reused by every bundle.
+        """
+        key = self._license_key(target_lib_paths)
+        license_path = os.path.join(self.license_cache_path, key)
+        if os.path.isdir(license_path):
+            logging.info('Reusing cached license file.')
+            return license_path
 
-    def _generate_license(self, target_lib_paths: dict):
         logging.info('Generating license file.')
+        os.makedirs(self.license_cache_path, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=key + '.', dir=self.license_cache_path)
+        try:
+            self._generate_license(tmp_path, target_lib_paths)
+            os.rename(tmp_path, license_path)
+        except OSError:
+            # Generated concurrently by another build.
+            if not os.path.isdir(license_path):
+                raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors = True)
+        return license_path
+
+    def _license_key(self, target_lib_paths: dict) -> str:
+        targets = {}
+        for gn_target_name, lib_paths in target_lib_paths.items():
+            # The dependency set of a target is determined by its gn args,
+            # cc_wrapper does not change it.
+            args = []
+            for lib_path in lib_paths:
+                with open(os.path.join(lib_path, 'args.gn')) as f:
+                    gn_args = _parse_gn_args(f.read())
+                args.append([arg for arg in gn_args if arg[0] != 'cc_wrapper'])
+            targets[gn_target_name] = sorted(args)
+        data = json.dumps({'commit': self._commit, 'targets': targets}, sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _generate_license(self, output_path: str, target_lib_paths: dict):
         for gn_target_name, lib_paths in target_lib_paths.items():
             self._run([
                 sys.executable, 
                 os.path.join(self.run_path, 'tools_webrtc', 'libs', 'generate_licenses.py'), 
                 '--target', 
                 "//sdk:" + gn_target_name, 
-                self.xcframework_path
+                output_path
             ] + lib_paths)
 
+    @cached_property
+    def _environment(self) -> dict:
+        env = dict(os.environ)
+        # Scripts run by the build (e.g. generate_licenses.py) find gn through PATH.
+        if self.depot_tools_path not in env['PATH'].split(os.pathsep):
+            env['PATH'] = self.depot_tools_path + os.pathsep + env['PATH']
+        if self.compiler_cache is not None:
+            # The workspace root holds both src and out.
+            base_dir = os.path.commonpath([self.run_path, os.path.abspath(self.output_path)])
+            env.update(self.compiler_cache.environment(base_dir))
+        return env
+
     def _run(self, cmd: List[str]):
         logging.debug(f"Running: {' '.join(cmd)}")
-        subprocess.check_call(cmd, cwd=self.run_path)
+        with telemetry.span(telemetry.command_name(cmd), 'builder'):
+            subprocess.check_call(cmd, cwd=self.run_path, env=self._environment)
+
+### - FUNCTIONS
+
+def _parse_gn_args(text: str) -> List[Tuple[str, str]]:
+    lines = [line.split('#', 1)[0] for line in text.splitlines()]
+    pattern = r'([A-Za-z_][A-Za-z0-9_]*)\s*=\s*("[^"]*"|\S+)'
+    return sorted(re.findall(pattern, ' '.join(lines)))
@@ -16,10 +16,17 @@
 
 import os
 import sys
+import json
+import time
+import fcntl
+import hashlib
 import logging
 import subprocess
-import requests
-from typing import List
+import concurrent.futures
+from typing import List, Optional
+import telemetry
+from milestones import MilestoneResolver
+from git_cache import DEPOT_TOOLS_URL, WEBRTC_URL, GitCache
 
 ### - CONSTANTS
 
@@ -27,115 +34,330 @@ CWD_PATH = os.path.dirname(os.path.realpath(__file__))
 DEPOT_TOOLS_PATH = os.path.join(CWD_PATH, 'depot_tools')
 WEBRTC_PATH = os.path.join(CWD_PATH, 'src')
 WEBRTC_BUILD_PATH = os.path.join(WEBRTC_PATH, 'build')
-THIRD_PARTY_PATH = os.path.join(WEBRTC_PATH, 'third_party')
-OUTPUT_PATH = os.path.join(CWD_PATH, 'out')
+WORKSPACES_PATH = os.path.join(CWD_PATH, 'workspaces')
+GIT_CACHE_PATH = os.path.join(CWD_PATH, '.cache', 'git')
+# Ignored by git, `release.py` commits the whole repository with `git add .`.
+LOCKS_PATH = os.path.join(CWD_PATH, '.cache', 'locks')
+# depot_tools is only pulled when it was last updated longer ago than this.
+DEPOT_TOOLS_TTL = 24 * 60 * 60
+SYNC_STAMP_NAME = 'webrtc_workspace_sync.json'
+
+CLONE_MODES = ['full', 'shallow', 'blobless']
+TARGET_OS = ['ios', 'mac']
+# Dependencies of WebRTC's DEPS that are not conditioned on `checkout_android`,
+# `checkout_win` or `checkout_linux` but are never used by Apple builds.
+EXCLUDED_DEPS = [
+    'src/third_party/android_build_tools',
+    'src/third_party/android_deps',
+    'src/third_party/android_sdk/public',
+    'src/third_party/android_toolchain',
+    'src/third_party/instrumented_libs',
+    'src/third_party/kotlin_stdlib',
+    'src/third_party/r8',
+]
 
 sys.path.append(WEBRTC_BUILD_PATH)
 
 ### - CLASSES
 
 class WebRTCWorkspace:
+    """A gclient checkout of one WebRTC milestone.
+
+    By default the checkout lives directly in Scripts/. An isolated
+    workspace gets its own `.gclient`, `src` and `out` under
+    Scripts/workspaces/m<milestone>, so several milestones can be synced
+    and built at the same time. depot_tools is shared by all workspaces
+    and isolated workspaces share git objects through a GitCache.
+    """
+
     milestone: str
     branch: str
 
-    def __init__(self, milestone):  
+    def __init__(
+        self,
+        milestone,
+        resolver: Optional[MilestoneResolver] = None,
+        git_cache: Optional[GitCache] = None,
+        minimal_sync: bool = False,
+        clone_mode: str = 'full',
+        isolated: bool = False,
+        depot_tools_path: str = DEPOT_TOOLS_PATH,
+        webrtc_url: str = WEBRTC_URL
+    ):  
         self.milestone = milestone
+        self.resolver = resolver or MilestoneResolver()
+        self.git_cache = git_cache
+        self.minimal_sync = minimal_sync
+        self.clone_mode = clone_mode
+        self.depot_tools_path = depot_tools_path
+        self.webrtc_url = webrtc_url
         self._set_branch() 
+        self.root_path = CWD_PATH
+        if isolated:
+            self.root_path = os.path.join(WORKSPACES_PATH, f"m{self.milestone}")
+            if self.git_cache is None:
+                self.git_cache = GitCache(GIT_CACHE_PATH)
 
     @property
     def version_number(self) -> str:
         return f"{self.milestone}.0.{self.branch}"
 
-    @property
-    def depot_tools_path(self) -> str:
-        return DEPOT_TOOLS_PATH
-
     @property
     def webrtc_path(self) -> str:
-        return WEBRTC_PATH
+        return os.path.join(self.root_path, 'src')
 
     @property
     def output_path(self) -> str:
-        return OUTPUT_PATH
+        return os.path.join(self.root_path, 'out')
 
     @property
     def commit(self) -> str:
         cmd = ['git', 'rev-parse', 'HEAD']
-        return subprocess.check_output(cmd, cwd=WEBRTC_PATH).decode("utf-8") 
+        return subprocess.check_output(cmd, cwd=self.webrtc_path).decode("utf-8") 
+
+    @property
+    def _webrtc_build_path(self) -> str:
+        return os.path.join(self.webrtc_path, 'build')
+
+    @property
+    def _third_party_path(self) -> str:
+        return os.path.join(self.webrtc_path, 'third_party')
+
+    @property
+    def _gclient_path(self) -> str:
+        return os.path.join(self.root_path, '.gclient')
+
+    @property
+    def _sync_stamp_path(self) -> str:
+        return os.path.join(self.webrtc_path, '.git', SYNC_STAMP_NAME)
 
     def prepare(self):
         logging.basicConfig()
         logging.getLogger().setLevel(logging.INFO)
-        self._download_depot_tools()
-        self._download_webrtc()
-        self._sync_gclient()
+        os.makedirs(self.root_path, exist_ok=True)
+        with telemetry.span('depot_tools', 'workspace'):
+            self._download_depot_tools()
+        if self._is_synced():
+            logging.info(f"WebRTC branch-heads/{self.branch} is already synced.")
+            return
+        with telemetry.span('download webrtc', 'workspace', branch=self.branch):
+            self._download_webrtc()
+        with telemetry.span('gclient sync', 'workspace'):
+            self._sync_gclient()
+        self._write_sync_stamp()
+
+    def resume(self, commit: str) -> bool:
+        """Sets up the environment of a checkout synced by an earlier run.
+
+        Unlike `prepare`, the checkout is kept at `commit` even if the
+        branch head moved on since. Returns False if the checkout is no
+        longer fully synced at `commit`.
+        """
+        with telemetry.span('depot_tools', 'workspace'):
+            self._download_depot_tools()
+        stamp = self._read_sync_stamp()
+        if stamp is None or not os.path.isdir(self.webrtc_path):
+            return False
+        return stamp == self._sync_state() and stamp['commit'] == commit
 
     def clean(self):
-        self._git_reset(DEPOT_TOOLS_PATH)
-        self._git_reset(WEBRTC_PATH)
-        self._git_reset(WEBRTC_BUILD_PATH)
-        self._git_reset(THIRD_PARTY_PATH)
+        # Local changes are discarded, but the checkout stays at its synced
+        # revisions so that the next `prepare` can take the fast path.
+        # A minimal checkout and repos synced without history have no
+        # origin/HEAD, only depot_tools is reset to its remote.
+        resets = [
+            (self.depot_tools_path, 'origin'),
+            (self.webrtc_path, 'HEAD'),
+            (self._webrtc_build_path, 'HEAD'),
+            (self._third_party_path, 'HEAD'),
+        ]
+        with concurrent.futures.ThreadPoolExecutor(len(resets)) as executor:
+            futures = [executor.submit(self._git_reset, *reset) for reset in resets]
+            for future in futures:
+                future.result()
 
     def _set_branch(self):
         if self.milestone == 'stable':
-            self.milestone = self._fetch_stable_webrtc_milestone()
-        self.branch = self._fetch_webrtc_branch_name(self.milestone)
-
-    def _fetch_stable_webrtc_milestone(self) -> str:
-        logging.info('Fetching latest stable WebRTC milestone...')
-        releases = requests.get(
-            'https://chromiumdash.appspot.com/fetch_milestones?only_branched=true'
-        ).json()
-        release = next(
-            filter(lambda m: m['schedule_phase'] == 'stable', releases), 
-            releases[0]
-        )
-        return release['milestone']
-
-    def _fetch_webrtc_branch_name(self, milestone: str) -> str:
-        logging.info(f"Fetching WebRTC branch name for m{milestone}...")
-        releases = requests.get(
-            f"https://chromiumdash.appspot.com/fetch_milestones?mstone={milestone}"
-        ).json()
-        return releases[0]['webrtc_branch']
+            self.milestone = self.resolver.stable_milestone()
+        self.branch = self.resolver.branch(self.milestone)
 
     def _download_depot_tools(self):
-        if not os.path.isdir(DEPOT_TOOLS_PATH):
-            logging.info('Cloning depot_tools...')
-            _run([
-                'git', 
-                'clone', 
-                'https://chromium.googlesource.com/chromium/tools/depot_tools.git'
-            ])
-        else:
-            logging.info('Updating depot_tools...')
-            _run(['git', 'pull', 'origin', 'main'], DEPOT_TOOLS_PATH)
-        os.environ['PATH'] = DEPOT_TOOLS_PATH + os.pathsep + os.environ['PATH']
+        # depot_tools is shared, so concurrent workspaces (also in other
+        # processes) take turns updating it.
+        os.makedirs(LOCKS_PATH, exist_ok=True)
+        lock_path = os.path.join(LOCKS_PATH, os.path.basename(self.depot_tools_path) + '.lock')
+        with open(lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.isdir(self.depot_tools_path):
+                logging.info('Cloning depot_tools...')
+                if self.git_cache is not None:
+                    self.git_cache.clone(DEPOT_TOOLS_URL, self.depot_tools_path)
+                else:
+                    self._run(['git', 'clone', DEPOT_TOOLS_URL])
+            elif _age(os.path.join(self.depot_tools_path, '.git', 'FETCH_HEAD')) > DEPOT_TOOLS_TTL:
+                logging.info('Updating depot_tools...')
+                self._run(['git', 'pull', 'origin', 'main'], self.depot_tools_path)
 
     def _download_webrtc(self):
+        if self.minimal_sync:
+            self._download_webrtc_branch()
+            return
         branch = f"branch-heads/{self.branch}"
         logging.info(f"Fetching WebRTC branch name {branch}...")
-        if not os.path.isdir(WEBRTC_PATH):
-            _run(['fetch', '--nohooks', 'webrtc_ios'])
-        _run(['git', 'fetch', '--all'], WEBRTC_PATH)
-        _run(['git', 'checkout', branch], WEBRTC_PATH)
-        _run(['git', 'pull', 'origin', branch], WEBRTC_PATH)
+        if not os.path.isdir(self.webrtc_path) and self.root_path == CWD_PATH:
+            self._run(['fetch', '--nohooks', 'webrtc_ios'], self.root_path)
+        elif not os.path.isdir(self.webrtc_path):
+            # `fetch` refuses to run inside the checkout in Scripts/, so an
+            # isolated workspace is set up like `fetch webrtc_ios` would.
+            self.git_cache.clone(self.webrtc_url, self.webrtc_path)
+            self._write_gclient_config()
+        if self.git_cache is not None:
+            self.git_cache.borrow(self.webrtc_path, self.webrtc_url)
+        self._run(['git', 'fetch', '--all'], self.webrtc_path)
+        # `--all` only fetches branch heads if `fetch` configured them, a
+        # workspace cloned from the mirror only has refs/heads/*.
+        self._run(
+            ['git', 'fetch', 'origin', f"+refs/{branch}:refs/remotes/{branch}"],
+            self.webrtc_path
+        )
+        self._run(['git', 'checkout', branch], self.webrtc_path)
+        self._run(['git', 'pull', 'origin', branch], self.webrtc_path)
         # Antivirus software could detect one of the files 
         # in "src/third_party" folder as a virus and delete it. 
         # Commit the change because otherwise "gclient sync" would fail.
-        _run(['git', 'add', '.'], THIRD_PARTY_PATH)
+        # A new isolated workspace has no third_party before its first sync.
+        if not os.path.isdir(self._third_party_path):
+            return
+        self._run(['git', 'add', '.'], self._third_party_path)
         if os.system('echo "$( git status --porcelain | wc -l )"') == 1:
-            _run(['git', 'commit', '-m', 'Temp local changes'], THIRD_PARTY_PATH)
+            self._run(['git', 'commit', '-m', 'Temp local changes'], self._third_party_path)
+
+    def _download_webrtc_branch(self):
+        # Fetches only refs/branch-heads/<branch> (optionally shallow or
+        # without blobs) instead of every branch head and tag of WebRTC.
+        branch = f"branch-heads/{self.branch}"
+        logging.info(f"Fetching WebRTC {branch} only...")
+        if not os.path.isdir(os.path.join(self.webrtc_path, '.git')):
+            self._run(['git', 'init', '--quiet', self.webrtc_path])
+            self._run(['git', 'remote', 'add', 'origin', self.webrtc_url], self.webrtc_path)
+        if self.git_cache is not None:
+            self.git_cache.borrow(self.webrtc_path, self.webrtc_url)
+        cmd = ['git', 'fetch', '--no-tags', 'origin', f"+refs/{branch}:refs/remotes/{branch}"]
+        if self.clone_mode == 'shallow':
+            cmd.insert(2, '--depth=1')
+        elif self.clone_mode == 'blobless':
+            cmd.insert(2, '--filter=blob:none')
+        self._run(cmd, self.webrtc_path)
+        self._run(['git', 'checkout', '--quiet', '--detach', f"refs/remotes/{branch}"], self.webrtc_path)
+        self._write_gclient_config()
+
+    def _write_gclient_config(self):
+        solution = {
+            'name': 'src',
+            'url': self.webrtc_url,
+            'deps_file': 'DEPS',
+            # src is checked out by the workspace, gclient only syncs its deps.
+            'managed': False,
+            'custom_deps': {},
+            'custom_vars': {},
+        }
+        if self.minimal_sync:
+            solution['custom_deps'] = {dep: None for dep in EXCLUDED_DEPS}
+        with open(self._gclient_path, 'w') as f:
+            f.write(f"solutions = [{solution!r}]\n")
+            f.write(f"target_os = {TARGET_OS!r}\n")
+            if self.minimal_sync:
+                f.write('target_os_only = True\n')
 
     def _sync_gclient(self):
         logging.info('Syncing gclient')
-        _run(['gclient', 'sync', '--with_branch_heads', '--with_tags'])
+        if not self.minimal_sync:
+            self._run(['gclient', 'sync', '--with_branch_heads', '--with_tags'], self.root_path)
+            return
+        cmd = ['gclient', 'sync']
+        if self.clone_mode != 'full':
+            cmd.append('--no-history')
+        self._run(cmd, self.root_path)
+
+    def _is_synced(self) -> bool:
+        # The checkout is up to date when src is at the current commit of
+        # the branch head and gclient was synced at that commit with the
+        # same configuration. Resolving the branch head is a single
+        # `ls-remote` instead of fetching every ref.
+        stamp = self._read_sync_stamp()
+        if stamp is None or stamp != self._sync_state():
+            return False
+        try:
+            remote = self._output(
+                ['git', 'ls-remote', 'origin', f"refs/branch-heads/{self.branch}"],
+                self.webrtc_path
+            )
+        except subprocess.CalledProcessError:
+            return False
+        return remote.split('\t')[0] == stamp['commit']
+
+    def _sync_state(self) -> dict:
+        try:
+            with open(self._gclient_path, 'rb') as f:
+                gclient = hashlib.sha256(f.read()).hexdigest()
+        except FileNotFoundError:
+            gclient = None
+        return {
+            'branch': self.branch,
+            'commit': self._output(['git', 'rev-parse', 'HEAD'], self.webrtc_path),
+            'gclient': gclient,
+            'deps': all(
+                os.path.isdir(path) for path in [self._webrtc_build_path, self._third_party_path]
+            ),
+        }
+
+    def _read_sync_stamp(self) -> Optional[dict]:
+        try:
+            with open(self._sync_stamp_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
 
-    def _git_reset(self, cwd: str):
-        _run(['git', 'reset', '--hard', 'origin'], cwd)
+    def _write_sync_stamp(self):
+        with open(self._sync_stamp_path, 'w') as f:
+            json.dump(self._sync_state(), f, indent=2, sort_keys=True)
+
+    def _git_reset(self, cwd: str, ref: str):
+        if not os.path.isdir(cwd):
+            return
+        self._run(['git', 'reset', '--hard', ref], cwd)
+
+    @property
+    def _environment(self) -> dict:
+        # Passed to every command instead of changing os.environ, which
+        # is shared by the workspaces of concurrent milestones.
+        env = dict(os.environ)
+        if self.git_cache is not None:
+            # gclient (also run by `fetch`) keeps its own mirrors of every
+            # dependency in GIT_CACHE_PATH and clones them with alternates.
+            env.update(self.git_cache.environment())
+        if self.depot_tools_path not in env['PATH'].split(os.pathsep):
+            env['PATH'] = self.depot_tools_path + os.pathsep + env['PATH']
+        return env
+
+    def _run(self, cmd: List[str], cwd: str = CWD_PATH):
+        _run(cmd, cwd, self._environment)
+
+    def _output(self, cmd: List[str], cwd: str) -> str:
+        return _output(cmd, cwd, self._environment)
 
 ### - FUNCTIONS
 
-def _run(cmd: List[str], cwd: str = CWD_PATH):
+def _run(cmd: List[str], cwd: str = CWD_PATH, env: Optional[dict] = None):
     logging.debug(f"Running: {' '.join(cmd)}")
-    subprocess.check_call(cmd, cwd=cwd)
+    with telemetry.span(telemetry.command_name(cmd), 'workspace'):
+        subprocess.check_call(cmd, cwd=cwd, env=env)
+
+def _output(cmd: List[str], cwd: str, env: Optional[dict] = None) -> str:
+    return subprocess.check_output(cmd, cwd=cwd, env=env).decode('utf-8').strip()
+
+def _age(path: str) -> float:
+    try:
+        return time.time() - os.path.getmtime(path)
+    except FileNotFoundError:
+        return float('inf')
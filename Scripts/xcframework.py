@@ -0,0 +1,120 @@
+# Copyright 2022-2023 Pexip AS
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import errno
+import shutil
+import logging
+import plistlib
+from typing import List, Optional
+from dataclasses import dataclass
+from plist_editor import INFO_PLIST_NAME
+
+### - CONSTANTS
+
+DSYMS_DIR_NAME = 'dSYMs'
+
+### - CLASSES
+
+@dataclass
+class Library:
+    framework_path: str
+    platform: str
+    variant: Optional[str]
+    architectures: List[str]
+    dsym_path: Optional[str] = None
+
+    @property
+    def identifier(self) -> str:
+        identifier = f"{self.platform}-{'_'.join(sorted(self.architectures))}"
+        if self.variant is not None:
+            identifier += f"-{self.variant}"
+        return identifier
+
+    @property
+    def binary_path(self) -> str:
+        # Resolves "WebRTC" to "Versions/A/WebRTC" for versioned (macOS) bundles.
+        name = os.path.splitext(os.path.basename(self.framework_path))[0]
+        binary_path = os.path.join(self.framework_path, name)
+        relative_path = os.path.relpath(
+            os.path.realpath(binary_path),
+            os.path.realpath(self.framework_path)
+        )
+        return os.path.join(os.path.basename(self.framework_path), relative_path)
+
+    @property
+    def info(self) -> dict:
+        info = {
+            'BinaryPath': self.binary_path,
+            'LibraryIdentifier': self.identifier,
+            'LibraryPath': os.path.basename(self.framework_path),
+            'SupportedArchitectures': sorted(self.architectures),
+            'SupportedPlatform': self.platform
+        }
+        if self.variant is not None:
+            info['SupportedPlatformVariant'] = self.variant
+        if self.dsym_path is not None:
+            info['DebugSymbolsPath'] = DSYMS_DIR_NAME
+        return info
+
+### - FUNCTIONS
+
+def create_xcframework(output_path: str, libraries: List[Library]):
+    """Assembles an xcframework like `xcodebuild -create-xcframework`.
+
+    Slices are placed with hardlinks instead of being copied. Symlinks
+    inside frameworks are recreated as is.
+    """
+    identifiers = [library.identifier for library in libraries]
+    if len(set(identifiers)) != len(identifiers):
+        raise ValueError(f"Duplicate xcframework libraries: {identifiers}")
+
+    logging.info(f"Creating xcframework at {output_path}.")
+    shutil.rmtree(output_path, ignore_errors=True)
+    os.makedirs(output_path)
+
+    for library in libraries:
+        library_path = os.path.join(output_path, library.identifier)
+        place(
+            library.framework_path,
+            os.path.join(library_path, os.path.basename(library.framework_path))
+        )
+        if library.dsym_path is not None:
+            place(
+                library.dsym_path,
+                os.path.join(library_path, DSYMS_DIR_NAME, os.path.basename(library.dsym_path))
+            )
+
+    info = {
+        'AvailableLibraries': [
+            library.info for library in sorted(libraries, key=lambda l: l.identifier)
+        ],
+        'CFBundlePackageType': 'XFWK',
+        'XCFrameworkFormatVersion': '1.0'
+    }
+    with open(os.path.join(output_path, INFO_PLIST_NAME), 'wb') as f:
+        plistlib.dump(info, f, fmt=plistlib.FMT_XML)
+
+def place(source: str, destination: str):
+    """Hardlinks the bundle at `source` to `destination`."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    shutil.copytree(source, destination, symlinks=True, copy_function=_link)
+
+def _link(source: str, destination: str):
+    try:
+        os.link(source, destination)
+    except OSError as error:
+        if error.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copy2(source, destination)